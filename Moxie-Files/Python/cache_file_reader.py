@@ -0,0 +1,76 @@
+# README: shared helpers for reading the pickled files written by every "CacheBase" sub cache
+
+from typing import Any
+
+import mmap
+import os
+import pickle
+
+# Files at least this big get mapped into memory instead of being read through the file object
+MMAP_THRESHOLD_BYTES = 4 * 1024 * 1024
+
+
+class MappedCacheFile:
+    """
+    Read-only view over a cache file that is opened with mmap, so records can be unpickled
+    straight from the mapped buffer without copying them into a separate bytes object
+    """
+    def __init__(self, filepath: str):
+        self._file = open(filepath, "rb")
+        self._mmap = None
+        self._view = memoryview(b"")
+        # mmap can't map an empty file (i.e. a sub cache without any docs)
+        if os.fstat(self._file.fileno()).st_size > 0:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._view = memoryview(self._mmap)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self) -> int:
+        return len(self._view)
+
+    def read_record(self, offset: int, length: int) -> Any:
+        """
+        Unpickles and returns the single record located at this offset of the file
+        """
+        with self.record_view(offset, length) as record:
+            return pickle.loads(record)
+
+    def record_view(self, offset: int, length: int) -> memoryview:
+        """
+        Returns the still pickled record located at this offset of the file, without copying it
+        The returned view must be released before closing this file
+        """
+        return self._view[offset:offset + length]
+
+    def read_all(self) -> Any:
+        """
+        Unpickles and returns the whole file as a single record
+        """
+        return self.read_record(0, len(self._view))
+
+    def close(self):
+        # Every exported view has to be released before the mmap itself can be closed
+        self._view.release()
+        if self._mmap is not None:
+            self._mmap.close()
+        self._file.close()
+
+
+def load_cache_file(filepath: str) -> Any:
+    """
+    Retrieves, loads and returns the object pickled inside a single cache file
+
+    Small files are unpickled directly from the file object (pickle reads them with a handful of buffered reads),
+    large files are mapped into memory and unpickled from the mapping so their bytes are never copied around
+    """
+    if os.path.getsize(filepath) >= MMAP_THRESHOLD_BYTES:
+        with MappedCacheFile(filepath) as f:
+            return f.read_all()
+
+    with open(filepath, "rb") as f:
+        return pickle.load(f)
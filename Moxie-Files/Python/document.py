@@ -1,11 +1,10 @@
 # README: This file was written by another teammate and is the base file for "module.py"
 
-from typing import Any, Dict, List, Union
-from jinja2 import Environment, FileSystemLoader
+from typing import Any, Dict, Iterable, List, Tuple, Union
 from graphviz import Digraph
 import tempfile
+import tracemalloc
 import logging
-import json
 import os
 
 from .boards.board import Board
@@ -19,10 +18,13 @@ from .objects.elements.templates.template_node import TemplateNode
 from .objects.connections.connection import Connection
 from .objects.connections.move_on_connection import MoveOnConnection
 from .objects.object import Object
+from . import document_header_index
+from . import document_json_cache
 from .utils import compiler_cache
 from .. import globals
 from .. import native
-from ..renderer.filters import DEFINED_FILTERS
+from ..renderer import template_dependency_graph
+from ..renderer import template_environment
 from .logs import log
 
 
@@ -85,6 +87,16 @@ class Document(Object):
     # chat2cs dev..
     document_status: str = _DOC_STATUS_FINALIZED
 
+    # Set only on lazy documents (see from_json's "lazy" keyword) while some of their boards aren't materialized yet:
+    # The JSON of every board not materialized yet (by UUID), the document's file data, the garden_path flag,
+    # The move on connections not filled yet, and the boards materialized while filling another one (analyzed once it's filled)
+    _lazy_state: Union[dict, None] = None
+
+    # Board, node & exclusion lookups, built the first time they're needed, see _get_lookups()
+    # Along with both board lists (and their lengths) as they were when the lookups got built
+    _lookups: Union[dict, None] = None
+    _lookups_key: tuple = None
+
     def __init__(self):
         super().__init__()
         self.name = ""
@@ -110,14 +122,10 @@ class Document(Object):
     def is_excluded(file_path: str) -> bool:
         """
         Static method to check if a FILEPATH (str) should be excluded
+        Reads the flag from the document header index, so the file only gets parsed if it changed since it was last indexed
+        (and then kept parsed for the build that follows, unless it's excluded)
         """
-        file_data: dict = {}
-        with open(file_path, "r") as f:
-            file_data = json.loads(f.read())
-        if Document._EXCLUDE_BOARD_KEY in file_data.keys():
-            return file_data[Document._EXCLUDE_BOARD_KEY]
-        else:
-            return False
+        return document_header_index.get_instance().get_header(file_path, keep_parsed=True).excluded
 
     @classmethod
     def from_file(cls, file_path: str, shallow: bool = False, garden_path: bool = False, **kwargs):
@@ -131,13 +139,34 @@ class Document(Object):
         Returns:
             Document object
         """
-        with open(file_path, "r") as f:
-            file_data: dict = json.loads(f.read())
+        # Opt-in since tracing every allocation slows the whole compile down
+        report_memory = getattr(globals, "REPORT_DOCUMENT_MEMORY", False)
+        if report_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            memory_before = tracemalloc.get_traced_memory()[0]
+
+        # Parsed at most once per run (i.e. when is_excluded indexed a changed file first), shared with every other reader
+        json_cache = document_json_cache.get_instance()
+        file_data: dict = json_cache.load(file_path)
         if file_path not in compiler_cache.get_instance().files:
             compiler_cache.get_instance().files.add(file_path)
         else:
             compiler_cache.get_instance().files.get(file_path).update()
-        return cls.from_json(file_data, file_path, shallow=shallow, garden_path=garden_path, **kwargs)
+        empath_doc = cls.from_json(file_data, file_path, shallow=shallow, garden_path=garden_path, **kwargs)
+
+        # The built document doesn't need the raw JSON anymore (a lazy one keeps its own reference until every board is materialized),
+        # So a run only holds the JSON of the document it's building. Shallow passes keep it for the full pass that usually follows
+        del file_data
+        if not shallow:
+            json_cache.release(file_path)
+
+        if report_memory:
+            peak_bytes = tracemalloc.get_traced_memory()[1] - memory_before
+            json_cache.record_build_memory(file_path, peak_bytes)
+            logging.debug(f"Built '{file_path}' with a peak of {peak_bytes} bytes")
+        return empath_doc
 
     @classmethod
     def from_json(cls, file_data: dict, filename: str = None, shallow: bool = False, garden_path: bool = False, **kwargs):
@@ -151,6 +180,9 @@ class Document(Object):
 
         Keyword Args:
             class_obj: the class object to operate on, when dependencies are required
+            lazy: if True, boards are only built, filled & analyzed the first time they're accessed through get_board(),
+                  get_board_by_name() or materialize_boards() (defaults to globals.LAZY_LOAD_DOCUMENT_BOARDS).
+                  Until then they're missing from "boards". Full-document checks (i.e. connections found on no board) are skipped
 
         Returns:
             Document object
@@ -196,6 +228,9 @@ class Document(Object):
             # Initialize document boards, elements, connections
             logging.debug("Initialize document boards, elements, connections")
             board_data = file_data[cls._BOARDS_KEY]
+            lazy = kwargs.get("lazy", getattr(globals, "LAZY_LOAD_DOCUMENT_BOARDS", False))
+            if lazy:
+                empath_doc._lazy_state = { "boards": {} }
             for board_uuid in board_data.keys():
                 logging.debug(f"board: {board_uuid}")
                 json_data = board_data[board_uuid]
@@ -220,50 +255,34 @@ class Document(Object):
                     empath_doc.excluded_boards.append(excluded_board)
                     continue
 
-                board_class = BoardUtils.get_board_class_from_json(json_data)
-                _board = board_class.from_json(parent_document=empath_doc,
-                                               uuid=board_uuid,
-                                               json_data=json_data)
-
-                # Generically handle different element/template-node types, including name initialization
-                logging.debug("Generically handle different element/template-node types")
-                for element_type_key in cls._ELEMENTS_CLS_DICT.keys():
-                    element_type_data = file_data.get(element_type_key, [])
-                    if element_type_key in board_data[board_uuid].keys():
-                        for element_uuid in board_data[board_uuid][element_type_key]:
-                            logging.debug(f"    * {element_type_key}: {element_uuid}")
-                            elem_class_name = cls._ELEMENTS_CLS_DICT[element_type_key]
-                            elem = elem_class_name()
-                            elem.uuid = element_uuid
-                            elem.board = _board
-
-                            # Make sure to set name now, for other operations may try to generate topic names fairly early
-                            if elem.uuid not in element_type_data:
-                                raise Exception(f"Element uuid '{elem.uuid}' should be found in the document's top-level "
-                                                f"json keys")
-                            
-                            element_json = element_type_data[elem.uuid]
-                            elem.set_node_name(element_json)
-
-                            _board.elements.append(elem)
-
-                # Generically handle different connection types
-                # NOTE: This will miss moveOn connections since they are not serialized at the "board" level
-                # We will add those connections to the board in the outer scope (next section)
-                logging.debug("Generically handle different connection types")
-                for connection_type in cls._CONNECTION_CLS_DICT.keys():
-                    if connection_type not in board_data[board_uuid].keys():
-                        continue
-
-                    for conn_uuid in board_data[board_uuid][connection_type]:
-                        logging.debug(f"    - {connection_type}: {conn_uuid}")
-                        conn = cls._CONNECTION_CLS_DICT[connection_type]()
-                        conn.uuid = conn_uuid
-                        conn.board = _board
-                        _board.connections.append(conn)
+                # Lazy documents only keep the board's JSON around, until the board is first accessed (see materialize_board())
+                if lazy:
+                    empath_doc._lazy_state["boards"][board_uuid] = json_data
+                    continue
 
+                _board = cls._build_board(empath_doc, board_uuid, json_data, file_data)
                 empath_doc.boards.append(_board)
 
+            if lazy:
+                empath_doc._lazy_state["file_data"] = file_data
+                empath_doc._lazy_state["garden_path"] = garden_path
+                empath_doc._lazy_state["materializing"] = 0
+                empath_doc._lazy_state["pending_analysis"] = []
+                # Move on connections aren't serialized at the board level, so they wait for the board holding their nodes
+                empath_doc._lazy_state["move_on_connections"] = { connection_uuid: data for connection_type, connection_class in cls._CONNECTION_CLS_DICT.items()
+                                                                  if connection_class is MoveOnConnection
+                                                                  for connection_uuid, data in file_data.get(connection_type, {}).items() }
+                if not empath_doc._lazy_state["boards"]:
+                    empath_doc._lazy_state = None
+                return empath_doc
+
+            # Document-wide lookups built in one pass, so resolving every element & connection below doesn't scan every board
+            # (The first board holding a UUID wins, same as looping over the boards would)
+            logging.debug("Index every element & connection UUID")
+            element_lookup, connection_lookup = cls._build_uuid_lookups(empath_doc.boards)
+            excluded_e_uuids = set(e for b in empath_doc.excluded_boards for e in b.element_uuids)
+            excluded_c_uuids = set(c for b in empath_doc.excluded_boards for c in b.connection_uuids)
+
             # Setup connections data and relationships
             logging.debug("Set up connections data and relationships")
             for connection_type in cls._CONNECTION_CLS_DICT.keys():
@@ -272,16 +291,11 @@ class Document(Object):
 
                 connection_class = cls._CONNECTION_CLS_DICT[connection_type]
 
-                # Loop through every board to find the connection from UUID
+                # Find the connection from UUID in whichever board holds it
                 connections_data = file_data[connection_type]
                 for connection_uuid in connections_data:
                     # Skip connections in excluded boards
-                    is_excluded = False
-                    for excluded_board in empath_doc.excluded_boards:
-                        if connection_uuid in excluded_board.connection_uuids:
-                            is_excluded = True
-                            break
-                    if is_excluded:
+                    if connection_uuid in excluded_c_uuids:
                         continue
 
                     data = connections_data[connection_uuid]
@@ -297,12 +311,10 @@ class Document(Object):
                         conn.fill_from_json(data, document=empath_doc)
                     else:
                         # Regular connections
-                        for _board in empath_doc.boards:
-                            conn = _board.get_connection(connection_uuid)
-                            if conn is not None:
-                                conn.fill_from_json(data)
-                                conn_found = True
-                                break
+                        if connection_uuid in connection_lookup:
+                            _board, conn = connection_lookup[connection_uuid]
+                            conn.fill_from_json(data)
+                            conn_found = True
 
                     if not conn_found:
                         conn_obj = Object()
@@ -312,7 +324,6 @@ class Document(Object):
 
             # Setup node data for every node-class
             logging.debug(f"Set up node data for every node-class")
-            excluded_e_uuids = set(e for b in empath_doc.excluded_boards for e in b.element_uuids)
             for elem_class_name in cls._ELEMENTS_CLS_DICT.keys():
                 logging.debug(f"    Node class: {elem_class_name}")
                 # node_class = cls._ELEMENTS_CLS_DICT[node_class_name]
@@ -328,11 +339,7 @@ class Document(Object):
                         continue
 
                     # Find element in board
-                    elem = None
-                    for _board in empath_doc.boards:
-                        elem = _board.get_element(element_uuid)
-                        if elem is not None:
-                            break
+                    _board, elem = element_lookup.get(element_uuid, (None, None))
 
                     if elem is None:
                         raise Exception(f"Element '{element_uuid}' not found in any boards (including excluded boards), "
@@ -345,42 +352,135 @@ class Document(Object):
 
             empath_doc.boards.sort(key=(lambda a: a.order))
             for _board in empath_doc.boards:
-                if _board.has_intro():
-                    if not _board.validate_node_names():
-                        raise Exception(f"Node names exception {log.context(_board)}. See above for error.")
+                cls._analyze_board(_board, garden_path)
 
-                    _board.validate_connections()
-                    _board.analyze_topic_clusters()
-                    _board.validate_exits()
+        return empath_doc
 
-                if garden_path == True and _board.garden_path_nodes:
-                    _board.generate_garden_path_script()
+    @classmethod
+    def _build_board(cls, empath_doc, board_uuid: str, json_data: dict, file_data: dict) -> Board:
+        """
+        Creates a (not excluded) board along with its elements & connections, named but not filled from their JSON yet
+        """
+        board_class = BoardUtils.get_board_class_from_json(json_data)
+        _board = board_class.from_json(parent_document=empath_doc,
+                                       uuid=board_uuid,
+                                       json_data=json_data)
+
+        # Generically handle different element/template-node types, including name initialization
+        logging.debug("Generically handle different element/template-node types")
+        for element_type_key in cls._ELEMENTS_CLS_DICT.keys():
+            element_type_data = file_data.get(element_type_key, [])
+            if element_type_key in json_data.keys():
+                for element_uuid in json_data[element_type_key]:
+                    logging.debug(f"    * {element_type_key}: {element_uuid}")
+                    elem_class_name = cls._ELEMENTS_CLS_DICT[element_type_key]
+                    elem = elem_class_name()
+                    elem.uuid = element_uuid
+                    elem.board = _board
+
+                    # Make sure to set name now, for other operations may try to generate topic names fairly early
+                    if elem.uuid not in element_type_data:
+                        raise Exception(f"Element uuid '{elem.uuid}' should be found in the document's top-level "
+                                        f"json keys")
+                    
+                    element_json = element_type_data[elem.uuid]
+                    elem.set_node_name(element_json)
+
+                    _board.elements.append(elem)
+
+        # Generically handle different connection types
+        # NOTE: This will miss moveOn connections since they are not serialized at the "board" level
+        # We will add those connections to the board once every board is built (or once materialized, for lazy documents)
+        logging.debug("Generically handle different connection types")
+        for connection_type in cls._CONNECTION_CLS_DICT.keys():
+            if connection_type not in json_data.keys():
+                continue
 
-        return empath_doc
+            for conn_uuid in json_data[connection_type]:
+                logging.debug(f"    - {connection_type}: {conn_uuid}")
+                conn = cls._CONNECTION_CLS_DICT[connection_type]()
+                conn.uuid = conn_uuid
+                conn.board = _board
+                _board.connections.append(conn)
+
+        return _board
+
+    @staticmethod
+    def _analyze_board(_board: Board, garden_path: bool = False):
+        """
+        Validates a board once all its elements & connections are filled, then analyzes its topic clusters
+        """
+        if _board.has_intro():
+            if not _board.validate_node_names():
+                raise Exception(f"Node names exception {log.context(_board)}. See above for error.")
+
+            _board.validate_connections()
+            _board.analyze_topic_clusters()
+            _board.validate_exits()
+
+        if garden_path == True and _board.garden_path_nodes:
+            _board.generate_garden_path_script()
+
+    @staticmethod
+    def _build_uuid_lookups(boards: List[Board]) -> Tuple[Dict[str, Tuple[Board, Node]], Dict[str, Tuple[Board, Connection]]]:
+        """
+        Maps every element & connection UUID of these boards to its (board, object), keeping the first board holding each UUID
+
+        Returns:
+            The element lookup and the connection lookup
+        """
+        element_lookup = {}
+        connection_lookup = {}
+        for _board in boards:
+            for elem in _board.elements:
+                element_lookup.setdefault(elem.uuid, (_board, elem))
+            for conn in _board.connections:
+                connection_lookup.setdefault(conn.uuid, (_board, conn))
+        return element_lookup, connection_lookup
 
     def is_board_excluded(self, uuid: str) -> bool:
-        for board in self.excluded_boards:
-            if board.uuid == uuid:
-                return True
-        return False
+        return uuid in self._get_lookups()["excluded_board_uuids"]
 
     def is_board_name_excluded(self, name: str) -> bool:
-        for board in self.excluded_boards:
-            if board.name == name:
-                return True
-        return False
+        return name in self._get_lookups()["excluded_boards_by_name"]
 
     def is_connection_excluded(self, uuid: str) -> bool:
-        for board in self.excluded_boards:
-            if uuid in board.connection_uuids:
-                return True
-        return False
+        return uuid in self._get_lookups()["excluded_connection_uuids"]
 
     def is_element_excluded(self, uuid: str) -> bool:
-        for board in self.excluded_boards:
-            if uuid in board.element_uuids:
-                return True
-        return False
+        return uuid in self._get_lookups()["excluded_element_uuids"]
+
+    def _get_lookups(self) -> dict:
+        """
+        Returns the lookups behind get_board(), get_board_by_name(), get_node() and the is_*_excluded() checks,
+        Building them again whenever boards got appended or excluded since they were last built
+        Checking for that only compares the identity & length of both board lists, so every lookup stays O(1)
+        """
+        lookups_key = self._lookups_key
+        if self._lookups is None or lookups_key[0] is not self.boards or lookups_key[1] != len(self.boards) \
+                or lookups_key[2] is not self.excluded_boards or lookups_key[3] != len(self.excluded_boards):
+            # The first board matching a UUID or name wins, same as the scans these lookups replace
+            boards_by_uuid = {}
+            boards_by_name = {}
+            for b in self.boards:
+                boards_by_uuid.setdefault(b.uuid, b)
+                boards_by_name.setdefault(b.name, b)
+            excluded_boards_by_name = {}
+            for b in self.excluded_boards:
+                excluded_boards_by_name.setdefault(b.name, b)
+
+            self._lookups = {
+                "boards_by_uuid": boards_by_uuid,
+                "boards_by_name": boards_by_name,
+                "excluded_boards_by_name": excluded_boards_by_name,
+                "excluded_board_uuids": set(b.uuid for b in self.excluded_boards),
+                "excluded_connection_uuids": set(c for b in self.excluded_boards for c in b.connection_uuids),
+                "excluded_element_uuids": set(e for b in self.excluded_boards for e in b.element_uuids),
+                # Node lookup of each board, built on its first get_node() (keyed by board UUID, along with its element count)
+                "nodes_by_board": {}
+            }
+            self._lookups_key = (self.boards, len(self.boards), self.excluded_boards, len(self.excluded_boards))
+        return self._lookups
 
     def is_module(self):
         return False
@@ -392,19 +492,101 @@ class Document(Object):
     def get_prefix_from_conversation_id(self) -> str:
         return self.conversation_id.split('_')[0]
 
-    def get_board_by_name(self, name: str, include_excluded_boards: bool = False) -> Union[Board, None]:
-        result = None
-        for b in self.boards:
-            if b.name == name:
-                result = b
-                break
+    @property
+    def pending_board_uuids(self) -> List[str]:
+        """
+        UUIDs of the boards of a lazy document that aren't materialized yet
+        """
+        return list(self._lazy_state["boards"]) if self._lazy_state is not None else []
 
-        if include_excluded_boards:
-            for b in self.excluded_boards:
-                if b.name == name:
-                    result = b
-                    break
-        return result
+    def materialize_boards(self, uuids: List[str] = None) -> List[Board]:
+        """
+        Materializes these boards of a lazy document (every board not materialized yet if None), see materialize_board()
+
+        Returns:
+            The boards, skipping the UUIDs of excluded or unknown boards
+        """
+        if uuids is None:
+            uuids = self.pending_board_uuids
+        return [_board for _board in (self.get_board(uuid) for uuid in uuids) if _board is not None]
+
+    def materialize_board(self, uuid: str) -> Union[Board, None]:
+        """
+        Builds a lazy document's board from its JSON, fills its elements & connections, then validates & analyzes it
+        (Boards materialized while filling it are only validated & analyzed along with it, once it's filled)
+
+        Returns:
+            The board, None if it's not waiting to be materialized
+        """
+        lazy_state = self._lazy_state
+        if lazy_state is None or uuid not in lazy_state["boards"]:
+            return None
+        json_data = lazy_state["boards"].pop(uuid)
+        file_data = lazy_state["file_data"]
+        logging.debug(f"Materialize board: {uuid}")
+
+        # Added to the boards right away, so filling cross-board references can look this board up
+        _board = self._build_board(self, uuid, json_data, file_data)
+        board_connections = list(_board.connections)
+        self.boards.append(_board)
+        self.boards.sort(key=(lambda a: a.order))
+
+        # Filling this board may materialize others (i.e. a move on connection's target board), which then get analyzed along with
+        # This one once it's filled, same as from_json analyzes boards once every one of them is filled
+        lazy_state["materializing"] += 1
+        try:
+            # The move on connections referencing one of this board's nodes (i.e. their source node) belong to it
+            element_uuids = set(elem.uuid for elem in _board.elements)
+            move_on_connections = lazy_state["move_on_connections"]
+            for connection_uuid, data in list(move_on_connections.items()):
+                # (Filling one may have materialized other boards, along with their own move on connections)
+                if connection_uuid in move_on_connections and any(isinstance(value, str) and value in element_uuids for value in data.values()):
+                    self._fill_move_on_connection(move_on_connections.pop(connection_uuid), connection_uuid)
+
+            for connection_type, connection_class in self._CONNECTION_CLS_DICT.items():
+                if connection_class is MoveOnConnection:
+                    continue
+                connections_data = file_data.get(connection_type, {})
+                for conn in board_connections:
+                    if conn.uuid in connections_data:
+                        conn.fill_from_json(connections_data[conn.uuid])
+
+            for element_type_key in self._ELEMENTS_CLS_DICT.keys():
+                elements_data = file_data.get(element_type_key, {})
+                for elem in _board.elements:
+                    if elem.uuid in elements_data:
+                        elem.fill_from_json(elements_data[elem.uuid], document=self)
+
+            # Once every board is there, the move on connections left get filled like from_json fills them
+            if not lazy_state["boards"]:
+                for connection_uuid in list(move_on_connections):
+                    self._fill_move_on_connection(move_on_connections.pop(connection_uuid), connection_uuid)
+                self._lazy_state = None
+        finally:
+            lazy_state["materializing"] -= 1
+
+        lazy_state["pending_analysis"].append(_board)
+        if lazy_state["materializing"] == 0:
+            pending_analysis = lazy_state["pending_analysis"]
+            while pending_analysis:
+                self._analyze_board(pending_analysis.pop(0), lazy_state["garden_path"])
+        return _board
+
+    def _fill_move_on_connection(self, data: dict, connection_uuid: str):
+        conn = MoveOnConnection()
+        conn.uuid = connection_uuid
+        conn.fill_from_json(data, document=self)
+
+    def get_board_by_name(self, name: str, include_excluded_boards: bool = False) -> Union[Board, None]:
+        lookups = self._get_lookups()
+        # An excluded board with the same name takes precedence
+        if include_excluded_boards and name in lookups["excluded_boards_by_name"]:
+            return lookups["excluded_boards_by_name"][name]
+        if name not in lookups["boards_by_name"] and self._lazy_state is not None:
+            for uuid, json_data in list(self._lazy_state["boards"].items()):
+                if json_data.get(self._NAME_KEY) == name:
+                    return self.materialize_board(uuid)
+        return lookups["boards_by_name"].get(name)
 
     def get_board(self, uuid: str) -> Union[Board, None]:
         """
@@ -416,28 +598,31 @@ class Document(Object):
         Returns:
             The board if found, otherwise None
         """
-        result = None
-        for b in self.boards:
-            if b.uuid == uuid:
-                result = b
-                break
-        return result
+        if self._lazy_state is not None and uuid in self._lazy_state["boards"]:
+            return self.materialize_board(uuid)
+        return self._get_lookups()["boards_by_uuid"].get(uuid)
 
     def get_node(self, board_uuid: str, node_uuid: str):
-        result = None
         board = self.get_board(board_uuid)
-        if board is not None:
+        if board is None:
+            return None
+
+        # Elements appended to the board since its node lookup was built get it rebuilt
+        nodes_by_board = self._get_lookups()["nodes_by_board"]
+        element_count, nodes_by_uuid = nodes_by_board.get(board_uuid, (None, None))
+        if element_count != len(board.elements):
+            nodes_by_uuid = {}
             for element in board.elements:
-                if element.uuid == node_uuid:
-                    result = element
-                    break
-        return result
+                nodes_by_uuid.setdefault(element.uuid, element)
+            nodes_by_board[board_uuid] = (len(board.elements), nodes_by_uuid)
+        return nodes_by_uuid.get(node_uuid)
 
     def get_dependent_chat_template_info_uuids(self) -> List[str]:
         """
         Returns any chat template info uuids we use.
         """
         template_info_uuids = []
+        self.materialize_boards()
         for board in self.boards:
             for node in board.elements:
                 if not issubclass(node.__class__, TemplateNode):
@@ -446,32 +631,70 @@ class Document(Object):
                     template_info_uuids.append(node.subtype_data.template_uuid)
         return template_info_uuids
 
-    def render(self, **kwargs) -> str:
+    def render(self, board_uuids: List[str] = None, **kwargs) -> str:
         """
         Recursively renders all boards and elements in this document. Returns output string.
+
+        Args:
+            board_uuids: if set, only renders these boards (on a lazy document, the other boards don't even get materialized)
         """
-        output = ""
-        jinja_environment = Environment(loader=FileSystemLoader(
-            globals.JINJA_TEMPLATE_DIR), extensions=['jinja2.ext.do'])
-        # jinja_environment.filters.update(DEFINED_FILTERS)
-        for k,v in DEFINED_FILTERS.items():
-            jinja_environment.globals[k] = v
-        for _board in self.boards:
+        output = "".join(board_output for board_uuid, board_output in self._render_boards(board_uuids, **kwargs))
+
+        self.validate(output)
+
+        return output
+
+    def _render_boards(self, board_uuids: List[str] = None, **kwargs) -> List[Tuple[str, str]]:
+        """
+        Renders these boards (every board if None), recording the templates each one renders with in the dependency graph
+
+        Returns:
+            The UUID & output of every board rendered, in board order
+        """
+        board_outputs = []
+        self.materialize_boards(board_uuids)
+        boards = self.boards if board_uuids is None else [_board for _board in self.boards if _board.uuid in board_uuids]
+        jinja_environment = template_environment.get_environment()
+        # Every template each board renders with goes in the dependency graph & the document's related files, so template edits only recompile
+        # The documents rendering with them
+        dependency_graph = template_dependency_graph.get_instance()
+        if board_uuids is None:
+            dependency_graph.clear_document(self.filepath)
+        rendered_template_names = set()
+        for _board in boards:
             # This is how design stop a board from building
             if not _board.has_intro():
                 log.warn_legacy(f"Skipped board due to lack of Intro node {log.context(_board)}",
                                 log.LegacyType.IMPLICIT_EXCLUDE_BOARD)
                 continue
 
-            output += _board.render(jinja_environment=jinja_environment,
-                                    legacy_document_exit=self.TEMPORARY_LEGACY_EXIT, **kwargs)
+            with template_environment.record_templates(jinja_environment) as template_names:
+                board_outputs.append((_board.uuid, _board.render(jinja_environment=jinja_environment,
+                                                                 legacy_document_exit=self.TEMPORARY_LEGACY_EXIT, **kwargs)))
+            dependency_graph.record_board(self.filepath, _board.uuid, template_names)
+            rendered_template_names.update(template_names)
 
-        self.validate(output)
+        self.add_related_templates(rendered_template_names)
+        return board_outputs
 
-        return output
+    def add_related_templates(self, template_names: Iterable[str]):
+        """
+        Adds these jinja templates to the related files of this document's compiler cache entry, so editing any of them compiles it again
+        """
+        files = compiler_cache.get_instance().files
+        if self.filepath not in files:
+            return
+        cache_file_obj = files.get(self.filepath)
+        for template_name in sorted(template_names):
+            template_path = os.path.join(globals.JINJA_TEMPLATE_DIR, *template_name.split("/"))
+            if os.path.exists(template_path) and template_path not in cache_file_obj.related_files:
+                cache_file_obj.related_files.append(template_path)
+                files.add_related(template_path, cache_file_obj)
 
     def render_and_write(self, out_file: str, **kwargs) -> str:
-        out_str = self.render()
+        # Every board renders again, even when only templates changed since the last compile: rendering a board does more than output
+        # Its text (i.e. it adds its topics to the topic cache, which dropped them when this document's file got compiled again)
+        out_str = self.render(**kwargs)
         directory = os.path.dirname(out_file)
         if not os.path.exists(directory):
             os.makedirs(directory)
@@ -589,6 +812,7 @@ class Document(Object):
             graph.node(name=f"document_info_{info_str}", label=info_str, shape="note")
 
         dot = Digraph(comment=self.name)
+        self.materialize_boards()
 
         doc_string = "DocInfo:"
         doc_string += f"\lName: {self.name}"
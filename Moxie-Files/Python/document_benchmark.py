@@ -0,0 +1,132 @@
+# README: benchmarks for building "document.py" documents from EmPath file data; run with "python -m" from the build scripts root
+
+from functools import partial
+from typing import Callable
+
+import argparse
+import copy
+import json
+import re
+import time
+
+from .document import Document
+from .modules.module import Module
+from .utils import compiler_cache
+
+NUM_BOARDS = 300
+MODULE_FILE_EXTENSION = ".chatModule"
+
+
+def replicate_boards(file_data: dict, num_boards: int = NUM_BOARDS) -> dict:
+    """
+    Returns a copy of an EmPath file's data with its boards (along with their elements & connections) copied over and over
+    Until it holds at least this many boards. Every copy gets new UUIDs and board names so the copies stay apart
+    """
+    uuids = set(file_data[Document._BOARDS_KEY])
+    for json_key in list(Document._ELEMENTS_CLS_DICT) + list(Document._CONNECTION_CLS_DICT):
+        uuids.update(file_data.get(json_key, {}))
+    if not uuids:
+        return copy.deepcopy(file_data)
+
+    # Longest UUIDs first, so a UUID never gets replaced inside a longer one
+    uuid_pattern = re.compile("|".join(re.escape(uuid) for uuid in sorted(uuids, key=len, reverse=True)))
+    source = json.dumps(file_data)
+    replicated_data = copy.deepcopy(file_data)
+    copy_index = 1
+    while len(replicated_data[Document._BOARDS_KEY]) < num_boards:
+        copy_data = json.loads(uuid_pattern.sub(lambda match: f"{match.group(0)}-{copy_index}", source))
+        for board_json in copy_data[Document._BOARDS_KEY].values():
+            if Document._NAME_KEY in board_json:
+                board_json[Document._NAME_KEY] = f"{board_json[Document._NAME_KEY]} {copy_index}"
+        for json_key in [Document._BOARDS_KEY] + list(Document._ELEMENTS_CLS_DICT) + list(Document._CONNECTION_CLS_DICT):
+            if json_key in copy_data:
+                replicated_data.setdefault(json_key, {}).update(copy_data[json_key])
+        copy_index += 1
+    return replicated_data
+
+
+def _legacy_resolve(document: Document, file_data: dict):
+    """
+    The original per-UUID board scans of Document.from_json, kept here only to compare against
+    """
+    for connection_type in Document._CONNECTION_CLS_DICT:
+        for connection_uuid in file_data.get(connection_type, {}):
+            if any(connection_uuid in excluded_board.connection_uuids for excluded_board in document.excluded_boards):
+                continue
+            for _board in document.boards:
+                if _board.get_connection(connection_uuid) is not None:
+                    break
+
+    excluded_e_uuids = set(e for b in document.excluded_boards for e in b.element_uuids)
+    for element_type in Document._ELEMENTS_CLS_DICT:
+        for element_uuid in file_data.get(element_type, {}):
+            if element_uuid in excluded_e_uuids:
+                continue
+            for _board in document.boards:
+                if _board.get_element(element_uuid) is not None:
+                    break
+
+
+def _indexed_resolve(document: Document, file_data: dict):
+    """
+    The document-wide UUID lookups Document.from_json resolves elements & connections with
+    """
+    element_lookup, connection_lookup = Document._build_uuid_lookups(document.boards)
+    excluded_e_uuids = set(e for b in document.excluded_boards for e in b.element_uuids)
+    excluded_c_uuids = set(c for b in document.excluded_boards for c in b.connection_uuids)
+    for connection_type in Document._CONNECTION_CLS_DICT:
+        for connection_uuid in file_data.get(connection_type, {}):
+            if connection_uuid not in excluded_c_uuids:
+                connection_lookup.get(connection_uuid)
+    for element_type in Document._ELEMENTS_CLS_DICT:
+        for element_uuid in file_data.get(element_type, {}):
+            if element_uuid not in excluded_e_uuids:
+                element_lookup.get(element_uuid)
+
+
+def _time_it(func: Callable) -> float:
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def run(file_path: str, num_boards: int = NUM_BOARDS) -> dict:
+    """
+    Builds a document with (at least) this many boards out of an EmPath file's boards, then times building it
+    And resolving its elements & connections both the original way and through the UUID lookups
+
+    Returns:
+        The number of boards and every timing in seconds
+    """
+    with open(file_path, "r") as f:
+        file_data = replicate_boards(json.loads(f.read()), num_boards)
+
+    # Same as Document.from_file, modules look up their compiler cache entry while they're built
+    if file_path not in compiler_cache.get_instance().files:
+        compiler_cache.get_instance().files.add(file_path)
+    document_class = Module if file_path.endswith(MODULE_FILE_EXTENSION) else Document
+
+    results = {}
+    document = None
+
+    def build():
+        nonlocal document
+        document = document_class.from_json(file_data, file_path)
+
+    results["from_json"] = _time_it(build)
+    results["boards"] = len(document.boards) + len(document.excluded_boards)
+    results["legacy_resolve"] = _time_it(partial(_legacy_resolve, document, file_data))
+    results["indexed_resolve"] = _time_it(partial(_indexed_resolve, document, file_data))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark building a document with many boards out of an EmPath file")
+    parser.add_argument("file_path", help="EmPath file (.chatConversation or .chatModule) whose boards get replicated")
+    parser.add_argument("--boards", type=int, default=NUM_BOARDS, help="minimum number of boards in the benchmarked document")
+    args = parser.parse_args()
+
+    results = run(args.file_path, args.boards)
+    print(f"Document with '{results['boards']}' boards built in {results['from_json']:.3f}s")
+    for name in ["legacy_resolve", "indexed_resolve"]:
+        print(f"{name:>16}: {results[name]:.4f}s")
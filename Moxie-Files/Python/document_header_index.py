@@ -0,0 +1,171 @@
+# README: persisted index of the header fields (IDs, name, version, status, exclusion flag & CSV paths) of every EmPath file,
+# so discovery and exclusion checks don't have to parse whole documents that haven't changed since they were last indexed
+
+from typing import Dict, List, Tuple, Union
+
+import atexit
+import logging
+import os
+import pickle
+
+from ... import CACHE_SUB_DIR
+from . import document_json_cache
+
+HEADER_INDEX_FILE_NAME = "DocumentHeaderIndex"
+EMPATH_FILE_EXTENSIONS = (".chatModule", ".chatConversation")
+# Bump whenever DocumentHeader gets new fields, so headers indexed by older builds get parsed again
+HEADER_INDEX_VERSION = 1
+
+# Same keys as "document.py" and "module.py" (not imported from there, since they import this module)
+_EXCLUDE_DOCUMENT_KEY = "excludeDocument"
+_ID_KEY = "conversationID"
+_NAME_KEY = "name"
+_VERSION_KEY = "version"
+_DOC_STATUS_KEY = "documentStatus"
+_MODULE_SETTINGS_KEY = "moduleInfo"
+_MODULE_ID_KEY = "moduleId"
+_MODULE_CSV_RELATIVE_PATHS_KEY = "csvRelativePaths"
+
+_instance = None
+
+
+class DocumentHeader:
+    """
+    The few fields of an EmPath file that discovery and exclusion checks need, without the boards, elements & connections
+    """
+    conversation_id: str
+    module_id: str
+    name: str
+    version: int
+    document_status: Union[str, None]
+    excluded: bool
+    csv_paths: List[str]
+
+    def __init__(self, file_data: dict):
+        module_data = file_data.get(_MODULE_SETTINGS_KEY) or {}
+        self.conversation_id = file_data.get(_ID_KEY, "")
+        self.module_id = module_data.get(_MODULE_ID_KEY, "")
+        self.name = file_data.get(_NAME_KEY, "")
+        self.version = file_data.get(_VERSION_KEY, 0)
+        # Modules keep their status inside their module settings
+        self.document_status = module_data.get(_DOC_STATUS_KEY, file_data.get(_DOC_STATUS_KEY))
+        self.excluded = file_data.get(_EXCLUDE_DOCUMENT_KEY, False)
+        self.csv_paths = list(module_data.get(_MODULE_CSV_RELATIVE_PATHS_KEY, []))
+
+    @property
+    def is_module(self) -> bool:
+        return self.module_id != ""
+
+
+class DocumentHeaderIndex:
+    """
+    Header of every EmPath file indexed so far, keyed by absolute path along with the (mtime, size) it was parsed at
+    A header only gets parsed again once its file's mtime or size changes. Changes get written back to the index file
+    After every headers() call and when the process exits, so the next run starts out with every unchanged header indexed
+    """
+    _index_filepath: str
+    _headers: Dict[str, Tuple[Tuple[int, int], DocumentHeader]]
+    _is_dirty: bool
+    # Headers reused & (re)parsed since this index was loaded
+    _stats: Dict[str, int]
+
+    def __init__(self, index_filepath: str = None):
+        self._index_filepath = index_filepath or os.path.join(CACHE_SUB_DIR, HEADER_INDEX_FILE_NAME)
+        self._headers = {}
+        self._is_dirty = False
+        self._stats = { "reused": 0, "parsed": 0 }
+        if os.path.exists(self._index_filepath):
+            try:
+                with open(self._index_filepath, "rb") as f:
+                    index_file = pickle.load(f)
+                if index_file.get("version") == HEADER_INDEX_VERSION:
+                    self._headers = index_file["headers"]
+            except Exception as e:
+                # The index only saves parsing time, a broken one just gets rebuilt
+                logging.warning(f"Could not read document header index '{self._index_filepath}', rebuilding it: {e}")
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return dict(self._stats)
+
+    def get_header(self, file_path: str, keep_parsed: bool = False) -> DocumentHeader:
+        """
+        Returns the header of an EmPath file, only parsing the file if it changed since it was last indexed
+
+        Args:
+            file_path: EmPath file
+            keep_parsed: if True, the parsed file stays in the parsed file cache for the build that follows (unless the
+                         Document is excluded, since excluded documents never get built). Otherwise it's only kept if it was already
+        """
+        abs_path = os.path.abspath(file_path)
+        stat = os.stat(abs_path)
+        file_state = (stat.st_mtime_ns, stat.st_size)
+        indexed_state, header = self._headers.get(abs_path, (None, None))
+        if indexed_state == file_state:
+            self._stats["reused"] += 1
+            return header
+
+        # Through the parsed file cache, so building the document afterwards doesn't parse the file again
+        json_cache = document_json_cache.get_instance()
+        was_loaded = json_cache.is_loaded(abs_path)
+        header = DocumentHeader(json_cache.load(abs_path))
+        # Nothing releases the parsed data of a document that doesn't get built, so it's not kept for one
+        if not was_loaded and not (keep_parsed and not header.excluded):
+            json_cache.release(abs_path)
+        self._headers[abs_path] = (file_state, header)
+        self._stats["parsed"] += 1
+        self._mark_dirty()
+        return header
+
+    def headers(self, root_dir: str, extensions: Tuple[str, ...] = EMPATH_FILE_EXTENSIONS) -> Dict[str, DocumentHeader]:
+        """
+        Returns the header of every EmPath file (with one of these extensions) under a directory, keyed by absolute path
+        Only new & changed files get parsed, and headers of files that no longer exist are dropped from the index
+
+        Args:
+            root_dir: directory to discover EmPath files in (i.e. the chatscript root)
+            extensions: file extensions to discover
+        """
+        abs_root_dir = os.path.abspath(root_dir)
+        headers = {}
+        for dir_path, dir_names, file_names in os.walk(abs_root_dir):
+            for file_name in sorted(file_names):
+                if file_name.endswith(extensions):
+                    file_path = os.path.join(dir_path, file_name)
+                    headers[file_path] = self.get_header(file_path)
+
+        # Files under this directory that weren't discovered again are gone
+        for abs_path in [abs_path for abs_path in self._headers if abs_path.startswith(abs_root_dir + os.sep) and abs_path not in headers]:
+            del self._headers[abs_path]
+            self._mark_dirty()
+
+        self.write()
+        return headers
+
+    def write(self):
+        """
+        Writes the index back to its file if any header changed since it was loaded or last written
+        """
+        if not self._is_dirty:
+            return
+        os.makedirs(os.path.dirname(self._index_filepath), exist_ok=True)
+        temp_filepath = f"{self._index_filepath}.tmp"
+        with open(temp_filepath, "wb") as f:
+            pickle.dump({ "version": HEADER_INDEX_VERSION, "headers": self._headers }, f, pickle.DEFAULT_PROTOCOL)
+        os.replace(temp_filepath, self._index_filepath)
+        self._is_dirty = False
+
+    def _mark_dirty(self):
+        if not self._is_dirty:
+            self._is_dirty = True
+            atexit.register(self.write)
+
+
+def get_instance() -> DocumentHeaderIndex:
+    """
+    Returns the process-wide document header index (loaded from its index file the first time)
+    """
+    global _instance
+    if _instance is None:
+        _instance = DocumentHeaderIndex()
+    return _instance
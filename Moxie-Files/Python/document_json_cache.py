@@ -0,0 +1,156 @@
+# README: process-wide cache of parsed EmPath files, keyed by path & content hash, so every file gets decoded at most once per run
+# (and with orjson, if it's installed, instead of the stdlib json module)
+
+from typing import Any, Callable, Dict, List, Tuple
+
+import atexit
+import hashlib
+import json
+import logging
+import os
+import time
+
+from .. import globals
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+CONTENT_DIGEST_SIZE = 16
+
+# Every available decoder by name, the fastest one first. Each one takes the raw bytes of a file
+DECODERS: Dict[str, Callable[[bytes], Any]] = {}
+if orjson is not None:
+    DECODERS["orjson"] = orjson.loads
+DECODERS["json"] = json.loads
+
+_instance = None
+
+
+class DocumentJsonCache:
+    """
+    Parsed data of every EmPath file read so far, along with the (mtime, size) & content hash it was parsed at
+    A file only gets read again once its mtime or size changes, and only gets decoded again once its content does
+    The parsed data is shared by every caller, so it must not be modified. It's kept until its document is built (see release()),
+    So a run holds the parsed data of the documents it's building rather than of every document it built
+    """
+    _decoder_name: str
+    _entries: Dict[str, Tuple[Tuple[int, int], bytes, Any]]
+    # Per file: how long its last decode took, its size, which decoder it used, how many times it got decoded/reused
+    # And the peak memory building its document took (only with globals.REPORT_DOCUMENT_MEMORY)
+    _parse_stats: Dict[str, Dict[str, Any]]
+    # Whether the parse stats get logged when the process exits (once a build memory got recorded)
+    _is_reporting: bool
+
+    def __init__(self, decoder_name: str = None):
+        self._entries = {}
+        self._parse_stats = {}
+        self._is_reporting = False
+        self.set_decoder(decoder_name or getattr(globals, "EMPATH_JSON_DECODER", next(iter(DECODERS))))
+
+    @property
+    def decoder_name(self) -> str:
+        return self._decoder_name
+
+    def set_decoder(self, decoder_name: str):
+        """
+        Picks the decoder files get parsed with from now on (files parsed already stay cached)
+
+        Args:
+            decoder_name: one of DECODERS, i.e. "orjson" or "json"
+        """
+        if decoder_name not in DECODERS:
+            raise Exception(f"Unknown or unavailable JSON decoder '{decoder_name}', must be one of: {list(DECODERS)}")
+        self._decoder_name = decoder_name
+
+    def load(self, file_path: str) -> Any:
+        """
+        Returns the parsed data of a JSON file, only decoding it if its content changed since it was last parsed
+        """
+        abs_path = os.path.abspath(file_path)
+        stat = os.stat(abs_path)
+        file_state = (stat.st_mtime_ns, stat.st_size)
+        cached_state, cached_digest, cached_data = self._entries.get(abs_path, (None, None, None))
+        if cached_state == file_state:
+            self._parse_stats[abs_path]["reused"] += 1
+            return cached_data
+
+        with open(abs_path, "rb") as f:
+            raw_data = f.read()
+        digest = hashlib.blake2b(raw_data, digest_size=CONTENT_DIGEST_SIZE).digest()
+        # Touched but unchanged, the parsed data still holds
+        if digest == cached_digest:
+            self._entries[abs_path] = (file_state, digest, cached_data)
+            self._parse_stats[abs_path]["reused"] += 1
+            return cached_data
+
+        data, decoder_name, parse_seconds = self._decode(raw_data, abs_path)
+        self._entries[abs_path] = (file_state, digest, data)
+        stats = self._parse_stats.setdefault(abs_path, { "parses": 0, "reused": 0 })
+        stats.update({ "seconds": parse_seconds, "bytes": len(raw_data), "decoder": decoder_name })
+        stats["parses"] += 1
+        logging.debug(f"Parsed '{abs_path}' ({len(raw_data)} bytes) with '{decoder_name}' in {parse_seconds:.4f}s")
+        return data
+
+    def _decode(self, raw_data: bytes, abs_path: str) -> Tuple[Any, str, float]:
+        parse_start = time.perf_counter()
+        try:
+            return DECODERS[self._decoder_name](raw_data), self._decoder_name, time.perf_counter() - parse_start
+        except ValueError as e:
+            if self._decoder_name == "json":
+                raise
+            # Faster decoders are stricter (i.e. no NaN, no integers past 64 bits), the stdlib one decides if the file is really broken
+            logging.debug(f"'{self._decoder_name}' could not decode '{abs_path}', falling back to 'json': {e}")
+            parse_start = time.perf_counter()
+            return json.loads(raw_data), "json", time.perf_counter() - parse_start
+
+    def is_loaded(self, file_path: str) -> bool:
+        """
+        Returns whether the parsed data of a file is cached (whether or not the file changed since)
+        """
+        return os.path.abspath(file_path) in self._entries
+
+    def release(self, file_path: str):
+        """
+        Drops the parsed data of a file once its document is built, loading it again parses it again
+        """
+        self._entries.pop(os.path.abspath(file_path), None)
+
+    def record_build_memory(self, file_path: str, peak_bytes: int):
+        stats = self._parse_stats.setdefault(os.path.abspath(file_path), { "parses": 0, "reused": 0, "seconds": 0.0 })
+        stats["build_peak_bytes"] = peak_bytes
+        # Recorded for globals.REPORT_DOCUMENT_MEMORY, reported along with the parse times once the run is over
+        if not self._is_reporting:
+            self._is_reporting = True
+            atexit.register(self.log_parse_times)
+
+    def parse_times(self) -> List[Dict[str, Any]]:
+        """
+        Returns the parse stats of every file parsed so far, the slowest to parse first
+        """
+        return sorted(({ "file": abs_path, **stats } for abs_path, stats in self._parse_stats.items()),
+                      key=lambda stats: stats["seconds"], reverse=True)
+
+    def log_parse_times(self, top_count: int = 10):
+        parse_times = self.parse_times()
+        total_seconds = sum(stats["seconds"] for stats in parse_times)
+        reused = sum(stats["reused"] for stats in parse_times)
+        logging.info(f"Parsed '{len(parse_times)}' EmPath files with '{self._decoder_name}' in {total_seconds:.3f}s, reused parsed data '{reused}' times")
+        for stats in parse_times[:top_count]:
+            peak_memory = f"  {stats['build_peak_bytes']} bytes peak to build" if "build_peak_bytes" in stats else ""
+            logging.info(f"    {stats['seconds']:.4f}s  {stats.get('bytes', 0)} bytes{peak_memory}  '{stats['file']}'")
+
+    def clear(self):
+        self._entries = {}
+        self._parse_stats = {}
+
+
+def get_instance() -> DocumentJsonCache:
+    """
+    Returns the process-wide parsed EmPath file cache
+    """
+    global _instance
+    if _instance is None:
+        _instance = DocumentJsonCache()
+    return _instance
@@ -8,7 +8,6 @@ import csv
 import inspect
 import logging
 
-from jinja2 import Environment, FileSystemLoader
 from typing import List, Tuple, Any
 import os
 
@@ -27,7 +26,8 @@ from ..utils import compiler_cache
 from ...empath import document
 from ...empath.boards import board
 from ...empath.utils import utils
-from ...renderer.filters import DEFINED_FILTERS
+from ...renderer import template_dependency_graph
+from ...renderer import template_environment
 from ... import globals
 from .... import EMPATH_PATTERNS_DIR
 
@@ -426,9 +426,12 @@ class Module(document.Document):
             if not os.path.exists(os.path.join(globals.JINJA_TEMPLATE_DIR, empath_mod.module_template_name)):
                 raise FileNotFoundError(f"Module template file not found file://{os.path.join(globals.JINJA_TEMPLATE_DIR, empath_mod.module_template_name)}")
             if not shallow:
-                cache_file_obj = compiler_cache.get_instance().files.get(filename)
-                if empath_mod.module_template_name not in cache_file_obj.related_files:
-                    cache_file_obj.related_files.append(os.path.join(globals.JINJA_TEMPLATE_DIR, empath_mod.module_template_name))
+                # The module template (along with every template it extends, imports or includes) is related, so editing any of them
+                # Recompiles this module. Node templates become related once rendered (see Document.add_related_templates()),
+                # Without having to materialize every board of a lazy module to find them out here
+                # (Jinja template names always use "/", even where the module template's name got joined with "\\")
+                module_template_name = empath_mod.module_template_name.replace(os.sep, "/")
+                empath_mod.add_related_templates(template_environment.get_dependency_graph().ancestors([module_template_name]))
 
         if cls._MODULE_NAME_KEY in module_data_keys:
             empath_mod.module_name = module_data[cls._MODULE_NAME_KEY]
@@ -675,21 +678,24 @@ class Module(document.Document):
 
     def render(self) -> Tuple[str, str]:
         # Render the module .top files as their own files
-        jinja_environment = Environment(loader=FileSystemLoader(
-            globals.JINJA_TEMPLATE_DIR), extensions=['jinja2.ext.do'])
-        for k,v in DEFINED_FILTERS.items():
-            jinja_environment.globals[k] = v
+        jinja_environment = template_environment.get_environment()
         logging.debug(f"Rendering module '{self.name}' with template {self.module_template_name}")
-        template = jinja_environment.get_template(self.module_template_name)
-        prop_dict = self.__dict__
-        prop_dict[self.TEMPORARY_LEGACY_EXIT_JINJA_KEY] = self.TEMPORARY_LEGACY_EXIT
-        output_controller = template.render(prop_dict)
+        with template_environment.record_templates(jinja_environment) as controller_template_names:
+            template = jinja_environment.get_template(self.module_template_name)
+            prop_dict = self.__dict__
+            prop_dict[self.TEMPORARY_LEGACY_EXIT_JINJA_KEY] = self.TEMPORARY_LEGACY_EXIT
+            output_controller = template.render(prop_dict)
         output_controller = utils.clean_topic_output(output_controller)
 
         # render chat conversation boards
         output_conversation = super().render()
         output_conversation = utils.clean_topic_output(output_conversation)
 
+        # Recorded after the boards, since rendering the whole document starts its dependency graph entry over
+        template_dependency_graph.get_instance().record_board(self.filepath, template_dependency_graph.DOCUMENT_BOARD_UUID,
+                                                              controller_template_names)
+        self.add_related_templates(controller_template_names)
+
         return output_controller, output_conversation
 
     def render_and_write(self,
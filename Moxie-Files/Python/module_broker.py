@@ -260,20 +260,28 @@ class ModuleInfo:
 
         return content_indicies
     
+    @staticmethod
+    def _get_module_topics(module: Module, compiled_topics: List[Any]) -> List[Any]:
+        """
+        Returns only the compiled topics (i.e. topic cache docs) that belong to the given module
+        """
+        # the topic cache's doc list view can look up a file's docs directly instead of walking every doc
+        if hasattr(compiled_topics, "get_by_file"):
+            return compiled_topics.get_by_file(module.filepath)
+        return [compiled_topic for compiled_topic in compiled_topics if compiled_topic.filepath == module.filepath]
+
     @staticmethod
     def _extract_sel_tags(module: Module, compiled_topics: List[Any]) -> List[SelTag]:
         all_sel_tags = []
-        for compiled_topic in compiled_topics:
-            # check each topic in the cache to see if it belongs to the given module
-            if compiled_topic.filepath == module.filepath:
-                for topic_name in compiled_topic.topics:
-                    topic_obj = compiled_topic.topics[topic_name]
-                    # if the current topic has sel tags, retrieve them
-                    if getattr(topic_obj, "sel_tags", []):
-                        all_sel_tags.extend(topic_obj.sel_tags)
-                    # if the current topic has additional flexible sel tags, retrieve them
-                    if getattr(topic_obj, "flex_sel_tags", []):
-                        all_sel_tags.extend(topic_obj.flex_sel_tags)
+        for compiled_topic in ModuleInfo._get_module_topics(module, compiled_topics):
+            for topic_name in compiled_topic.topics:
+                topic_obj = compiled_topic.topics[topic_name]
+                # if the current topic has sel tags, retrieve them
+                if getattr(topic_obj, "sel_tags", []):
+                    all_sel_tags.extend(topic_obj.sel_tags)
+                # if the current topic has additional flexible sel tags, retrieve them
+                if getattr(topic_obj, "flex_sel_tags", []):
+                    all_sel_tags.extend(topic_obj.flex_sel_tags)
 
         return all_sel_tags
 
@@ -284,14 +292,12 @@ class ModuleInfo:
         if hasattr(module, "module_content_tags"):
             all_content_tags.extend(module.module_content_tags)
 
-        for compiled_topic in compiled_topics:
-            # check each topic in the cache to see if it belongs to the given module
-            if compiled_topic.filepath == module.filepath:
-                for topic_name in compiled_topic.topics:
-                    topic_obj = compiled_topic.topics[topic_name]
-                    # if the current topic has content tags, retrieve them
-                    if getattr(topic_obj, "content_tags", []):
-                        all_content_tags.extend(topic_obj.content_tags)
+        for compiled_topic in ModuleInfo._get_module_topics(module, compiled_topics):
+            for topic_name in compiled_topic.topics:
+                topic_obj = compiled_topic.topics[topic_name]
+                # if the current topic has content tags, retrieve them
+                if getattr(topic_obj, "content_tags", []):
+                    all_content_tags.extend(topic_obj.content_tags)
         
         return all_content_tags
 
@@ -303,27 +309,25 @@ class ModuleInfo:
         _FALLBACK_CONTEXT_TYPES = ["SILENT", "LOCAL_ONLY", "FALLBACKS_NO_REMOTE"]
 
         fallback_contexts = []
-        for compiled_topic in compiled_topics:
-            # check each topic in the cache to see if it belongs to the given module
-            if compiled_topic.filepath == module.filepath:
-                for topic_name, topic_obj in compiled_topic.topics.items():
-                    # if the current topic has a fallback context, retrieve it
-                    if getattr(topic_obj, "templated_node_properties", {}):
-                        option: str = topic_obj.templated_node_properties.get("fallbackContextType", "")
-                        text: str = topic_obj.templated_node_properties.get("fallbackContextText", "")
-                        # make sure the fallback type is actually valid (else there's no point in writing it to the file)
-                        # also make sure to include any defaults WITH a local fallback context
-                        if option in _FALLBACK_CONTEXT_TYPES or (option == "DEFAULT" and text):
-                            # make sure to include any other associated topics when assigning fallback contexts
-                            topic_names = getattr(topic_obj, "other_topic_names", [])
-                            topic_names.append(topic_name)
-                            for name in topic_names:
-                                fallback_contexts.append(
-                                    ModuleInfo.FallbackContextInfo(topic_name=name,
-                                                                   fallback_type=option,
-                                                                   fallback_text=text,
-                                                                  )
-                                                        )
+        for compiled_topic in ModuleInfo._get_module_topics(module, compiled_topics):
+            for topic_name, topic_obj in compiled_topic.topics.items():
+                # if the current topic has a fallback context, retrieve it
+                if getattr(topic_obj, "templated_node_properties", {}):
+                    option: str = topic_obj.templated_node_properties.get("fallbackContextType", "")
+                    text: str = topic_obj.templated_node_properties.get("fallbackContextText", "")
+                    # make sure the fallback type is actually valid (else there's no point in writing it to the file)
+                    # also make sure to include any defaults WITH a local fallback context
+                    if option in _FALLBACK_CONTEXT_TYPES or (option == "DEFAULT" and text):
+                        # make sure to include any other associated topics when assigning fallback contexts
+                        topic_names = getattr(topic_obj, "other_topic_names", [])
+                        topic_names.append(topic_name)
+                        for name in topic_names:
+                            fallback_contexts.append(
+                                ModuleInfo.FallbackContextInfo(topic_name=name,
+                                                               fallback_type=option,
+                                                               fallback_text=text,
+                                                              )
+                                                    )
         return fallback_contexts
 
     @property
@@ -0,0 +1,258 @@
+# README: optional store of compiled TopicCache boards, shared between machines & CI jobs through a plain directory (i.e. a NFS or CI cache mount)
+# Boards fetched from the store get unpickled, so only point SHARED_TOPIC_CACHE_DIR at a directory that only trusted builds can write to
+
+from typing import Dict, List, Tuple, Union
+
+import copy
+import hashlib
+import logging
+import os
+import pickle
+import socket
+import sys
+
+from .... import globals
+from . import topic_cache_utils
+from .cache_file_reader import load_cache_file
+from .topic_record_codec import RECORD_ENCODING_VERSION
+
+BOARDS_DIR_NAME = "boards"
+MANIFESTS_DIR_NAME = "manifests"
+# Every manifest remembers the related file sets its source document was published with, most recently published first
+MAX_MANIFEST_ENTRIES = 8
+KEY_DIGEST_SIZE = 16
+MISSING_FILE_DIGEST = b"missing"
+# Every source file of the compiler itself, the default namespace is a hash of their content (see compiler_version())
+COMPILER_PACKAGE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", ".."))
+
+_instances = {}
+_compiler_version = None
+
+
+class SharedTopicStore:
+    """
+    Content-addressed store of the compiled boards of each source document, shared by every machine & CI job pointing at the same directory
+    Boards are keyed by a hash of the source document along with every related file (CSVs, chat files & jinja templates) it got compiled with,
+    So stored boards only get reused when compiling their source document again would give the same boards
+
+    Related files are only known once a source document has been compiled, so each source document also gets a manifest
+    (keyed by a hash of the source document alone) listing the related file sets it was published with
+    Every file is written to a temporary file first and renamed into place, so concurrent publishers never expose a partial file
+    (Concurrent publishers of the same manifest can still drop each other's entry, which only costs a compile later on)
+
+    The store directory is a trust boundary: fetched boards get unpickled, and unpickling runs whatever code a store file tells it to
+    So anyone who can write to the store can run code on every machine fetching from it. Only share it between trusted builds
+    """
+    _store_dir_path = str
+    _namespace = str
+    # Last known state (mtime, size, digest) of every file hashed, so files shared by many source documents only get read once
+    _file_states = Dict[str, Tuple[int, int, bytes]]
+    _stats = Dict[str, int]
+
+    def __init__(self, store_dir_path: str, namespace: str = ""):
+        self._store_dir_path = store_dir_path
+        self._namespace = namespace
+        self._file_states = {}
+        self._stats = { "hits": 0, "misses": 0, "published": 0 }
+
+    @property
+    def store_dir_path(self) -> str:
+        return self._store_dir_path
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """
+        Source documents fetched from the store (hits), not found in it (misses) and published to it
+        """
+        return dict(self._stats)
+
+    @staticmethod
+    def relative_path(abs_path: str) -> str:
+        """
+        Returns a path that's the same on every machine (relative to the chatscript root), or the path as is if it's outside of it
+        """
+        root = os.path.abspath(globals.CHATSCRIPT_ROOT)
+        abs_path = os.path.abspath(abs_path)
+        if os.path.commonpath([root, abs_path]) != root:
+            return abs_path
+        return os.path.relpath(abs_path, root)
+
+    @staticmethod
+    def absolute_path(relative_path: str) -> str:
+        return os.path.join(globals.CHATSCRIPT_ROOT, relative_path)
+
+    def document_key(self, abs_path: str) -> Union[str, None]:
+        """
+        Returns the key of a source document's manifest: a hash of its path (relative to the chatscript root) and content
+        Or None if the source document doesn't exist
+        """
+        file_digest = self._file_digest(abs_path)
+        if file_digest is None:
+            return None
+        key = hashlib.blake2b(digest_size=KEY_DIGEST_SIZE)
+        key.update(self._namespace.encode("utf-8"))
+        key.update(self.relative_path(abs_path).encode("utf-8"))
+        key.update(file_digest)
+        return key.hexdigest()
+
+    def boards_key(self, document_key: str, related_paths: List[str]) -> str:
+        """
+        Returns the key of a source document's boards: a hash of its document key and the content of every related file
+
+        Args:
+            document_key: the source document's key, see document_key()
+            related_paths: paths of every related file, relative to the chatscript root (see relative_path())
+        """
+        key = hashlib.blake2b(digest_size=KEY_DIGEST_SIZE)
+        key.update(document_key.encode("utf-8"))
+        for related_path in related_paths:
+            key.update(related_path.encode("utf-8"))
+            key.update(self._file_digest(self.absolute_path(related_path)) or MISSING_FILE_DIGEST)
+        return key.hexdigest()
+
+    def fetch(self, abs_path: str) -> Union[List, None]:
+        """
+        Returns the docs (boards along with their topics) another machine compiled from this exact source document and related files,
+        Or None if nobody did yet
+        The docs are relocated to this machine's copy of the source document
+        """
+        document_key = self.document_key(abs_path)
+        if document_key is None:
+            return None
+
+        for related_paths in self._read(self._manifest_path(document_key)) or []:
+            docs = self._read(self._boards_path(self.boards_key(document_key, related_paths)))
+            if docs is None:
+                continue
+            for doc in docs:
+                doc.filename = abs_path
+                doc.board_descriptor.filepath = abs_path
+            self._stats["hits"] += 1
+            return docs
+
+        self._stats["misses"] += 1
+        return None
+
+    def publish(self, abs_path: str, related_files: List[str], docs: list):
+        """
+        Stores the docs just compiled from a source document, keyed by its content along with the content of its related files
+
+        Args:
+            abs_path: absolute filepath of the source document
+            related_files: absolute filepaths of every file the source document was compiled with (i.e. its CSVs and jinja templates)
+            docs: every doc compiled from the source document
+        """
+        document_key = self.document_key(abs_path)
+        if document_key is None:
+            return
+
+        related_paths = sorted({self.relative_path(related_file) for related_file in related_files})
+        boards_path = self._boards_path(self.boards_key(document_key, related_paths))
+        # Same key, same boards; whoever published them first already did the work
+        if not os.path.exists(boards_path):
+            shared_docs = []
+            for doc in docs:
+                shared_doc = doc.shallow_copy()
+                shared_doc.topics = dict(doc.topics.items())
+                shared_doc.board_descriptor = copy.copy(doc.board_descriptor)
+                # The path differs between machines, fetch() relocates it
+                shared_doc.filename = shared_doc.board_descriptor.filepath = self.relative_path(abs_path)
+                shared_docs.append(shared_doc)
+            self._write(boards_path, shared_docs)
+
+        manifest_path = self._manifest_path(document_key)
+        manifest = self._read(manifest_path) or []
+        if manifest[:1] != [related_paths]:
+            manifest = [related_paths] + [paths for paths in manifest if paths != related_paths]
+            self._write(manifest_path, manifest[:MAX_MANIFEST_ENTRIES])
+        self._stats["published"] += 1
+
+    def _file_digest(self, abs_path: str) -> Union[bytes, None]:
+        file_state = topic_cache_utils.source_file_state(abs_path, self._file_states.get(abs_path))
+        if file_state is None:
+            self._file_states.pop(abs_path, None)
+            return None
+        self._file_states[abs_path] = file_state
+        return file_state[2]
+
+    def _manifest_path(self, document_key: str) -> str:
+        return os.path.join(self._store_dir_path, MANIFESTS_DIR_NAME, document_key[:2], document_key)
+
+    def _boards_path(self, boards_key: str) -> str:
+        return os.path.join(self._store_dir_path, BOARDS_DIR_NAME, boards_key[:2], boards_key)
+
+    @staticmethod
+    def _read(filepath: str):
+        """
+        Returns the object pickled inside a store file, or None if it doesn't exist or can't be read
+        (A broken file in the shared store only costs a compile, it should never halt one)
+        """
+        try:
+            return load_cache_file(filepath)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logging.warning(f"Could not read shared topic cache file '{filepath}': {e}")
+            return None
+
+    @staticmethod
+    def _write(filepath: str, obj):
+        # The temporary file name is unique to this process, since other machines may be writing the same file at the same time
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        temp_filepath = f"{filepath}.{socket.gethostname()}.{os.getpid()}.tmp"
+        try:
+            with open(temp_filepath, "wb") as f:
+                pickle.dump(obj, f, pickle.DEFAULT_PROTOCOL)
+            os.replace(temp_filepath, filepath)
+        finally:
+            if os.path.exists(temp_filepath):
+                os.remove(temp_filepath)
+
+
+def get_instance(cache_dir_name: str) -> Union[SharedTopicStore, None]:
+    """
+    Returns the shared store of this topic cache directory (i.e. "TopicCache_V3"), or None if SHARED_TOPIC_CACHE_DIR isn't set
+    Builds sharing a store must compile the same way, so the namespace keeps apart builds that don't: SHARED_TOPIC_CACHE_NAMESPACE
+    (i.e. the compiler's commit) if it's set, the compiler's version otherwise (see compiler_version())
+    """
+    shared_cache_dir_path = getattr(globals, "SHARED_TOPIC_CACHE_DIR", None)
+    if not shared_cache_dir_path:
+        return None
+
+    store_dir_path = os.path.join(shared_cache_dir_path, cache_dir_name)
+    if store_dir_path not in _instances:
+        _instances[store_dir_path] = SharedTopicStore(store_dir_path, getattr(globals, "SHARED_TOPIC_CACHE_NAMESPACE", None) or compiler_version())
+    return _instances[store_dir_path]
+
+
+def compiler_version() -> str:
+    """
+    Returns a hash of everything compiled boards depend on besides their source document & related files:
+    The Python version & topic record encoding they get pickled with, and the source of every module of the compiler
+    """
+    global _compiler_version
+    if _compiler_version is None:
+        key = hashlib.blake2b(digest_size=KEY_DIGEST_SIZE)
+        key.update(f"{sys.version_info[0]}.{sys.version_info[1]}/{RECORD_ENCODING_VERSION}".encode("utf-8"))
+        for dir_path, dir_names, file_names in sorted(os.walk(COMPILER_PACKAGE_DIR)):
+            dir_names.sort()
+            for file_name in sorted(file_names):
+                if file_name.endswith(".py"):
+                    file_path = os.path.join(dir_path, file_name)
+                    key.update(os.path.relpath(file_path, COMPILER_PACKAGE_DIR).encode("utf-8"))
+                    with open(file_path, "rb") as f:
+                        key.update(f.read())
+        _compiler_version = key.hexdigest()
+    return _compiler_version
+
+
+def related_files(abs_path: str) -> List[str]:
+    """
+    Returns every file a source document was compiled with, as recorded by the compiler cache (i.e. a module's CSVs and jinja template)
+    """
+    # Imported here since the compiler cache imports the caches themselves
+    from .. import compiler_cache
+    cache_file_obj = compiler_cache.get_instance().files.get(abs_path)
+    if cache_file_obj is None:
+        return []
+    return list(cache_file_obj.related_files)
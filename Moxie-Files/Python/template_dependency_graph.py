@@ -0,0 +1,203 @@
+# README: persisted graph of which jinja templates extend/import/include which, and which boards of which documents rendered
+# with which templates, so a template edit only recompiles the documents with boards that use it (or any template built on top of it)
+
+from typing import Dict, Iterable, List, Set
+
+from jinja2 import Environment, FileSystemLoader, TemplateSyntaxError, meta
+import atexit
+import hashlib
+import json
+import logging
+import os
+
+from ... import CACHE_SUB_DIR
+
+DEPENDENCY_GRAPH_FILE_NAME = "TemplateDependencyGraph.json"
+TEMPLATE_DIGEST_SIZE = 16
+# Board UUID standing for a module's controller template, rendered for the whole module rather than for one of its boards
+DOCUMENT_BOARD_UUID = ""
+
+_instance = None
+
+
+def template_state(template_path: str, known_state: list = None) -> list:
+    """
+    Returns the [mtime, size, source digest] of a template, only reading it if its mtime or size differ from the known state's
+    """
+    stat = os.stat(template_path)
+    if known_state is not None and known_state[:2] == [stat.st_mtime_ns, stat.st_size]:
+        return known_state
+    with open(template_path, "rb") as f:
+        digest = hashlib.blake2b(f.read(), digest_size=TEMPLATE_DIGEST_SIZE).hexdigest()
+    return [stat.st_mtime_ns, stat.st_size, digest]
+
+
+def referenced_templates(template_ast) -> List[str]:
+    """
+    Returns the templates a parsed template extends, imports or includes
+    Dynamic template names (i.e. "{% include name %}") can't be known until rendered, so they're left out (the boards rendering
+    With one still record it, see record_board(), so editing it still affects them)
+    """
+    return [template_name for template_name in meta.find_referenced_templates(template_ast) if template_name is not None]
+
+
+class TemplateDependencyGraph:
+    """
+    Template -> parent templates (every template it extends, imports or includes), kept along with the state of the template
+    It was parsed at, and document -> board -> templates the board rendered with (parents included, since rendering loads them)
+    Written back to its file whenever it changed, when the process exits
+    """
+    _graph_filepath: str
+    # Template name -> { "state": [mtime, size, digest], "parents": [template names] }
+    _templates: Dict[str, dict]
+    # Absolute document path -> board UUID -> template names
+    _documents: Dict[str, Dict[str, List[str]]]
+    _is_dirty: bool
+
+    def __init__(self, graph_filepath: str = None):
+        self._graph_filepath = graph_filepath or os.path.join(CACHE_SUB_DIR, DEPENDENCY_GRAPH_FILE_NAME)
+        self._templates = {}
+        self._documents = {}
+        self._is_dirty = False
+        if os.path.exists(self._graph_filepath):
+            try:
+                with open(self._graph_filepath, "r") as f:
+                    graph_file = json.load(f)
+                self._templates = graph_file["templates"]
+                # Documents deleted since don't render anything anymore
+                self._documents = { doc_path: boards for doc_path, boards in graph_file["documents"].items() if os.path.exists(doc_path) }
+            except (OSError, ValueError, KeyError) as e:
+                logging.warning(f"Could not read template dependency graph '{self._graph_filepath}', rebuilding it: {e}")
+
+    def set_parents(self, template_name: str, state: list, parents: Iterable[str]):
+        """
+        Records the templates a template extends, imports or includes (i.e. right after parsing it to compile it)
+        """
+        entry = { "state": state, "parents": sorted(set(parents)) }
+        if self._templates.get(template_name) != entry:
+            self._templates[template_name] = entry
+            self._mark_dirty()
+
+    def refresh_templates(self, template_dir: str, jinja_environment: Environment):
+        """
+        Parses the templates of a template directory that are new or changed since their parents were last recorded,
+        And drops the templates that no longer exist
+
+        Args:
+            template_dir: the template directory
+            jinja_environment: environment to parse templates with (only its extensions matter)
+        """
+        template_names = FileSystemLoader(template_dir).list_templates()
+        for template_name in template_names:
+            template_path = os.path.join(template_dir, *template_name.split("/"))
+            known_entry = self._templates.get(template_name, {})
+            state = template_state(template_path, known_entry.get("state"))
+            if state == known_entry.get("state"):
+                continue
+
+            parents = []
+            with open(template_path, "r", encoding="utf-8") as f:
+                source = f.read()
+            try:
+                parents = referenced_templates(jinja_environment.parse(source, template_name, template_path))
+            except TemplateSyntaxError as e:
+                logging.debug(f"Could not parse template '{template_name}' for its dependencies: {e}")
+            self.set_parents(template_name, state, parents)
+
+        for template_name in set(self._templates) - set(template_names):
+            del self._templates[template_name]
+            self._mark_dirty()
+
+    def parents(self, template_name: str) -> List[str]:
+        return list(self._templates.get(template_name, {}).get("parents", []))
+
+    def ancestors(self, template_names: Iterable[str]) -> Set[str]:
+        """
+        Returns these templates along with every template they extend, import or include, directly or not
+        """
+        pending = list(template_names)
+        ancestors = set()
+        while pending:
+            template_name = pending.pop()
+            if template_name not in ancestors:
+                ancestors.add(template_name)
+                pending.extend(self.parents(template_name))
+        return ancestors
+
+    def descendants(self, template_names: Iterable[str]) -> Set[str]:
+        """
+        Returns these templates along with every template extending, importing or including them, directly or not
+        """
+        children = {}
+        for template_name, entry in self._templates.items():
+            for parent in entry["parents"]:
+                children.setdefault(parent, []).append(template_name)
+        pending = list(template_names)
+        descendants = set()
+        while pending:
+            template_name = pending.pop()
+            if template_name not in descendants:
+                descendants.add(template_name)
+                pending.extend(children.get(template_name, []))
+        return descendants
+
+    def record_board(self, doc_path: str, board_uuid: str, template_names: Iterable[str]):
+        """
+        Records the templates a board of a document rendered with (DOCUMENT_BOARD_UUID for a module's controller template)
+        """
+        doc_path = os.path.abspath(doc_path)
+        template_names = sorted(set(template_names))
+        if self._documents.get(doc_path, {}).get(board_uuid) != template_names:
+            self._documents.setdefault(doc_path, {})[board_uuid] = template_names
+            self._mark_dirty()
+
+    def clear_document(self, doc_path: str):
+        """
+        Forgets what a document's boards rendered with, before rendering the whole document again (its boards may have changed)
+        """
+        if self._documents.pop(os.path.abspath(doc_path), None) is not None:
+            self._mark_dirty()
+
+    def affected_boards(self, changed_templates: Iterable[str]) -> Dict[str, List[str]]:
+        """
+        Returns the boards to render again once these templates changed: every board that rendered with one of them,
+        Or with a template built on top of one of them
+
+        Returns:
+            The UUIDs of the affected boards (DOCUMENT_BOARD_UUID for a module's controller template) by absolute document path
+        """
+        affected_templates = self.descendants(changed_templates)
+        affected_boards = {}
+        for doc_path, boards in self._documents.items():
+            board_uuids = [board_uuid for board_uuid, template_names in boards.items() if affected_templates.intersection(template_names)]
+            if board_uuids:
+                affected_boards[doc_path] = sorted(board_uuids)
+        return affected_boards
+
+    def write(self):
+        """
+        Writes the graph back to its file if it changed since it was loaded or last written
+        """
+        if not self._is_dirty:
+            return
+        os.makedirs(os.path.dirname(self._graph_filepath), exist_ok=True)
+        temp_filepath = f"{self._graph_filepath}.tmp"
+        with open(temp_filepath, "w") as f:
+            json.dump({ "templates": self._templates, "documents": self._documents }, f, indent=4, sort_keys=True)
+        os.replace(temp_filepath, self._graph_filepath)
+        self._is_dirty = False
+
+    def _mark_dirty(self):
+        if not self._is_dirty:
+            self._is_dirty = True
+            atexit.register(self.write)
+
+
+def get_instance() -> TemplateDependencyGraph:
+    """
+    Returns the process-wide template dependency graph (loaded from its file the first time)
+    """
+    global _instance
+    if _instance is None:
+        _instance = TemplateDependencyGraph()
+    return _instance
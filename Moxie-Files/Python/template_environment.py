@@ -0,0 +1,260 @@
+# README: the one Jinja environment every document & module renders with, loading templates precompiled into Python modules
+# (rebuilt whenever their source changes), so the compiler doesn't parse any template unless it changed since the last build;
+# run with "python -m" from the build scripts root to precompile the template tree as a build step
+
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Set, Tuple
+
+from jinja2 import ChoiceLoader, Environment, FileSystemBytecodeCache, FileSystemLoader, ModuleLoader, TemplateNotFound, TemplateSyntaxError
+import argparse
+import hashlib
+import importlib.util
+import jinja2
+import json
+import logging
+import os
+import shutil
+import tempfile
+
+from . import template_dependency_graph
+from .filters import DEFINED_FILTERS
+from .. import globals
+from ... import CACHE_SUB_DIR
+
+BYTECODE_CACHE_DIR_NAME = "JinjaBytecodeCache"
+COMPILED_TEMPLATES_DIR_NAME = "JinjaCompiledTemplates"
+COMPILED_TEMPLATES_MANIFEST_NAME = "manifest.json"
+TEMPLATE_EXTENSIONS = ['jinja2.ext.do']
+
+# By template directory, in case it changes during a run (i.e. unit tests)
+_environments: Dict[str, Environment] = {}
+
+
+class RecordingEnvironment(Environment):
+    """
+    Environment recording the name of every template loaded while a recording is going, see record_templates()
+    Recorded where every lookup ends up (get_template(), select_template() & get_or_select_template(), so parents loaded
+    Through extends/import/include too, even a list of names or a name only known once rendered), once the template is found
+    """
+    _recordings: List[Set[str]]
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._recordings = []
+
+    def _load_template(self, name, globals):
+        template = super()._load_template(name, globals)
+        for recording in self._recordings:
+            recording.add(template.name if template.name is not None else name)
+        return template
+
+
+class PrecompiledLoader(ModuleLoader):
+    """
+    Loads the modules compile_templates() precompiled, each one only up to date while its template's source is still in the
+    State the manifest recorded it was compiled at. Loading a template whose source changed since (i.e. once the environment
+    Finds it out of date) compiles the stale templates again first
+    Templates without a module (not compiling) aren't found, so the next loader loads them from source
+    """
+    _template_dir: str
+    _compiled_dir: str
+    # Template name -> [mtime, size, source digest] it was compiled at, from the manifest
+    _compiled_templates: Dict[str, list]
+
+    def __init__(self, template_dir: str, compiled_dir: str):
+        super().__init__(compiled_dir)
+        self._template_dir = template_dir
+        self._compiled_dir = compiled_dir
+        self._compiled_templates = load_manifest(compiled_dir).get("templates", {})
+
+    def load(self, environment: Environment, name: str, globals=None):
+        template_path = os.path.join(self._template_dir, *name.split("/"))
+        if not os.path.exists(template_path):
+            raise TemplateNotFound(name)
+        state = self._compiled_templates.get(name)
+        if state is None or template_dependency_graph.template_state(template_path, state) != state:
+            compile_templates(self._template_dir)
+            self._compiled_templates = load_manifest(self._compiled_dir).get("templates", {})
+            state = self._compiled_templates.get(name)
+            if state is None:
+                raise TemplateNotFound(name)
+
+        template = super().load(environment, name, globals)
+        template._uptodate = lambda: os.path.exists(template_path) and template_dependency_graph.template_state(template_path, state) == state
+        return template
+
+
+@contextmanager
+def record_templates(jinja_environment: Environment) -> Iterator[Set[str]]:
+    """
+    Yields the set of every template the environment loads until the end of the "with" block
+    """
+    recording = set()
+    recordings = getattr(jinja_environment, "_recordings", [])
+    recordings.append(recording)
+    try:
+        yield recording
+    finally:
+        recordings.remove(recording)
+
+
+def new_environment(loader) -> Environment:
+    """
+    Returns a new Jinja environment set up the way every template gets rendered (same extensions & DEFINED_FILTERS globals)
+    Templates loaded from source have their bytecode cached in the compiler cache directory
+    """
+    bytecode_cache_dir = os.path.join(CACHE_SUB_DIR, BYTECODE_CACHE_DIR_NAME)
+    os.makedirs(bytecode_cache_dir, exist_ok=True)
+    jinja_environment = RecordingEnvironment(loader=loader, extensions=TEMPLATE_EXTENSIONS,
+                                             bytecode_cache=FileSystemBytecodeCache(bytecode_cache_dir), auto_reload=True)
+    for k,v in DEFINED_FILTERS.items():
+        jinja_environment.globals[k] = v
+    return jinja_environment
+
+
+def compiled_templates_dir_path(template_dir: str) -> str:
+    # One directory per template directory, so they never load each other's modules
+    template_dir_key = hashlib.blake2b(os.path.abspath(template_dir).encode("utf-8"), digest_size=8).hexdigest()
+    return os.path.join(CACHE_SUB_DIR, COMPILED_TEMPLATES_DIR_NAME, template_dir_key)
+
+
+def load_manifest(compiled_dir: str) -> dict:
+    """
+    Returns the manifest of a compiled templates directory (empty if there's none, or it can't be read)
+    """
+    manifest_path = os.path.join(compiled_dir, COMPILED_TEMPLATES_MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        return {}
+    try:
+        with open(manifest_path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logging.warning(f"Could not read compiled templates manifest '{manifest_path}', compiling every template again: {e}")
+        return {}
+
+
+def _write_file(file_path: str, text: str):
+    # Through a temp file of its own, so compilers sharing the directory never read (or replace) each other's half written file
+    with tempfile.NamedTemporaryFile("w", dir=os.path.dirname(file_path), suffix=".tmp", delete=False, encoding="utf-8") as f:
+        f.write(text)
+    os.replace(f.name, file_path)
+
+
+def compile_templates(template_dir: str = None, force: bool = False) -> Tuple[str, Dict[str, int]]:
+    """
+    Compiles every template of a template directory into a Python module ModuleLoader can load
+    Only templates whose source changed since they were last compiled (according to the manifest) get compiled again,
+    And modules of templates that no longer exist get removed. Templates that don't compile get no module, so they're
+    Loaded (and their syntax errors raised) from source when rendered
+
+    Args:
+        template_dir: the template directory (globals.JINJA_TEMPLATE_DIR if None)
+        force: if True, compiles every template again
+
+    Returns:
+        The directory holding the compiled modules, and how many templates got compiled, reused, removed & failed to compile
+    """
+    template_dir = template_dir or globals.JINJA_TEMPLATE_DIR
+    compiled_dir = compiled_templates_dir_path(template_dir)
+    manifest = load_manifest(compiled_dir) if not force else {}
+
+    # Compiled code depends on the Jinja version & the extensions too, not only on the template's source
+    compiler_key = [jinja2.__version__, TEMPLATE_EXTENSIONS]
+    if manifest.get("compiler") != compiler_key:
+        if os.path.isdir(compiled_dir):
+            shutil.rmtree(compiled_dir)
+        manifest = {}
+    os.makedirs(compiled_dir, exist_ok=True)
+
+    source_environment = new_environment(FileSystemLoader(template_dir))
+    dependency_graph = template_dependency_graph.get_instance()
+    compiled_templates = manifest.get("templates", {})
+    failed_templates = manifest.get("failed", {})
+    templates = {}
+    failures = {}
+    stats = { "compiled": 0, "reused": 0, "removed": 0, "failed": 0 }
+    for name in source_environment.list_templates():
+        state = template_dependency_graph.template_state(os.path.join(template_dir, *name.split("/")), compiled_templates.get(name))
+        module_path = os.path.join(compiled_dir, ModuleLoader.get_module_filename(name))
+        if compiled_templates.get(name) == state and os.path.exists(module_path):
+            templates[name] = state
+            stats["reused"] += 1
+            continue
+        # Still doesn't compile, no need to parse it again to find out
+        if failed_templates.get(name) == state:
+            failures[name] = state
+            stats["failed"] += 1
+            continue
+
+        source, filename, _ = source_environment.loader.get_source(source_environment, name)
+        try:
+            # Parsed once, for its code & for the templates it depends on
+            template_ast = source_environment.parse(source, name, filename)
+            code = source_environment.compile(template_ast, name, filename, raw=True, defer_init=True)
+            dependency_graph.set_parents(name, state, template_dependency_graph.referenced_templates(template_ast))
+        except TemplateSyntaxError as e:
+            logging.warning(f"Could not precompile template '{name}', it'll be loaded from source: {e}")
+            if os.path.exists(module_path):
+                os.remove(module_path)
+            failures[name] = state
+            stats["failed"] += 1
+            continue
+        _write_file(module_path, code)
+        # Imports cache a module's bytecode by its mtime (in seconds) & size, which a module compiled again right away may keep
+        bytecode_path = importlib.util.cache_from_source(module_path)
+        if os.path.exists(bytecode_path):
+            os.remove(bytecode_path)
+        templates[name] = state
+        stats["compiled"] += 1
+
+    for name in set(compiled_templates) - set(templates) - set(failures):
+        module_path = os.path.join(compiled_dir, ModuleLoader.get_module_filename(name))
+        if os.path.exists(module_path):
+            os.remove(module_path)
+        stats["removed"] += 1
+
+    _write_file(os.path.join(compiled_dir, COMPILED_TEMPLATES_MANIFEST_NAME),
+                json.dumps({ "compiler": compiler_key, "template_dir": os.path.abspath(template_dir), "templates": templates,
+                             "failed": failures }, indent=4))
+
+    logging.info(f"Precompiled Jinja templates of '{template_dir}': '{stats['compiled']}' compiled, '{stats['reused']}' up to date, "
+                 f"'{stats['removed']}' removed, '{stats['failed']}' failed")
+    return compiled_dir, stats
+
+
+def get_environment() -> Environment:
+    """
+    Returns the process-wide Jinja environment loading templates from globals.JINJA_TEMPLATE_DIR
+    Templates load from the modules compile_templates() precompiled (rebuilding stale ones first, and again whenever a template
+    Changes during the run), so none get parsed unless they changed. Templates without a module (globals.PRECOMPILE_JINJA_TEMPLATES
+    Off, or not compiling) load from source instead: they stay compiled in the environment until their file's mtime changes, while their bytecode is cached
+    On disk by template name & source hash
+    """
+    template_dir = globals.JINJA_TEMPLATE_DIR
+    if template_dir not in _environments:
+        loader = FileSystemLoader(template_dir)
+        if getattr(globals, "PRECOMPILE_JINJA_TEMPLATES", True):
+            compiled_dir, _ = compile_templates(template_dir)
+            loader = ChoiceLoader([PrecompiledLoader(template_dir, compiled_dir), loader])
+        _environments[template_dir] = new_environment(loader)
+        # Templates compile_templates() just parsed are up to date already
+        template_dependency_graph.get_instance().refresh_templates(template_dir, _environments[template_dir])
+    return _environments[template_dir]
+
+
+def get_dependency_graph() -> template_dependency_graph.TemplateDependencyGraph:
+    """
+    Returns the template dependency graph, with the parents of every template of globals.JINJA_TEMPLATE_DIR up to date
+    """
+    get_environment()
+    return template_dependency_graph.get_instance()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompile the Jinja template tree into Python modules the compiler loads instead of parsing templates")
+    parser.add_argument("--template-dir", default=None, help="template directory to precompile (defaults to globals.JINJA_TEMPLATE_DIR)")
+    parser.add_argument("--force", action="store_true", help="compile every template again, even the ones that didn't change")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    compile_templates(args.template_dir, args.force)
@@ -0,0 +1,155 @@
+# README: unit tests making sure EmPath files only get parsed again (whole or just their header) once their content changes
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from .. import document_header_index
+from .. import document_json_cache
+
+
+class TestDocumentCaches(unittest.TestCase):
+    # Tests to validate the parsed file cache & the document header index only parse changed files
+    # 1. Headers get reused until their file changes, also by the next run reading the index file back
+    # 2. Discovering EmPath files only parses new & changed ones, and drops the ones that are gone
+    # 3. Unchanged files reuse their parsed data, touched but unchanged ones too, changed ones get parsed again
+    # 4. Released files get parsed again on their next load
+    # 5. Reading a header doesn't keep its file parsed, unless asked to for a build (and the document isn't excluded)
+    _FILE_DATA: dict = {
+        "name": "test_document_caches",
+        "version": 1,
+        "conversationID": "TDC_test_document_caches",
+        "documentStatus": "inDevelopment",
+        "boards": {}
+    }
+
+    def setUp(self) -> None:
+        self._dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self._dir)
+        self.file_path = os.path.join(self._dir, "test_document_caches.chatConversation")
+        self.write_file(self._FILE_DATA)
+
+        # Every test starts out with nothing parsed
+        self.addCleanup(setattr, document_json_cache, "_instance", document_json_cache._instance)
+        document_json_cache._instance = document_json_cache.DocumentJsonCache()
+        self.json_cache = document_json_cache.get_instance()
+
+    def write_file(self, file_data: dict, file_path: str = None):
+        """
+        Writes the test file, with an mtime past its previous one (file systems with a coarse mtime could keep it the same otherwise)
+        """
+        file_path = file_path or self.file_path
+        mtime_ns = os.stat(file_path).st_mtime_ns if os.path.exists(file_path) else None
+        with open(file_path, "w") as f:
+            f.write(json.dumps(file_data))
+        if mtime_ns is not None:
+            self.touch_file(mtime_ns)
+
+    def touch_file(self, mtime_ns: int = None):
+        """
+        Moves the test file's mtime forward by a second without changing its content
+        """
+        if mtime_ns is None:
+            mtime_ns = os.stat(self.file_path).st_mtime_ns
+        os.utime(self.file_path, ns=(mtime_ns + 1_000_000_000, mtime_ns + 1_000_000_000))
+
+    def parse_stats(self) -> dict:
+        return next(stats for stats in self.json_cache.parse_times() if stats["file"] == os.path.abspath(self.file_path))
+
+    def new_header_index(self) -> document_header_index.DocumentHeaderIndex:
+        """
+        Returns a header index loaded from the test directory's index file, if it was written already
+        """
+        header_index = document_header_index.DocumentHeaderIndex(os.path.join(self._dir, document_header_index.HEADER_INDEX_FILE_NAME))
+        # Written while the test directory still exists, so it's not written there again once the process exits
+        self.addCleanup(header_index.write)
+        return header_index
+
+    def test_header_reused_until_changed(self):
+        header_index = self.new_header_index()
+        header = header_index.get_header(self.file_path)
+        self.assertEqual(header.conversation_id, self._FILE_DATA["conversationID"])
+        self.assertEqual(header.document_status, self._FILE_DATA["documentStatus"])
+        self.assertFalse(header.excluded)
+        self.assertFalse(header.is_module)
+        self.assertIs(header_index.get_header(self.file_path), header)
+        self.assertEqual(header_index.stats, { "reused": 1, "parsed": 1 })
+
+        # The next run reads the unchanged header back from the index file, without parsing the file
+        header_index.write()
+        self.json_cache.clear()
+        header_index = self.new_header_index()
+        self.assertEqual(header_index.get_header(self.file_path).conversation_id, self._FILE_DATA["conversationID"])
+        self.assertEqual(header_index.stats, { "reused": 1, "parsed": 0 })
+        self.assertEqual(self.json_cache.parse_times(), [])
+
+        self.write_file({ **self._FILE_DATA, document_header_index._EXCLUDE_DOCUMENT_KEY: True })
+        self.assertTrue(header_index.get_header(self.file_path).excluded)
+        self.assertEqual(header_index.stats, { "reused": 1, "parsed": 1 })
+
+    def test_headers_discovered(self):
+        module_path = os.path.join(self._dir, "modules", "test_document_caches.chatModule")
+        os.mkdir(os.path.dirname(module_path))
+        self.write_file({ **self._FILE_DATA, "moduleInfo": { "moduleId": "TDC_module" } }, module_path)
+        with open(os.path.join(self._dir, "notes.txt"), "w") as f:
+            f.write("not an EmPath file")
+
+        header_index = self.new_header_index()
+        headers = header_index.headers(self._dir)
+        self.assertEqual(sorted(headers), sorted([os.path.abspath(self.file_path), os.path.abspath(module_path)]))
+        self.assertTrue(headers[os.path.abspath(module_path)].is_module)
+        self.assertFalse(headers[os.path.abspath(self.file_path)].is_module)
+        self.assertEqual(header_index.stats, { "reused": 0, "parsed": 2 })
+        # Discovery never builds the documents it finds, so it doesn't keep them parsed either
+        self.assertFalse(self.json_cache.is_loaded(module_path))
+
+        # The next run only finds the files left, without parsing them again
+        os.remove(module_path)
+        header_index = self.new_header_index()
+        self.assertEqual(list(header_index.headers(self._dir)), [os.path.abspath(self.file_path)])
+        self.assertEqual(header_index.stats, { "reused": 1, "parsed": 0 })
+
+    def test_json_reused_until_changed(self):
+        file_data = self.json_cache.load(self.file_path)
+        self.assertEqual(file_data, self._FILE_DATA)
+        self.assertIs(self.json_cache.load(self.file_path), file_data)
+        self.assertEqual((self.parse_stats()["parses"], self.parse_stats()["reused"]), (1, 1))
+
+        # Touched but unchanged
+        self.touch_file()
+        self.assertIs(self.json_cache.load(self.file_path), file_data)
+        self.assertEqual((self.parse_stats()["parses"], self.parse_stats()["reused"]), (1, 2))
+
+        # Changed
+        self.write_file({ **self._FILE_DATA, "version": 2 })
+        changed_file_data = self.json_cache.load(self.file_path)
+        self.assertEqual(changed_file_data["version"], 2)
+        self.assertEqual((self.parse_stats()["parses"], self.parse_stats()["reused"]), (2, 2))
+
+    def test_json_parsed_again_once_released(self):
+        self.json_cache.load(self.file_path)
+        self.assertTrue(self.json_cache.is_loaded(self.file_path))
+        self.json_cache.release(self.file_path)
+        self.assertFalse(self.json_cache.is_loaded(self.file_path))
+        self.assertEqual(self.json_cache.load(self.file_path), self._FILE_DATA)
+        self.assertEqual(self.parse_stats()["parses"], 2)
+
+    def test_header_parse_kept_for_build(self):
+        header_index = self.new_header_index()
+        header_index.get_header(self.file_path)
+        self.assertFalse(self.json_cache.is_loaded(self.file_path))
+
+        # Kept for the build that follows, so building the document doesn't parse the file again
+        self.write_file({ **self._FILE_DATA, "version": 2 })
+        header_index.get_header(self.file_path, keep_parsed=True)
+        self.assertTrue(self.json_cache.is_loaded(self.file_path))
+        self.assertEqual(self.json_cache.load(self.file_path)["version"], 2)
+        self.assertEqual((self.parse_stats()["parses"], self.parse_stats()["reused"]), (2, 1))
+
+        # Excluded documents never get built, so nothing would release them
+        self.json_cache.release(self.file_path)
+        self.write_file({ **self._FILE_DATA, document_header_index._EXCLUDE_DOCUMENT_KEY: True })
+        self.assertTrue(header_index.get_header(self.file_path, keep_parsed=True).excluded)
+        self.assertFalse(self.json_cache.is_loaded(self.file_path))
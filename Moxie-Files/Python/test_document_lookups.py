@@ -0,0 +1,95 @@
+# README: unit tests making sure the UUID & name lookups of EmPath documents find what scanning their boards would have found
+
+import os
+import unittest
+
+from ..document import Document
+from ..utils import compiler_cache
+
+
+class TestDocumentLookups(unittest.TestCase):
+    # Tests to validate document lookups match a scan of the document's boards, and keep up with boards getting added or excluded
+    # 1. The UUID lookups from_json() resolves connections with keep the first board holding each UUID
+    # 2. get_board(), get_board_by_name() and get_node() find the first board & node matching, like a scan
+    # 3. Boards moved to the excluded boards show up in the is_*_excluded() checks right away
+    # 4. Lazily loaded documents find the same boards & nodes, materializing them on lookup
+    _DIR = os.path.dirname(__file__)
+    _CONVERSATION_FILE_PATH: str = os.path.join(_DIR, "test_module_broker", "test_chat_conversation_1.chatConversation")
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls._COMPILER_BACKUP_PATH = compiler_cache.backup(remove=True)
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        compiler_cache.get_instance().clear()
+        compiler_cache.restore(cls._COMPILER_BACKUP_PATH, remove=True)
+
+    def setUp(self) -> None:
+        self.empath_doc = Document.from_file(self._CONVERSATION_FILE_PATH, lazy=False)
+        self.assertGreater(len(self.empath_doc.boards), 1, msg="Expected the test file to have more than one board")
+
+    def assert_lookups_match_scan(self, empath_doc: Document, boards: list):
+        """
+        Validates every board & node of these boards is found the way scanning the document's boards finds it
+        """
+        for b in boards:
+            self.assertIs(empath_doc.get_board(b.uuid), next(scanned for scanned in empath_doc.boards if scanned.uuid == b.uuid))
+            self.assertIs(empath_doc.get_board_by_name(b.name), next(scanned for scanned in empath_doc.boards if scanned.name == b.name))
+            for elem in b.elements:
+                self.assertIs(empath_doc.get_node(b.uuid, elem.uuid), next(scanned for scanned in b.elements if scanned.uuid == elem.uuid))
+
+    def test_uuid_lookups_keep_first_board(self):
+        boards = self.empath_doc.boards
+        element_lookup, connection_lookup = Document._build_uuid_lookups(boards)
+        self.assertEqual(set(element_lookup), set(elem.uuid for b in boards for elem in b.elements))
+        self.assertEqual(set(connection_lookup), set(conn.uuid for b in boards for conn in b.connections))
+        for uuid, (b, elem) in element_lookup.items():
+            self.assertIs(b, next(scanned for scanned in boards if any(e.uuid == uuid for e in scanned.elements)))
+            self.assertIs(elem, next(e for e in b.elements if e.uuid == uuid))
+        for uuid, (b, conn) in connection_lookup.items():
+            self.assertIs(b, next(scanned for scanned in boards if any(c.uuid == uuid for c in scanned.connections)))
+            self.assertIs(conn, next(c for c in b.connections if c.uuid == uuid))
+
+    def test_lookups_match_scan(self):
+        self.assert_lookups_match_scan(self.empath_doc, self.empath_doc.boards)
+
+        # Unknown UUIDs & names aren't found
+        b, elem = next((b, elem) for b in self.empath_doc.boards for elem in b.elements)
+        self.assertIsNone(self.empath_doc.get_board("unknown_board_uuid"))
+        self.assertIsNone(self.empath_doc.get_board_by_name("unknown board name"))
+        self.assertIsNone(self.empath_doc.get_node(b.uuid, "unknown_node_uuid"))
+        self.assertIsNone(self.empath_doc.get_node("unknown_board_uuid", elem.uuid))
+
+    def test_excluded_lookups_rebuilt(self):
+        b = self.empath_doc.boards[-1]
+        self.assertFalse(self.empath_doc.is_board_excluded(b.uuid))
+        self.assertFalse(self.empath_doc.is_board_name_excluded(b.name))
+
+        # Excluding a board after the lookups got built gets them built again
+        self.empath_doc.excluded_boards.append(self.empath_doc.boards.pop())
+        self.assertTrue(self.empath_doc.is_board_excluded(b.uuid))
+        self.assertTrue(self.empath_doc.is_board_name_excluded(b.name))
+        for element_uuid in b.element_uuids:
+            self.assertTrue(self.empath_doc.is_element_excluded(element_uuid))
+        for connection_uuid in b.connection_uuids:
+            self.assertTrue(self.empath_doc.is_connection_excluded(connection_uuid))
+        self.assertIsNone(self.empath_doc.get_board(b.uuid))
+        self.assertIs(self.empath_doc.get_board_by_name(b.name, include_excluded_boards=True), b)
+        self.assertFalse(self.empath_doc.is_board_excluded(self.empath_doc.boards[0].uuid))
+
+    def test_lazy_lookups_materialize(self):
+        lazy_doc = Document.from_file(self._CONVERSATION_FILE_PATH, lazy=True)
+        self.assertEqual(sorted(lazy_doc.pending_board_uuids), sorted(b.uuid for b in self.empath_doc.boards))
+
+        b = self.empath_doc.boards[-1]
+        lazy_board = lazy_doc.get_board(b.uuid)
+        self.assertEqual(lazy_board.name, b.name)
+        self.assertNotIn(b.uuid, lazy_doc.pending_board_uuids)
+        self.assertEqual([elem.uuid for elem in lazy_board.elements], [elem.uuid for elem in b.elements])
+        self.assertIs(lazy_doc.get_board(b.uuid), lazy_board)
+
+        lazy_doc.materialize_boards()
+        self.assertEqual(lazy_doc.pending_board_uuids, [])
+        self.assertEqual([b.uuid for b in lazy_doc.boards], [b.uuid for b in self.empath_doc.boards])
+        self.assert_lookups_match_scan(lazy_doc, lazy_doc.boards)
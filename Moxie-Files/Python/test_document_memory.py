@@ -0,0 +1,144 @@
+# README: unit tests making sure building EmPath documents one after another doesn't hold on to the JSON of every document built
+
+from typing import Tuple
+
+import gc
+import json
+import os
+import shutil
+import tempfile
+import tracemalloc
+import unittest
+
+from ..document import Document
+from ..document_benchmark import replicate_boards
+from .. import document_header_index
+from .. import document_json_cache
+from ..utils import compiler_cache
+
+
+class TestDocumentMemory(unittest.TestCase):
+    # Tests to validate a run's memory is bounded by its largest document, not by its whole corpus
+    # 1. Parsed JSON is released from the parsed file cache once its document is built
+    # 2. Peak memory stays flat whether a run builds a few documents or many of them
+    # 3. Exclusion checks don't keep the JSON of excluded documents, which never get built (so never released)
+    _DIR = os.path.dirname(__file__)
+    _CONVERSATION_FILE_PATH: str = os.path.join(_DIR, "test_module_broker", "test_chat_conversation_1.chatConversation")
+    _NUM_BOARDS: int = 40
+    _FEW_DOCUMENTS: int = 4
+    _MANY_DOCUMENTS: int = 32
+    # How much higher the peak of many documents may get than the peak of a few (i.e. compiler cache entries of every file)
+    _PEAK_TOLERANCE: float = 1.25
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls._COMPILER_BACKUP_PATH = compiler_cache.backup(remove=True)
+        cls._CORPUS_DIR = tempfile.mkdtemp()
+
+        # Every document of the corpus is as big as every other one, so the largest one is any of them
+        with open(cls._CONVERSATION_FILE_PATH, "r") as f:
+            file_data = replicate_boards(json.loads(f.read()), cls._NUM_BOARDS)
+        cls._CORPUS_FILE_PATHS = []
+        for i in range(cls._MANY_DOCUMENTS):
+            corpus_file_path = os.path.join(cls._CORPUS_DIR, f"test_document_memory_{i}.chatConversation")
+            with open(corpus_file_path, "w") as f:
+                f.write(json.dumps(file_data))
+            cls._CORPUS_FILE_PATHS.append(corpus_file_path)
+
+        file_data[document_header_index._EXCLUDE_DOCUMENT_KEY] = True
+        cls._EXCLUDED_FILE_PATHS = []
+        for i in range(cls._MANY_DOCUMENTS):
+            excluded_file_path = os.path.join(cls._CORPUS_DIR, f"test_document_memory_excluded_{i}.chatConversation")
+            with open(excluded_file_path, "w") as f:
+                f.write(json.dumps(file_data))
+            cls._EXCLUDED_FILE_PATHS.append(excluded_file_path)
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        compiler_cache.get_instance().clear()
+        compiler_cache.restore(cls._COMPILER_BACKUP_PATH, remove=True)
+        shutil.rmtree(cls._CORPUS_DIR)
+
+    def setUp(self) -> None:
+        document_json_cache.get_instance().clear()
+
+    def build_corpus(self, num_documents: int) -> int:
+        """
+        Builds this many documents of the corpus one after another, the way a compile does, and returns the peak traced memory
+        """
+        gc.collect()
+        tracemalloc.start()
+        try:
+            for corpus_file_path in self._CORPUS_FILE_PATHS[:num_documents]:
+                empath_doc = Document.from_file(corpus_file_path)
+                self.assertGreaterEqual(len(empath_doc.boards) + len(empath_doc.excluded_boards), self._NUM_BOARDS)
+                # Boards & elements reference each other, collecting them right away keeps cycles waiting on the GC out of the peak
+                del empath_doc
+                gc.collect()
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    def use_header_index(self):
+        """
+        Checks exclusion against a new header index until the end of the test, so every header gets parsed again
+        """
+        header_index = document_header_index.DocumentHeaderIndex(os.path.join(self._CORPUS_DIR, document_header_index.HEADER_INDEX_FILE_NAME))
+        self.addCleanup(setattr, document_header_index, "_instance", document_header_index._instance)
+        # Written while the corpus directory still exists, so it's not written there again once the process exits
+        self.addCleanup(header_index.write)
+        document_header_index._instance = header_index
+
+    def check_excluded(self, num_documents: int) -> Tuple[int, int]:
+        """
+        Checks whether this many excluded documents of the corpus are excluded, and returns the traced memory still held
+        Afterwards along with the peak traced memory
+        """
+        gc.collect()
+        tracemalloc.start()
+        try:
+            for excluded_file_path in self._EXCLUDED_FILE_PATHS[:num_documents]:
+                self.assertTrue(Document.is_excluded(excluded_file_path))
+            return tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+    def test_json_released(self):
+        json_cache = document_json_cache.get_instance()
+        Document.from_file(self._CORPUS_FILE_PATHS[0], shallow=True)
+        self.assertIn(os.path.abspath(self._CORPUS_FILE_PATHS[0]), json_cache._entries)
+
+        # The full pass reuses what the shallow pass parsed, then releases it
+        Document.from_file(self._CORPUS_FILE_PATHS[0])
+        self.assertNotIn(os.path.abspath(self._CORPUS_FILE_PATHS[0]), json_cache._entries)
+        self.assertEqual(json_cache.parse_times()[0]["parses"], 1)
+        self.assertEqual(json_cache.parse_times()[0]["reused"], 1)
+
+    def test_peak_memory_bounded(self):
+        few_documents_peak = self.build_corpus(self._FEW_DOCUMENTS)
+        document_json_cache.get_instance().clear()
+        many_documents_peak = self.build_corpus(self._MANY_DOCUMENTS)
+        self.assertLess(many_documents_peak, few_documents_peak * self._PEAK_TOLERANCE,
+                        f"Building {self._MANY_DOCUMENTS} documents peaked at {many_documents_peak} bytes, "
+                        f"{self._FEW_DOCUMENTS} documents peaked at {few_documents_peak} bytes")
+
+    def test_excluded_json_released(self):
+        self.use_header_index()
+        json_cache = document_json_cache.get_instance()
+        self.assertTrue(Document.is_excluded(self._EXCLUDED_FILE_PATHS[0]))
+        self.assertFalse(json_cache.is_loaded(self._EXCLUDED_FILE_PATHS[0]))
+
+        # Documents that aren't excluded stay parsed for their build
+        self.assertFalse(Document.is_excluded(self._CORPUS_FILE_PATHS[0]))
+        self.assertTrue(json_cache.is_loaded(self._CORPUS_FILE_PATHS[0]))
+        Document.from_file(self._CORPUS_FILE_PATHS[0])
+        self.assertFalse(json_cache.is_loaded(self._CORPUS_FILE_PATHS[0]))
+        parse_stats = next(stats for stats in json_cache.parse_times() if stats["file"] == os.path.abspath(self._CORPUS_FILE_PATHS[0]))
+        self.assertEqual(parse_stats["parses"], 1)
+
+    def test_excluded_memory_released(self):
+        self.use_header_index()
+        # Only the header of each excluded document is held afterwards, a lot less than what parsing one of them takes
+        held_bytes, peak_bytes = self.check_excluded(self._MANY_DOCUMENTS)
+        self.assertLess(held_bytes, peak_bytes,
+                        f"Checking {self._MANY_DOCUMENTS} excluded documents held on to {held_bytes} bytes, parsing one of them peaked at {peak_bytes} bytes")
@@ -0,0 +1,216 @@
+# README: unit tests making sure jinja templates only get parsed once they change, and template edits only affect the boards built on them
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from jinja2 import Environment, FileSystemLoader, TemplateSyntaxError
+
+from ... import globals
+from ...renderer import template_dependency_graph
+from ...renderer import template_environment
+from ...renderer.filters import DEFINED_FILTERS
+from ..boards.board import Board
+from ..document import Document
+from ..utils import compiler_cache
+
+
+class TestTemplateCache(unittest.TestCase):
+    # Tests to validate the shared Jinja environment, precompiled templates & the template dependency graph
+    # 1. Every render uses the same environment per template directory, and a new one loads unchanged templates without parsing them
+    # 2. Only templates whose source changed get compiled again, templates that no longer exist get their module removed
+    # 3. The environment renders precompiled templates without parsing them, and compiles a template edited during the run again
+    # 4. The graph knows every template a template is built on (ancestors) and every template built on it (descendants)
+    # 5. A template edit only affects the boards that rendered with it, or with a template built on it
+    # 6. Writing a document renders every board of it each time, passing the render options on
+    _TEMPLATES: dict = {
+        "base.jinja": "base {% block b %}{% endblock %}",
+        "child.jinja": "{% extends \"base.jinja\" %}{% block b %}child {{ x }}{% endblock %}",
+        "inc.jinja": "inc",
+        "Logic/SetRandomInt.jinja": "{% include \"inc.jinja\" %} rand",
+        "broken.jinja": "{% if %}"
+    }
+    _DOCUMENT_FILE_NAME: str = "test_template_cache.chatConversation"
+    _OUT_FILE_NAME: str = "test_template_cache.top"
+    _CONVERSATION_FILE_PATH: str = os.path.join(os.path.dirname(__file__), "test_module_broker", "test_chat_conversation_1.chatConversation")
+    # The templates the build renders with, before any test points JINJA_TEMPLATE_DIR elsewhere
+    _BUILD_TEMPLATE_DIR: str = globals.JINJA_TEMPLATE_DIR
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls._COMPILER_BACKUP_PATH = compiler_cache.backup(remove=True)
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        compiler_cache.get_instance().clear()
+        compiler_cache.restore(cls._COMPILER_BACKUP_PATH, remove=True)
+
+    def setUp(self) -> None:
+        self._dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self._dir)
+        self.template_dir = os.path.join(self._dir, "templates")
+        for template_name, source in self._TEMPLATES.items():
+            self.write_template(template_name, source)
+        self.addCleanup(shutil.rmtree, template_environment.compiled_templates_dir_path(self.template_dir), ignore_errors=True)
+
+        # Every test starts out with an empty graph, written while the test directory still exists (so not again once the process exits)
+        self.dependency_graph = template_dependency_graph.TemplateDependencyGraph(os.path.join(self._dir, template_dependency_graph.DEPENDENCY_GRAPH_FILE_NAME))
+        self.addCleanup(setattr, template_dependency_graph, "_instance", template_dependency_graph._instance)
+        self.addCleanup(self.dependency_graph.write)
+        template_dependency_graph._instance = self.dependency_graph
+
+        self.set_template_dir(self.template_dir)
+
+    def set_template_dir(self, template_dir: str):
+        """
+        Renders with the templates of this directory until the end of the test
+        """
+        self.addCleanup(setattr, globals, "JINJA_TEMPLATE_DIR", globals.JINJA_TEMPLATE_DIR)
+        self.addCleanup(template_environment._environments.pop, template_dir, None)
+        globals.JINJA_TEMPLATE_DIR = template_dir
+
+    def write_template(self, template_name: str, source: str):
+        template_path = os.path.join(self.template_dir, *template_name.split("/"))
+        os.makedirs(os.path.dirname(template_path), exist_ok=True)
+        with open(template_path, "w") as f:
+            f.write(source)
+
+    @staticmethod
+    def load_manifest(compiled_dir: str) -> dict:
+        with open(os.path.join(compiled_dir, template_environment.COMPILED_TEMPLATES_MANIFEST_NAME), "r") as f:
+            return json.load(f)
+
+    def refresh_templates(self):
+        self.dependency_graph.refresh_templates(self.template_dir, template_environment.new_environment(FileSystemLoader(self.template_dir)))
+
+    def test_one_environment_per_template_dir(self):
+        jinja_environment = template_environment.get_environment()
+        self.assertIs(template_environment.get_environment(), jinja_environment)
+        for name, defined_filter in DEFINED_FILTERS.items():
+            self.assertIs(jinja_environment.globals[name], defined_filter)
+        template = jinja_environment.get_template("child.jinja")
+        self.assertIs(jinja_environment.get_template("child.jinja"), template, msg="Expected the environment to keep compiled templates")
+        self.assertEqual(template.render(x=1), "base child 1")
+        self.assertEqual(jinja_environment.get_template("Logic/SetRandomInt.jinja").render(), "inc rand")
+
+        # The next run's environment doesn't parse the templates again
+        template_environment._environments.pop(self.template_dir)
+        jinja_environment = template_environment.get_environment()
+        with mock.patch.object(Environment, "_parse", side_effect=AssertionError("parsed a template that didn't change")):
+            self.assertEqual(jinja_environment.get_template("child.jinja").render(x=2), "base child 2")
+            self.assertEqual(jinja_environment.get_template("Logic/SetRandomInt.jinja").render(), "inc rand")
+
+        # Other template directories get their own environment
+        other_template_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, other_template_dir)
+        self.addCleanup(shutil.rmtree, template_environment.compiled_templates_dir_path(other_template_dir), ignore_errors=True)
+        self.set_template_dir(other_template_dir)
+        self.assertIsNot(template_environment.get_environment(), jinja_environment)
+
+    def test_precompile_only_changed(self):
+        compiled_templates = len(self._TEMPLATES) - 1
+        compiled_dir, stats = template_environment.compile_templates(self.template_dir)
+        self.assertEqual(stats, { "compiled": compiled_templates, "reused": 0, "removed": 0, "failed": 1 })
+        manifest = self.load_manifest(compiled_dir)
+        self.assertEqual(sorted(manifest["templates"]), sorted(name for name in self._TEMPLATES if name != "broken.jinja"))
+        self.assertEqual(list(manifest["failed"]), ["broken.jinja"])
+
+        # Nothing changed, the broken template doesn't even get parsed again
+        with mock.patch.object(Environment, "_parse", side_effect=AssertionError("parsed a template that didn't change")):
+            compiled_dir, stats = template_environment.compile_templates(self.template_dir)
+        self.assertEqual(stats, { "compiled": 0, "reused": compiled_templates, "removed": 0, "failed": 1 })
+
+        self.write_template("base.jinja", "base again {% block b %}{% endblock %}")
+        os.remove(os.path.join(self.template_dir, "Logic", "SetRandomInt.jinja"))
+        compiled_dir, stats = template_environment.compile_templates(self.template_dir)
+        self.assertEqual(stats, { "compiled": 1, "reused": compiled_templates - 2, "removed": 1, "failed": 1 })
+        self.assertNotIn("Logic/SetRandomInt.jinja", self.load_manifest(compiled_dir)["templates"])
+
+        compiled_dir, stats = template_environment.compile_templates(self.template_dir, force=True)
+        self.assertEqual(stats["compiled"], compiled_templates - 1)
+
+    def test_environment_loads_precompiled(self):
+        jinja_environment = template_environment.get_environment()
+        self.assertIs(template_environment.get_environment(), jinja_environment)
+        with mock.patch.object(Environment, "_parse", side_effect=AssertionError("parsed a precompiled template")):
+            self.assertEqual(jinja_environment.get_template("child.jinja").render(x=1), "base child 1")
+            self.assertEqual(jinja_environment.get_template("Logic/SetRandomInt.jinja").render(), "inc rand")
+        # Templates that don't compile load from source, raising their syntax error
+        with self.assertRaises(TemplateSyntaxError):
+            jinja_environment.get_template("broken.jinja")
+
+        # Edited during the run: compiled again, and the templates built on it render with the edit
+        self.write_template("base.jinja", "base again {% block b %}{% endblock %}")
+        self.assertEqual(jinja_environment.get_template("child.jinja").render(x=2), "base again child 2")
+        self.assertEqual(template_environment.compile_templates(self.template_dir)[1]["compiled"], 0)
+
+    def test_ancestors_descendants(self):
+        template_environment.compile_templates(self.template_dir)
+        self.assertEqual(self.dependency_graph.parents("child.jinja"), ["base.jinja"])
+        self.assertEqual(self.dependency_graph.parents("Logic/SetRandomInt.jinja"), ["inc.jinja"])
+        self.assertEqual(self.dependency_graph.ancestors(["child.jinja"]), { "child.jinja", "base.jinja" })
+        self.assertEqual(self.dependency_graph.ancestors(["inc.jinja"]), { "inc.jinja" })
+        self.assertEqual(self.dependency_graph.descendants(["base.jinja"]), { "base.jinja", "child.jinja" })
+        self.assertEqual(self.dependency_graph.descendants(["inc.jinja", "child.jinja"]), { "inc.jinja", "Logic/SetRandomInt.jinja", "child.jinja" })
+
+        # Edits to what a template extends, imports or includes get picked up, and deleted templates dropped
+        self.write_template("inc.jinja", "{% extends \"base.jinja\" %}")
+        os.remove(os.path.join(self.template_dir, "child.jinja"))
+        self.refresh_templates()
+        self.assertEqual(self.dependency_graph.descendants(["base.jinja"]), { "base.jinja", "inc.jinja", "Logic/SetRandomInt.jinja" })
+        self.assertEqual(self.dependency_graph.parents("child.jinja"), [])
+
+        # Read back by the next run
+        self.dependency_graph.write()
+        dependency_graph = template_dependency_graph.TemplateDependencyGraph(os.path.join(self._dir, template_dependency_graph.DEPENDENCY_GRAPH_FILE_NAME))
+        self.assertEqual(dependency_graph.descendants(["base.jinja"]), { "base.jinja", "inc.jinja", "Logic/SetRandomInt.jinja" })
+
+    def test_affected_boards(self):
+        self.refresh_templates()
+        doc_path = os.path.join(self._dir, self._DOCUMENT_FILE_NAME)
+        with open(doc_path, "w") as f:
+            f.write("{}")
+        self.dependency_graph.record_board(doc_path, "board_0", self.dependency_graph.ancestors(["child.jinja"]))
+        self.dependency_graph.record_board(doc_path, "board_1", self.dependency_graph.ancestors(["Logic/SetRandomInt.jinja"]))
+        self.dependency_graph.record_board(doc_path, template_dependency_graph.DOCUMENT_BOARD_UUID, ["base.jinja"])
+
+        self.assertEqual(self.dependency_graph.affected_boards(["base.jinja"]), { doc_path: [template_dependency_graph.DOCUMENT_BOARD_UUID, "board_0"] })
+        self.assertEqual(self.dependency_graph.affected_boards(["inc.jinja"]), { doc_path: ["board_1"] })
+        self.assertEqual(self.dependency_graph.affected_boards(["child.jinja", "inc.jinja"]), { doc_path: ["board_0", "board_1"] })
+        self.assertEqual(self.dependency_graph.affected_boards(["broken.jinja"]), {})
+
+        # A template edited to include another one affects the boards that rendered with it too, once the graph knows about the edit
+        self.write_template("inc.jinja", "{% include \"child.jinja\" %}")
+        self.assertEqual(self.dependency_graph.affected_boards(["child.jinja"]), { doc_path: ["board_0"] })
+        self.refresh_templates()
+        self.assertEqual(self.dependency_graph.affected_boards(["child.jinja"]), { doc_path: ["board_0", "board_1"] })
+
+        self.dependency_graph.clear_document(doc_path)
+        self.assertEqual(self.dependency_graph.affected_boards(["base.jinja"]), {})
+
+    def test_document_renders_every_board(self):
+        """
+        Test writing a document renders every board again each time, even if only templates changed since: rendering a board does more
+        Than output its text (i.e. it adds its topics to the topic cache, which dropped them when the document's file got compiled again)
+        """
+        self.set_template_dir(self._BUILD_TEMPLATE_DIR)
+        empath_doc = Document.from_file(self._CONVERSATION_FILE_PATH, lazy=False)
+        board_uuids = [_board.uuid for _board in empath_doc.boards if _board.has_intro()]
+        self.assertGreater(len(board_uuids), 1, msg="Expected the test file to have more than one board to render")
+        out_file = os.path.join(self._dir, self._OUT_FILE_NAME)
+
+        for _ in range(2):
+            # The same way compiling the document's file again drops what it compiled to last time
+            compiler_cache.get_instance().remove_objects_for_file(abs_path=empath_doc.filepath)
+            with mock.patch.object(Board, "render", autospec=True, side_effect=Board.render) as render_board:
+                self.assertEqual(empath_doc.render_and_write(out_file), out_file)
+            self.assertEqual([call.args[0].uuid for call in render_board.call_args_list], board_uuids)
+            self.assertTrue(os.path.exists(out_file))
+
+        # Render options get passed on to every board
+        with mock.patch.object(Document, "render", autospec=True, return_value="") as render_document:
+            empath_doc.render_and_write(out_file, garden_path=True)
+        render_document.assert_called_once_with(empath_doc, garden_path=True)
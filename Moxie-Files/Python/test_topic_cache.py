@@ -0,0 +1,862 @@
+# README: unit tests of the topic cache: writing compiled topics to its segment file, loading them back and keeping them up to date between compiles
+
+from contextlib import redirect_stdout
+from types import SimpleNamespace
+from typing import List
+from unittest import mock
+import copy
+import io
+import json
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+import uuid
+
+from .... import SHEETS_DIR, CONVERSATIONS_DIR, CACHE_SUB_DIR
+from ... import chat2cs
+from ... import globals
+from ..document import Document
+from ..utils import unit_test_utils
+from ..utils import compiler_cache
+from ..utils.caches import cache_file_reader
+from ..utils.caches import shared_topic_store
+from ..utils.caches import topic_cache_utils
+from ..utils.caches import topic_cache_inspect
+from ..utils.caches import topic_record_codec
+from ..utils.caches.topic_cache import DOC_FILE_SUFFIX_NAME
+
+
+class SharedTag:
+    """
+    Tag comparing by value, the way the compiled topics' tags do
+    """
+    def __init__(self, name: str):
+        self.name = name
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, SharedTag) and other.name == self.name
+
+    def __hash__(self) -> int:
+        return hash(self.name)
+
+
+class TestTopicCache(unittest.TestCase):
+    # Tests to validate the TopicCache writes every topic to its segment file and loads them back, recovering from corrupt segment files
+    # 1. Every board & topic record is written to a single segment file, whose index points at each of them
+    # 2. Cache files are unpickled straight from their memory mapping, whatever their size
+    # 3. Lazily loaded topics are the same as the ones loaded all at once, and only get loaded once they're accessed
+    # 4. Topic names & boards are looked up through indexes, returning the same doc as a scan of the doc list
+    # 5. The doc list stays sorted by filepath whatever order docs are added in, and hands back every doc of a file
+    # 6. Once most of the segment file is stale records, the next write() compacts it into a new segment file
+    # 7. Version 2 boards loaded by a pool of workers get added in the same order as loading them one by one
+    # 8. Docs only hold a board descriptor, resolving the full board on access, including docs pickled with their full board
+    # 9. Boards failing their checksum are left out of the load along with the rest of their source file, instead of failing the whole load
+    # 10. Topic cache files downgraded to older build versions (3 -> 2 -> 1) load back every topic
+    # 11. Past the memory budget, the least recently used boards get their topics evicted, and load them again on their next access
+    # 12. Compiled topics encode to compact records (long text out-of-band) that decode back to the same topics, also as generic pickles
+    # 13. Equal strings & tags of loaded topics are shared, leaving everything else alone
+    # 14. Switching back to a previously compiled source tree loads its snapshot without compiling anything again
+    # 15. Boards left out of a load come back from the shared store another build published them to once their source file compiles again, which still renders it
+    # 16. Every write() reports its compile stats, which the inspect command reports along with what the segment file holds
+    # 17. Boards failing their checksum are left out of the load and come back with the next compile
+    # 18. Boards past the end of a truncated segment file are left out of the load and come back with the next compile, even after a write()
+    # 19. Lazily loaded boards only get checked against their checksum once one of their topics is loaded
+    # 20. A topic name held by several docs looks up the first of them in the doc list, and the next one once that one's file is removed
+    # 21. A fresh checkout gets the topics of every source file from the shared store, and still renders every source file
+    _DIR = os.path.dirname(__file__)
+    _TEST_FILES_DIR: str = os.path.join(_DIR, "test_module_broker/")
+    _SUPPORT_FILES_DIR: str = os.path.join(_DIR, "module_broker_support_files/")
+    _INDEX_FILE_NAME: str = "MODBROKER1_index.csv"
+    _CONVERSATION_FILE_NAME: str = "test_chat_conversation_1.chatConversation"
+    _MODULE_WITH_INDEX_FILE_NAME: str = "test_module_1.chatModule"
+    # Same test files as "test_module_broker.py", so same directory name (the test module's index sheet path depends on it)
+    _UNITTEST_DIR_NAME: str = "UNITTEST_MODULE_BROKER_"
+
+    _TEMP_INDEX_FILE_PATH: str = os.path.join(SHEETS_DIR, _UNITTEST_DIR_NAME + _INDEX_FILE_NAME.split(".")[0], _INDEX_FILE_NAME)
+    _TEMP_CONVERSATION_FILE_PATH: str = os.path.join(CONVERSATIONS_DIR, _UNITTEST_DIR_NAME + _MODULE_WITH_INDEX_FILE_NAME.split(".")[0], _CONVERSATION_FILE_NAME)
+
+    # Set Up test env
+    @classmethod
+    def setUpClass(cls) -> None:
+        # Backup generated files
+        cls._COMPILER_BACKUP_PATH = compiler_cache.backup(remove=True)
+        cls.BACKUP_SRC, cls.BACKUP_DST = chat2cs.backup_generated_files()
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        # remove all added files from cache
+        compiler_cache.get_instance().clear()
+        # Restore generated files
+        compiler_cache.restore(cls._COMPILER_BACKUP_PATH, remove=True)
+        chat2cs.restore_generated_files(cls.BACKUP_DST, cls.BACKUP_SRC)
+        # remove copied files
+        unit_test_utils.remove_test_files(cls._TEST_FILES_DIR, cls._UNITTEST_DIR_NAME)
+
+    # set up for each test
+    def setUp(self) -> None:
+        # Same test files as "test_module_broker.py", see its setUp() for why they live where they do
+        os.mkdir(os.path.dirname(self._TEMP_INDEX_FILE_PATH))
+        shutil.copyfile(os.path.join(self._SUPPORT_FILES_DIR, self._INDEX_FILE_NAME), self._TEMP_INDEX_FILE_PATH)
+        os.mkdir(os.path.dirname(self._TEMP_CONVERSATION_FILE_PATH))
+        shutil.copyfile(os.path.join(self._SUPPORT_FILES_DIR, self._CONVERSATION_FILE_NAME), self._TEMP_CONVERSATION_FILE_PATH)
+
+        unit_test_utils.copy_test_files(self._TEST_FILES_DIR, self._UNITTEST_DIR_NAME, recursive=False)
+
+    def tearDown(self) -> None:
+        os.remove(self._TEMP_INDEX_FILE_PATH)
+        os.rmdir(os.path.dirname(self._TEMP_INDEX_FILE_PATH))
+        os.remove(self._TEMP_CONVERSATION_FILE_PATH)
+
+        # remove all added files from cache
+        compiler_cache.get_instance().clear()
+        # remove copied files
+        unit_test_utils.remove_test_files(self._TEST_FILES_DIR, self._UNITTEST_DIR_NAME)
+
+    # helpers
+    @staticmethod
+    def topic_names() -> List[str]:
+        return sorted(topic_name for doc in compiler_cache.get_instance().topics.items for topic_name in doc.topics)
+
+    @staticmethod
+    def reload_compiler_cache():
+        """
+        Drops the global compiler cache so the next get_instance() loads every cache from disk again
+        """
+        if compiler_cache._INSTANCE is not None:
+            del compiler_cache._INSTANCE
+        compiler_cache._INSTANCE = None
+        return compiler_cache.get_instance(from_cache=True)
+
+    def compile_and_write(self) -> dict:
+        """
+        Compiles the test files, writes the compiler cache and returns the segment index of the topic cache written
+        """
+        unit_test_utils.compile_chat_files(self._TEST_FILES_DIR, self._UNITTEST_DIR_NAME)
+        compiler_cache.get_instance().write()
+        return topic_cache_utils.load_segment_index(compiler_cache.get_instance().topics.topic_cache_dir_path())
+
+    @staticmethod
+    def segment_file_path(segment_index: dict) -> str:
+        """
+        Returns the path of the segment file the index points at
+        """
+        topic_cache_dir_path = compiler_cache.get_instance().topics.topic_cache_dir_path()
+        return os.path.join(topic_cache_dir_path, segment_index[topic_cache_utils.SEGMENT_INDEX_SEGMENT_KEY])
+
+    def set_lazy_loading(self, lazy_loading: bool):
+        """
+        Turns lazy topic cache loading on or off until the end of the test
+        """
+        self.addCleanup(setattr, globals, "LAZY_LOAD_TOPIC_CACHE", getattr(globals, "LAZY_LOAD_TOPIC_CACHE", False))
+        globals.LAZY_LOAD_TOPIC_CACHE = lazy_loading
+
+    def set_memory_budget(self, memory_budget: int):
+        """
+        Sets the topic cache's memory budget (in record bytes) until the end of the test
+        """
+        self.addCleanup(setattr, globals, "TOPIC_CACHE_MEMORY_BUDGET_BYTES", getattr(globals, "TOPIC_CACHE_MEMORY_BUDGET_BYTES", None))
+        globals.TOPIC_CACHE_MEMORY_BUDGET_BYTES = memory_budget
+
+    def use_shared_store(self) -> str:
+        """
+        Points the topic cache at an empty shared store until the end of the test
+        """
+        shared_cache_dir_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, shared_cache_dir_path, ignore_errors=True)
+        self.addCleanup(shared_topic_store._instances.clear)
+        self.addCleanup(setattr, globals, "SHARED_TOPIC_CACHE_DIR", getattr(globals, "SHARED_TOPIC_CACHE_DIR", None))
+        globals.SHARED_TOPIC_CACHE_DIR = shared_cache_dir_path
+        shared_topic_store._instances.clear()
+        return shared_cache_dir_path
+
+    def compile_and_render(self) -> List[str]:
+        """
+        Compiles the test files and writes the compiler cache, returning the filepath of every document whose boards got rendered
+        """
+        with mock.patch.object(Document, "_render_boards", autospec=True, side_effect=Document._render_boards) as render_boards:
+            self.compile_and_write()
+        return sorted({call.args[0].filepath for call in render_boards.call_args_list})
+
+    @staticmethod
+    def change_source_file(filepath: str):
+        """
+        Changes the content of a copied test file, without changing what it compiles to
+        """
+        with open(filepath, "ab") as f:
+            f.write(b"\n")
+
+    def corrupt_topic_record(self, segment_index: dict, board_entry: dict):
+        """
+        Flips a byte of the first topic record of a board, in the segment file the index points at
+        """
+        topic_name, offset, length = board_entry["topics"][0]
+        with open(self.segment_file_path(segment_index), "r+b") as f:
+            f.seek(offset)
+            byte = f.read(1)
+            f.seek(offset)
+            f.write(bytes([byte[0] ^ 0xFF]))
+
+    def assert_same_topic(self, topic_obj, decoded_topic_obj, topic_name: str):
+        """
+        Validates a decoded topic has the same class & attributes as the topic it was encoded from
+        (Attributes holding other objects are only compared by class, since those don't compare by value)
+        """
+        self.assertIs(type(decoded_topic_obj), type(topic_obj))
+        self.assertEqual(list(vars(decoded_topic_obj)), list(vars(topic_obj)), msg=f"Expected topic '{topic_name}' to decode the same attributes")
+        for attribute_name, value in vars(topic_obj).items():
+            decoded_value = getattr(decoded_topic_obj, attribute_name)
+            if type(value) in (str, int, float, bool, type(None), list, tuple, dict, set):
+                self.assertEqual(decoded_value, value, msg=f"Expected attribute '{attribute_name}' of topic '{topic_name}' to decode the same")
+            else:
+                self.assertIs(type(decoded_value), type(value))
+
+    def assert_left_out(self, lost_filepath: str):
+        """
+        Validates the last load left out every board of this source file and scheduled it for recompilation
+        """
+        topic_cache = compiler_cache.get_instance().topics
+        self.assertIn(lost_filepath, topic_cache.files_to_recompile)
+        self.assertEqual(len(topic_cache.get_by_file(lost_filepath)), 0, msg=f"Expected every board of file://{lost_filepath} to be left out")
+
+    def assert_recompiled(self, topic_names: List[str]):
+        """
+        Validates the next compile brings back every topic the cache had before it got corrupted
+        """
+        unit_test_utils.compile_chat_files(self._TEST_FILES_DIR, self._UNITTEST_DIR_NAME)
+        self.assertEqual(self.topic_names(), topic_names, msg="Expected the next compile to bring back every topic left out of the load")
+
+        # And the topics are back in the topic cache file for good
+        compiler_cache.get_instance().write()
+        self.reload_compiler_cache()
+        self.assertEqual(self.topic_names(), topic_names)
+        self.assertEqual(compiler_cache.get_instance().topics.discarded_boards, [])
+
+    # tests
+    def test_segment_file_layout(self):
+        """
+        Test every board & topic record is written to the single segment file, at the offset its index entry points at
+        """
+        segment_index = self.compile_and_write()
+        topic_names = self.topic_names()
+        topic_cache = compiler_cache.get_instance().topics
+        docs = list(topic_cache.items)
+        self.assertGreater(len(docs), 0, msg="Expected the test files to compile into boards")
+
+        # No more directory per board, nor file per topic
+        topic_cache_dir_path = topic_cache.topic_cache_dir_path()
+        self.assertEqual([name for name in os.listdir(topic_cache_dir_path) if os.path.isdir(os.path.join(topic_cache_dir_path, name))], [])
+
+        # One index entry per board, listing every topic of the board
+        board_entries = segment_index[topic_cache_utils.SEGMENT_INDEX_BOARDS_KEY]
+        self.assertEqual(sorted(board_entry["key"] for board_entry in board_entries), sorted(doc.doc_dir_path() for doc in docs))
+        self.assertEqual(sorted(topic_name for board_entry in board_entries for topic_name, offset, length in board_entry["topics"]), topic_names)
+
+        # Every record lies inside the segment file
+        segment_size = os.path.getsize(self.segment_file_path(segment_index))
+        for board_entry in board_entries:
+            for offset, length in [board_entry["data"]] + [(offset, length) for topic_name, offset, length in board_entry["topics"]]:
+                self.assertLessEqual(offset + length, segment_size, msg=f"Expected every record of board '{board_entry['key']}' inside the segment file")
+
+        self.reload_compiler_cache()
+        self.assertEqual(self.topic_names(), topic_names)
+
+    def test_mapped_cache_file_reads(self):
+        """
+        Test cache files are unpickled straight from their memory mapping, and load the same whether they get mapped or read
+        """
+        records = [{"topic": "a"}, ["b", "c"], "d" * 1024]
+        cache_file_path = os.path.join(tempfile.mkdtemp(), "records")
+        self.addCleanup(shutil.rmtree, os.path.dirname(cache_file_path), ignore_errors=True)
+        with open(cache_file_path, "wb") as f:
+            record_entries = [topic_cache_utils.append_record(f, record) for record in records]
+
+        # Every record gets unpickled from a view of the mapping, never from a copy of its bytes
+        with mock.patch.object(cache_file_reader.pickle, "loads", wraps=pickle.loads) as loads:
+            with cache_file_reader.MappedCacheFile(cache_file_path) as cache_file:
+                self.assertEqual(len(cache_file), os.path.getsize(cache_file_path))
+                self.assertEqual([cache_file.read_record(offset, length) for offset, length in record_entries], records)
+        self.assertEqual(loads.call_count, len(records))
+        self.assertTrue(all(isinstance(call.args[0], memoryview) for call in loads.call_args_list))
+
+        # A whole file loads the same whether it's mapped or read
+        with open(cache_file_path, "wb") as f:
+            pickle.dump(records, f)
+        self.assertEqual(cache_file_reader.load_cache_file(cache_file_path), records)
+        with mock.patch.object(cache_file_reader, "MMAP_THRESHOLD_BYTES", 0):
+            self.assertEqual(cache_file_reader.load_cache_file(cache_file_path), records)
+
+        # Empty files (i.e. a sub cache without any docs) can't be mapped, but still open
+        open(cache_file_path, "wb").close()
+        with cache_file_reader.MappedCacheFile(cache_file_path) as cache_file:
+            self.assertEqual(len(cache_file), 0)
+
+        # Mapping every sub cache file loads back the same topics
+        self.compile_and_write()
+        topic_names = self.topic_names()
+        with mock.patch.object(cache_file_reader, "MMAP_THRESHOLD_BYTES", 0):
+            self.reload_compiler_cache()
+            self.assertEqual(self.topic_names(), topic_names)
+
+    def test_lazy_load_matches_eager_load(self):
+        """
+        Test lazily loaded topics only get loaded once they're accessed, and match the topics loaded all at once
+        """
+        self.compile_and_write()
+
+        self.set_lazy_loading(False)
+        self.reload_compiler_cache()
+        topic_cache = compiler_cache.get_instance().topics
+        eager_topics = {topic_name: topic_obj for doc in topic_cache.items for topic_name, topic_obj in doc.topics.items()}
+        self.assertEqual(topic_cache.version, 3)
+
+        globals.LAZY_LOAD_TOPIC_CACHE = True
+        self.reload_compiler_cache()
+        topic_cache = compiler_cache.get_instance().topics
+        self.assertEqual(self.topic_names(), sorted(eager_topics))
+        for doc in topic_cache.items:
+            self.assertIsInstance(doc.topics, topic_cache.LazyTopics)
+            for topic_name in doc.topics:
+                self.assertFalse(doc.topics.is_loaded(topic_name), msg=f"Expected topic '{topic_name}' to only load once it's accessed")
+
+        for topic_name, eager_topic in eager_topics.items():
+            doc = topic_cache[topic_name]
+            lazy_topic = doc.topics[topic_name]
+            self.assertTrue(doc.topics.is_loaded(topic_name))
+            self.assertIs(type(lazy_topic), type(eager_topic))
+            self.assertEqual(sorted(vars(lazy_topic)), sorted(vars(eager_topic)), msg=f"Expected topic '{topic_name}' to load the same attributes either way")
+            # Accessing it again doesn't load it again
+            self.assertIs(doc.topics[topic_name], lazy_topic)
+        self.assertEqual(topic_cache.cache_stats["misses"], len(eager_topics))
+
+    def test_topic_and_board_lookups(self):
+        """
+        Test topic names & boards are looked up through the indexes, finding the same doc as a scan of the doc list
+        """
+        self.compile_and_write()
+        self.set_lazy_loading(False)
+        self.reload_compiler_cache()
+        topic_cache = compiler_cache.get_instance().topics
+        docs = list(topic_cache.items)
+
+        for topic_name in self.topic_names():
+            self.assertIn(topic_name, topic_cache)
+            self.assertIs(topic_cache[topic_name], next(doc for doc in docs if topic_name in doc.topics), msg=f"Expected topic '{topic_name}' to find its doc")
+        for doc in docs:
+            self.assertIs(topic_cache[doc.board], doc)
+
+        self.assertNotIn("UNITTEST_UNKNOWN_TOPIC", topic_cache)
+        with self.assertRaises(Exception):
+            topic_cache["UNITTEST_UNKNOWN_TOPIC"]
+
+    def test_sorted_docs_by_file(self):
+        """
+        Test the doc list stays sorted by filepath whatever order docs get added in, and hands back every doc of a source file in the order it was added
+        """
+        self.compile_and_write()
+        topic_cache = compiler_cache.get_instance().topics
+        docs = topic_cache.items
+        self.assertIsInstance(docs, topic_cache.DocsView)
+        self.assertEqual([doc.filepath for doc in docs], sorted(doc.filepath for doc in docs))
+        with self.assertRaises(TypeError):
+            docs[0] = docs[-1]
+
+        filepaths = sorted({doc.filepath for doc in docs})
+        self.assertGreater(len(filepaths), 1, msg="Expected the test files to compile into boards of more than one file")
+        for filepath in filepaths:
+            file_docs = [doc for doc in docs if doc.filepath == filepath]
+            self.assertEqual(list(topic_cache.get_by_file(filepath)), file_docs)
+            self.assertEqual(list(docs.get_by_file(filepath)), file_docs)
+        self.assertEqual(len(topic_cache.get_by_file(os.path.join(self._DIR, "UNITTEST_UNKNOWN_FILE.chatModule"))), 0)
+
+        # Added the other way around, docs still come out sorted by filepath
+        reversed_docs = list(reversed(docs))
+        other_topic_cache = topic_cache.__class__()
+        for doc in reversed_docs:
+            other_topic_cache.add_doc(doc)
+        self.assertEqual([doc.filepath for doc in other_topic_cache.items], [doc.filepath for doc in docs])
+        for filepath in filepaths:
+            self.assertEqual(list(other_topic_cache.get_by_file(filepath)), [doc for doc in reversed_docs if doc.filepath == filepath])
+
+    def test_segment_compaction(self):
+        """
+        Test a write() only appends to the segment file until most of it is stale records, then compacts it into a new segment file
+        """
+        self.addCleanup(setattr, globals, "TOPIC_CACHE_SNAPSHOTS", getattr(globals, "TOPIC_CACHE_SNAPSHOTS", topic_cache_utils.DEFAULT_SNAPSHOT_COUNT))
+        # Without other snapshots, the records of rewritten boards are stale as soon as they're rewritten
+        globals.TOPIC_CACHE_SNAPSHOTS = 1
+        segment_index = self.compile_and_write()
+        topic_names = self.topic_names()
+        segment_name = segment_index[topic_cache_utils.SEGMENT_INDEX_SEGMENT_KEY]
+
+        # Nothing changed, so nothing is stale
+        self.reload_compiler_cache()
+        segment_index = self.compile_and_write()
+        self.assertEqual(segment_index[topic_cache_utils.SEGMENT_INDEX_SEGMENT_KEY], segment_name)
+
+        # Every board gets rewritten, so every record of the segment file is stale
+        changed_filepaths = sorted({doc.filepath for doc in compiler_cache.get_instance().topics.items})
+        for changed_filepath in changed_filepaths:
+            self.change_source_file(changed_filepath)
+        self.reload_compiler_cache()
+        segment_index = self.compile_and_write()
+        topic_cache = compiler_cache.get_instance().topics
+        self.assertNotEqual(segment_index[topic_cache_utils.SEGMENT_INDEX_SEGMENT_KEY], segment_name)
+        self.assertFalse(os.path.exists(os.path.join(topic_cache.topic_cache_dir_path(), segment_name)), msg="Expected the old segment file to be removed")
+
+        self.reload_compiler_cache()
+        self.assertEqual(self.topic_names(), topic_names)
+
+    def test_v2_parallel_load_keeps_order(self):
+        """
+        Test version 2 boards loaded by a pool of workers get added in the same order as loading them one by one, even when a worker falls behind
+        """
+        self.compile_and_write()
+        self.set_lazy_loading(False)
+        self.reload_compiler_cache()
+        topic_cache = compiler_cache.get_instance().topics
+        docs = list(topic_cache.items)
+
+        # Lay the docs out the way version 2 builds wrote them: a directory of topic files per board, next to its "data" file
+        topic_cache_v2_dir_path = topic_cache.topic_cache_dir_path(2)
+        self.addCleanup(shutil.rmtree, topic_cache_v2_dir_path, ignore_errors=True)
+        for doc in docs:
+            doc_dir_path = os.path.join(topic_cache_v2_dir_path, doc.doc_dir_path())
+            os.makedirs(doc_dir_path)
+            for topic_name, topic_obj in doc.topics.items():
+                with open(os.path.join(doc_dir_path, topic_name), "wb") as f:
+                    pickle.dump({topic_name: topic_obj}, f, pickle.DEFAULT_PROTOCOL)
+            with open(doc_dir_path + DOC_FILE_SUFFIX_NAME, "wb") as f:
+                pickle.dump(doc.shallow_copy(), f, pickle.DEFAULT_PROTOCOL)
+
+        self.addCleanup(setattr, globals, "TOPIC_CACHE_LOAD_WORKERS", getattr(globals, "TOPIC_CACHE_LOAD_WORKERS", None))
+        load_v2_board = topic_cache_utils.load_v2_board
+        added_docs = {}
+        for load_workers in [1, 4]:
+            globals.TOPIC_CACHE_LOAD_WORKERS = load_workers
+            delayed_boards = []
+
+            def load_board_slowly(topic_cache_dir_path: str, doc_data_path: str):
+                # The first board finishes loading last
+                if not delayed_boards:
+                    delayed_boards.append(doc_data_path)
+                    time.sleep(0.2)
+                return load_v2_board(topic_cache_dir_path, doc_data_path)
+
+            loading_topic_cache = topic_cache.__class__()
+            with mock.patch.object(topic_cache_utils, "load_v2_board", side_effect=load_board_slowly), \
+                 mock.patch.object(loading_topic_cache, "add_doc", wraps=loading_topic_cache.add_doc) as add_doc:
+                doc_data_files, doc_topic_files = topic_cache_utils.load_v2(loading_topic_cache, None, 0, 0)
+            self.assertEqual(doc_data_files, len(docs))
+            self.assertEqual(doc_topic_files, len(self.topic_names()))
+            added_docs[load_workers] = [(call.args[0].doc_dir_path(), sorted(call.args[0].topics)) for call in add_doc.call_args_list]
+
+        self.assertEqual(added_docs[4], added_docs[1], msg="Expected the worker pool to add docs in the same order as loading them one by one")
+        self.assertEqual(sorted(added_docs[1]), sorted((doc.doc_dir_path(), sorted(doc.topics)) for doc in docs))
+
+    def test_board_descriptors(self):
+        """
+        Test docs only pickle a descriptor of their board and resolve the full board on access, including docs pickled with their full board
+        """
+        self.compile_and_write()
+        topic_cache = compiler_cache.get_instance().topics
+
+        for doc in topic_cache.items:
+            board_descriptor = doc.board_descriptor
+            self.assertIsInstance(board_descriptor, topic_cache.BoardDescriptor)
+            self.assertEqual(board_descriptor.filepath, doc.filepath)
+
+            # Only the descriptor's fields get pickled, never the board itself
+            pickled_descriptor = pickle.loads(pickle.dumps(board_descriptor))
+            self.assertIsNone(pickled_descriptor._board)
+            self.assertIsNone(pickled_descriptor._board_ref)
+            self.assertEqual((pickled_descriptor.uuid, pickled_descriptor.name, pickled_descriptor.filepath),
+                             (board_descriptor.uuid, board_descriptor.name, board_descriptor.filepath))
+
+            board = doc.board
+            self.assertEqual((board.uuid, board.name, board.parent.filepath), (board_descriptor.uuid, board_descriptor.name, doc.filepath))
+            self.assertIs(doc.board, board, msg="Expected the resolved board to be held on to")
+
+        # Docs pickled before board descriptors existed still hold their full board
+        doc = topic_cache.items[0]
+        board = doc.board
+        legacy_doc = topic_cache.Document.__new__(topic_cache.Document)
+        legacy_doc.__setstate__({"filename": doc.filepath, "board": board, "topics": {}})
+        self.assertIsInstance(legacy_doc.board_descriptor, topic_cache.BoardDescriptor)
+        self.assertTrue(legacy_doc._is_legacy_record)
+        self.assertEqual(legacy_doc.doc_dir_path(), doc.doc_dir_path())
+        self.assertIs(legacy_doc.board, board)
+
+    def test_checksum_mismatch_left_out(self):
+        """
+        Test a board whose topic record changed on disk is left out of the load along with the other boards of its source file, and reported
+        """
+        segment_index = self.compile_and_write()
+        board_entries = segment_index[topic_cache_utils.SEGMENT_INDEX_BOARDS_KEY]
+        board_entry = board_entries[0]
+        self.corrupt_topic_record(segment_index, board_entry)
+
+        self.set_lazy_loading(False)
+        self.reload_compiler_cache()
+        topic_cache = compiler_cache.get_instance().topics
+        self.assertEqual([(discarded_board["key"], discarded_board["filepath"]) for discarded_board in topic_cache.discarded_boards],
+                         [(board_entry["key"], board_entry["filepath"])])
+        self.assertEqual(topic_cache.files_to_recompile, [board_entry["filepath"]])
+        self.assertEqual(len(topic_cache.get_by_file(board_entry["filepath"])), 0)
+
+        # Every other source file still loaded
+        self.assertEqual(self.topic_names(), sorted(topic_name for other_board_entry in board_entries if other_board_entry["filepath"] != board_entry["filepath"]
+                                                    for topic_name, offset, length in other_board_entry["topics"]))
+
+    def test_downgrade_loads_back(self):
+        """
+        Test topic cache files downgraded to build versions 2 then 1 load back every topic, upgraded to the current build version
+        """
+        self.compile_and_write()
+        topic_names = self.topic_names()
+        current_version = compiler_cache.get_instance().topics.version
+
+        topic_cache = compiler_cache.get_instance().topics
+        topic_cache.downgrade(2)
+        self.assertEqual(topic_cache.version, 2)
+        self.assertTrue(os.path.isdir(topic_cache.topic_cache_dir_path(2)))
+
+        self.reload_compiler_cache()
+        topic_cache = compiler_cache.get_instance().topics
+        self.assertEqual(self.topic_names(), topic_names)
+        self.assertEqual(topic_cache.version, current_version)
+        self.assertEqual(topic_cache.files_to_recompile, [])
+
+        # Back to the current build version before going down to version 1
+        topic_cache.write()
+        self.assertTrue(os.path.isdir(topic_cache.topic_cache_dir_path()))
+        self.assertFalse(os.path.isdir(topic_cache.topic_cache_dir_path(2)))
+
+        topic_cache.downgrade(1)
+        self.assertEqual(topic_cache.version, 1)
+
+        self.reload_compiler_cache()
+        topic_cache = compiler_cache.get_instance().topics
+        self.assertEqual(self.topic_names(), topic_names)
+        self.assertEqual(topic_cache.version, current_version)
+
+    def test_memory_budget_evicts(self):
+        """
+        Test a topic cache over its memory budget only keeps the board last accessed loaded, and evicted topics load again on their next access
+        """
+        self.compile_and_write()
+        topic_names = self.topic_names()
+
+        # Any board is over a 1 byte budget, so every access evicts the board accessed before it
+        self.set_lazy_loading(False)
+        self.set_memory_budget(1)
+        self.reload_compiler_cache()
+        topic_cache = compiler_cache.get_instance().topics
+        self.assertTrue(topic_cache.lazy_loading, msg="Expected a memory budget to load topics lazily")
+        docs = [doc for doc in topic_cache.items if len(doc.topics) > 0]
+        self.assertGreater(len(docs), 1, msg="Expected the test files to compile into more than one board")
+        for doc in docs:
+            for topic_name in doc.topics:
+                doc.topics[topic_name]
+        cache_stats = topic_cache.cache_stats
+        self.assertEqual(cache_stats["resident_boards"], 1)
+        self.assertEqual(cache_stats["evictions"], len(docs) - 1)
+        self.assertEqual(cache_stats["misses"], len(topic_names))
+        self.assertTrue(all(docs[-1].topics.is_loaded(topic_name) for topic_name in docs[-1].topics))
+
+        # The first board got evicted, so it loads again (and evicts the last one)
+        topic_name = next(iter(docs[0].topics))
+        self.assertFalse(docs[0].topics.is_loaded(topic_name))
+        self.assertIsNotNone(docs[0].topics[topic_name])
+        self.assertTrue(docs[0].topics.is_loaded(topic_name))
+        self.assertEqual(topic_cache.cache_stats["misses"], len(topic_names) + 1)
+        self.assertEqual(topic_cache.cache_stats["resident_boards"], 1)
+
+        # Evicted boards are still the same as their records, so none of them get written again
+        board_records = [(board_entry["key"], board_entry["data"]) for board_entry in
+                         topic_cache_utils.load_segment_index(topic_cache.topic_cache_dir_path())[topic_cache_utils.SEGMENT_INDEX_BOARDS_KEY]]
+        topic_cache.write()
+        self.assertEqual([(board_entry["key"], board_entry["data"]) for board_entry in
+                          topic_cache_utils.load_segment_index(topic_cache.topic_cache_dir_path())[topic_cache_utils.SEGMENT_INDEX_BOARDS_KEY]], board_records)
+        self.reload_compiler_cache()
+        self.assertEqual(self.topic_names(), topic_names)
+
+    def test_topic_record_round_trip(self):
+        """
+        Test compiled topics encode to compact records that decode back to the same topics, whether they hold long text or not
+        """
+        self.compile_and_write()
+        self.set_lazy_loading(False)
+        self.reload_compiler_cache()
+        topics = {topic_name: topic_obj for doc in compiler_cache.get_instance().topics.items for topic_name, topic_obj in doc.topics.items()}
+
+        codec = topic_record_codec.TopicRecordCodec()
+        records = {topic_name: codec.encode(topic_name, topic_obj) for topic_name, topic_obj in topics.items()}
+        self.assertTrue(any(codec.is_compact(record) for record in records.values()), msg="Expected compiled topics to encode to compact records")
+
+        # Decoding only needs the schemas, as stored in the segment index
+        decoder = pickle.loads(pickle.dumps(codec))
+        self.assertEqual(decoder.schemas, codec.schemas)
+        for topic_name, record in records.items():
+            decoded_topic_name, decoded_topic_obj = decoder.decode(memoryview(record))
+            self.assertEqual(decoded_topic_name, topic_name)
+            self.assert_same_topic(topics[topic_name], decoded_topic_obj, topic_name)
+
+            # Builds that predate compact records read them as generic pickles
+            (generic_topic_name, generic_topic_obj), = pickle.loads(decoder.generic_record(memoryview(record))).items()
+            self.assertEqual(generic_topic_name, topic_name)
+            self.assert_same_topic(topics[topic_name], generic_topic_obj, topic_name)
+
+        # Long text gets stored as an out-of-band buffer instead of inside the pickle stream
+        topic_name, topic_obj = next((topic_name, topic_obj) for topic_name, topic_obj in topics.items()
+                                     if codec.is_compact(records[topic_name]) and any(type(value) is str for value in vars(topic_obj).values()))
+        long_topic_obj = copy.copy(topic_obj)
+        attribute_name = next(attribute_name for attribute_name, value in vars(topic_obj).items() if type(value) is str)
+        setattr(long_topic_obj, attribute_name, "x" * topic_record_codec.OUT_OF_BAND_TEXT_LENGTH)
+        record = codec.encode(topic_name, long_topic_obj)
+        self.assertGreaterEqual(topic_record_codec._RECORD_HEADER.unpack_from(record)[2], 1, msg="Expected the long text to be an out-of-band buffer")
+        decoded_topic_name, decoded_topic_obj = codec.decode(memoryview(record))
+        self.assert_same_topic(long_topic_obj, decoded_topic_obj, topic_name)
+
+    def test_shared_topic_values(self):
+        """
+        Test equal strings & tags of loaded topics end up as a single shared object, while other values are left alone
+        """
+        # Built at runtime, so none of them is interned yet
+        run_id = uuid.uuid4().hex
+        new_string = lambda name: "_".join([name, run_id])
+        unshared_tag = object()
+        first_topic = SimpleNamespace(other_topic_names=[new_string("topic")], sel_tags=[SharedTag(new_string("tag")), SharedTag(new_string("tag"))],
+                                      content_tags=(SharedTag(new_string("tag")),), flex_sel_tags=[unshared_tag], text=new_string("text"))
+        second_topic = SimpleNamespace(other_topic_names=[new_string("topic")], sel_tags=[SharedTag(new_string("tag"))], text=new_string("text"))
+
+        topic_cache = compiler_cache.get_instance().topics.__class__()
+        for topic_obj in [first_topic, second_topic]:
+            self.assertIs(topic_cache_utils.share_topic_values(topic_cache, topic_obj), topic_obj)
+
+        shared_tag = first_topic.sel_tags[0]
+        self.assertIs(first_topic.sel_tags[1], shared_tag)
+        self.assertIs(first_topic.content_tags[0], shared_tag)
+        self.assertIs(second_topic.sel_tags[0], shared_tag)
+        self.assertIs(second_topic.other_topic_names[0], first_topic.other_topic_names[0])
+        self.assertIs(sys.intern(new_string("tag")), shared_tag.name)
+        # Tags that don't compare by value, and attributes that rarely repeat, are left alone
+        self.assertIs(first_topic.flex_sel_tags[0], unshared_tag)
+        self.assertIsNot(second_topic.text, first_topic.text)
+
+        sharing_stats = topic_cache.sharing_stats
+        self.assertEqual(sharing_stats["interned_strings"], 1)
+        self.assertEqual(sharing_stats["shared_tags"], 3)
+        self.assertGreater(sharing_stats["saved_bytes"], 0)
+
+        # Topics loaded from the topic cache file go through the same sharing, topic names included
+        self.compile_and_write()
+        self.set_lazy_loading(False)
+        self.reload_compiler_cache()
+        for doc in compiler_cache.get_instance().topics.items:
+            for topic_name in doc.topics:
+                self.assertIs(sys.intern(topic_name), topic_name, msg=f"Expected topic name '{topic_name}' to be interned")
+
+    def test_snapshot_switch_back(self):
+        """
+        Test switching back to a previously compiled source tree (i.e. a git branch) loads its snapshot, so no source file gets compiled again
+        """
+        segment_index = self.compile_and_write()
+        topic_names = self.topic_names()
+        board_records = [(board_entry["key"], board_entry["data"]) for board_entry in segment_index[topic_cache_utils.SEGMENT_INDEX_BOARDS_KEY]]
+        changed_filepath = segment_index[topic_cache_utils.SEGMENT_INDEX_BOARDS_KEY][0]["filepath"]
+        with open(changed_filepath, "rb") as f:
+            original_content = f.read()
+
+        # "Switch" to a source tree where the file changed: it gets compiled again, and written as a second snapshot
+        self.change_source_file(changed_filepath)
+        self.reload_compiler_cache()
+        self.assertEqual(compiler_cache.get_instance().topics.files_to_recompile, [changed_filepath])
+        segment_index = self.compile_and_write()
+        topic_cache = compiler_cache.get_instance().topics
+        self.assertEqual(len(topic_cache_utils.load_snapshots(topic_cache.topic_cache_dir_path(), segment_index[topic_cache_utils.SEGMENT_INDEX_SEGMENT_KEY])), 2)
+
+        # Switch back: the first snapshot still matches every source file
+        with open(changed_filepath, "wb") as f:
+            f.write(original_content)
+        self.reload_compiler_cache()
+        topic_cache = compiler_cache.get_instance().topics
+        self.assertEqual(topic_cache.files_to_recompile, [])
+        self.assertEqual(self.topic_names(), topic_names)
+
+        # Nothing got compiled, so every board still points at the records of the first compile
+        segment_index = self.compile_and_write()
+        self.assertEqual([(board_entry["key"], board_entry["data"]) for board_entry in segment_index[topic_cache_utils.SEGMENT_INDEX_BOARDS_KEY]], board_records)
+
+    def test_shared_store_fetch(self):
+        """
+        Test boards left out of a load come back from the shared store another build published them to once their source file compiles again,
+        Which only skips compiling its topics: its output still gets rendered
+        """
+        self.use_shared_store()
+        segment_index = self.compile_and_write()
+        topic_names = self.topic_names()
+        board_entry = segment_index[topic_cache_utils.SEGMENT_INDEX_BOARDS_KEY][0]
+        self.corrupt_topic_record(segment_index, board_entry)
+
+        self.set_lazy_loading(False)
+        self.reload_compiler_cache()
+        topic_cache = compiler_cache.get_instance().topics
+        self.assertEqual(topic_cache.files_to_recompile, [board_entry["filepath"]])
+        # Only looked up once the compiler gets to it
+        self.assertEqual(topic_cache.shared_store.stats["hits"], 0)
+
+        rendered_files = self.compile_and_render()
+        self.assertIn(board_entry["filepath"], rendered_files)
+        self.assertEqual(self.topic_names(), topic_names)
+        self.assertEqual(topic_cache.shared_store.stats["hits"], 1)
+        compile_stats = topic_cache.compile_stats
+        self.assertEqual(compile_stats["files_fetched_from_shared_store"], 1)
+        self.assertEqual(compile_stats["files_compiled"], 0)
+
+    def test_compile_stats_and_inspect(self):
+        """
+        Test every write() reports (and stores) the boards it reused & wrote, and the inspect command reports them along with the segment file's content
+        """
+        segment_index = self.compile_and_write()
+        topic_cache = compiler_cache.get_instance().topics
+        board_count = len(segment_index[topic_cache_utils.SEGMENT_INDEX_BOARDS_KEY])
+        compile_stats = topic_cache.compile_stats
+        self.assertEqual(compile_stats["boards"], board_count)
+        self.assertEqual(compile_stats["board_misses"], board_count)
+        self.assertEqual(compile_stats["files_compiled"], len({doc.filepath for doc in topic_cache.items}))
+        with open(os.path.join(topic_cache.topic_cache_dir_path(), topic_cache_utils.COMPILE_STATS_FILE_NAME)) as f:
+            self.assertEqual(json.load(f), json.loads(json.dumps(compile_stats)))
+
+        # Nothing changed, so every board is reused
+        self.reload_compiler_cache()
+        self.compile_and_write()
+        compile_stats = compiler_cache.get_instance().topics.compile_stats
+        self.assertEqual(compile_stats["board_hits"], board_count)
+        self.assertEqual(compile_stats["board_misses"], 0)
+        self.assertEqual(compile_stats["files_compiled"], 0)
+
+        report = topic_cache_inspect.inspect_topic_cache(2)
+        self.assertEqual(report["boards"], board_count)
+        self.assertEqual(report["stale_bytes"], 0)
+        self.assertLessEqual(len(report["largest_boards"]), 2)
+        self.assertEqual([board["bytes"] for board in report["largest_boards"]], sorted((board["bytes"] for board in report["largest_boards"]), reverse=True))
+        self.assertEqual(report["last_compile"], json.loads(json.dumps(compile_stats)))
+
+        report_output = io.StringIO()
+        with redirect_stdout(report_output):
+            topic_cache_inspect.print_report(report)
+        self.assertIn("Last compile", report_output.getvalue())
+
+    def test_checksum_mismatch_recompiled(self):
+        """
+        Test a board whose topic record changed on disk is left out of the load and compiled again
+        """
+        segment_index = self.compile_and_write()
+        topic_names = self.topic_names()
+        board_entry = segment_index[topic_cache_utils.SEGMENT_INDEX_BOARDS_KEY][0]
+
+        self.corrupt_topic_record(segment_index, board_entry)
+
+        self.set_lazy_loading(False)
+        self.reload_compiler_cache()
+        self.assert_left_out(board_entry["filepath"])
+        self.assert_recompiled(topic_names)
+
+    def test_truncated_segment_recompiled(self):
+        """
+        Test boards past the end of a truncated segment file are left out of the load and compiled again, even when the cache got written in between
+        """
+        segment_index = self.compile_and_write()
+        topic_names = self.topic_names()
+        board_entry = max(segment_index[topic_cache_utils.SEGMENT_INDEX_BOARDS_KEY], key=lambda entry: entry["data"][0])
+
+        # cut the segment file right before the last board's record
+        os.truncate(self.segment_file_path(segment_index), board_entry["data"][0])
+
+        self.reload_compiler_cache()
+        self.assert_left_out(board_entry["filepath"])
+
+        # writing before compiling again must not lose the left out topics
+        compiler_cache.get_instance().write()
+        self.reload_compiler_cache()
+        self.assert_recompiled(topic_names)
+
+    def test_lazy_checksum_checked_on_access(self):
+        """
+        Test lazily loaded boards load without being checked, and a corrupt one gets left out as soon as one of its topics is loaded
+        """
+        segment_index = self.compile_and_write()
+        topic_names = self.topic_names()
+        board_entry = segment_index[topic_cache_utils.SEGMENT_INDEX_BOARDS_KEY][0]
+        self.corrupt_topic_record(segment_index, board_entry)
+
+        self.set_lazy_loading(True)
+        self.reload_compiler_cache()
+        topic_cache = compiler_cache.get_instance().topics
+        # the corrupt board still loaded, since its topic records haven't been read yet
+        self.assertEqual(topic_cache.discarded_boards, [])
+        topic_name = board_entry["topics"][0][0]
+        with self.assertRaises(Exception):
+            topic_cache[topic_name].topics[topic_name]
+        self.assert_left_out(board_entry["filepath"])
+        self.assert_recompiled(topic_names)
+
+    def test_duplicate_topic_name_lookup(self):
+        """
+        Test a topic name held by docs of several files finds the same doc as a scan of the doc list, whatever order they got added in
+        """
+        self.compile_and_write()
+        self.set_lazy_loading(False)
+        self.reload_compiler_cache()
+        docs = compiler_cache.get_instance().topics.items
+        filepaths = sorted({doc.filepath for doc in docs})
+        first_doc = docs.get_by_file(filepaths[0])[0]
+        last_doc = docs.get_by_file(filepaths[-1])[0]
+        topic_obj = next(iter(first_doc.topics.values()))
+
+        topic_name = "UNITTEST_DUPLICATE_TOPIC"
+        for added_docs in [[first_doc, last_doc], [last_doc, first_doc]]:
+            topic_cache = compiler_cache.get_instance().topics.__class__()
+            for doc in added_docs:
+                topic_cache.add(topic_name, doc.board_descriptor, topic_obj)
+            self.assertIs(topic_cache[topic_name], topic_cache.get_by_file(first_doc.filepath)[0])
+            self.assertIs(topic_cache[topic_name], next(doc for doc in topic_cache.items if topic_name in doc.topics))
+
+            topic_cache.remove_objects_for_file(first_doc.filepath)
+            self.assertIs(topic_cache[topic_name], topic_cache.get_by_file(last_doc.filepath)[0])
+            topic_cache.remove_objects_for_file(last_doc.filepath)
+            self.assertNotIn(topic_name, topic_cache)
+
+    def test_shared_store_fresh_checkout(self):
+        """
+        Test a build without any topic cache gets the topics of every source file from the shared store another build published them to,
+        While still rendering the output of every source file
+        """
+        self.use_shared_store()
+        self.compile_and_write()
+        topic_names = self.topic_names()
+        filepaths = sorted({doc.filepath for doc in compiler_cache.get_instance().topics.items})
+
+        # A fresh checkout has neither compiler cache entries nor a topic cache
+        compiler_cache.get_instance().clear()
+        compiler_cache.get_instance().write()
+        topic_cache = compiler_cache.get_instance().topics
+        shutil.rmtree(topic_cache.topic_cache_dir_path())
+        os.remove(os.path.join(CACHE_SUB_DIR, topic_cache.__class__.__name__))
+        shared_topic_store._instances.clear()
+
+        self.set_lazy_loading(False)
+        self.reload_compiler_cache()
+        self.assertEqual(self.topic_names(), [])
+        rendered_files = self.compile_and_render()
+        for filepath in filepaths:
+            self.assertIn(filepath, rendered_files, msg=f"Expected file://{filepath} to be rendered, not only fetched from the shared store")
+        self.assertEqual(self.topic_names(), topic_names)
+        topic_cache = compiler_cache.get_instance().topics
+        self.assertEqual(topic_cache.shared_store.stats["hits"], len(filepaths))
+        self.assertEqual(topic_cache.compile_stats["files_fetched_from_shared_store"], len(filepaths))
+        self.assertEqual(topic_cache.compile_stats["files_compiled"], 0)
@@ -1,40 +1,279 @@
 # README: takes in ChatScript topics and loads/stores them in caches for faster compilations
 
-from typing import Any, Dict, List, Tuple, Union
+from collections import OrderedDict
+from collections.abc import MutableMapping, Sequence
+from contextlib import nullcontext
+from functools import partial
+from typing import Any, Dict, List, Set, Tuple, Union
 
+import bisect
 import copy
+import io
 import logging
 import os
-from functools import partial
 import pathlib
 import pickle
 import shutil
+import time
 import tqdm
+import weakref
 
 from ..... import CACHE_SUB_DIR
 from .... import globals
 from ...logs import log
 from . import corruption
+from . import shared_topic_store
 from . import topic_cache_utils
 from .cache_base import CacheBase
+from .cache_file_reader import MappedCacheFile, load_cache_file
+from .topic_record_codec import TopicRecordCodec
 
 SAFE_SPECIAL_CHARACTER = "_"
 SPECIAL_CHARACTER_LIST = [" ", "/"]
 DOC_FILE_SUFFIX_NAME = "_data"
 TOPIC_CACHE_DIRECTORY_SUFFIX_NAME = "_V"
+MODULE_FILE_EXTENSION = ".chatModule"
 
 
 class TopicCache(CacheBase):
+    class LazyTopics(MutableMapping):
+        """
+        Topic dict of a lazily loaded doc. Every topic starts out as the location of its record in the segment file
+        and only gets decoded the first time it's accessed. Topic names can be checked without loading anything
+        Loaded topics that still match their record can be evicted back to that record (see TopicCache.memory_budget)
+        The board's records only get checked against its checksum the first time one of them is read; a corrupt board
+        Gets handed to the corruption handler (which drops it from the cache) and none of its topics load
+        """
+        class RecordLocation:
+            offset: int
+            length: int
+
+            def __init__(self, offset: int, length: int):
+                self.offset = offset
+                self.length = length
+
+        _segment: MappedCacheFile
+        _codec: TopicRecordCodec
+        _entries: Dict[str, Any]
+        # Record location of every topic that is still the same as its record, whether it's loaded or not
+        _locations: Dict[str, RecordLocation]
+        # Called on every topic access with the number of record bytes it loaded (0 if it was already loaded)
+        _tracker = None
+        # Called with every topic decoded from its record, returning the topic to keep (see topic_cache_utils.share_topic_values())
+        _sharer = None
+        # Segment entry of the board until its records got checked against its checksum (None once they did), see verify()
+        _unverified_entry = None
+        # Called with the segment entry of the board if its records don't match its checksum
+        _corruption_handler = None
+        _is_corrupt = False
+
+        def __init__(self, segment: MappedCacheFile, topic_entries: List[Tuple[str, int, int]], codec: TopicRecordCodec,
+                     board_entry: dict = None):
+            self._segment = segment
+            self._codec = codec
+            self._entries = {}
+            self._locations = {}
+            self._unverified_entry = board_entry
+            for topic_name, offset, length in topic_entries:
+                self._entries[topic_name] = self._locations[topic_name] = self.RecordLocation(offset, length)
+
+        def __getitem__(self, topic_name: str):
+            topic_obj = self._entries[topic_name]
+            loaded_bytes = 0
+            if isinstance(topic_obj, self.RecordLocation):
+                if not self.verify():
+                    raise Exception(f"Topic '{topic_name}' can't be loaded, its board record is corrupt (its source file will be compiled again)")
+                loaded_bytes = topic_obj.length
+                with self._segment.record_view(topic_obj.offset, topic_obj.length) as record:
+                    topic_obj = self._codec.decode(record)[1]
+                if self._sharer is not None:
+                    topic_obj = self._sharer(topic_obj)
+                self._entries[topic_name] = topic_obj
+            if self._tracker is not None:
+                self._tracker(loaded_bytes)
+            return topic_obj
+
+        def __setitem__(self, topic_name: str, topic_obj):
+            self._entries[topic_name] = topic_obj
+            self._locations.pop(topic_name, None)
+
+        def __delitem__(self, topic_name: str):
+            del self._entries[topic_name]
+            self._locations.pop(topic_name, None)
+
+        def __contains__(self, topic_name) -> bool:
+            return topic_name in self._entries
+
+        def __iter__(self):
+            return iter(self._entries)
+
+        def __len__(self) -> int:
+            return len(self._entries)
+
+        def __reduce__(self):
+            # The mapped segment can't be pickled, so pickle as a regular (fully loaded) topic dict instead
+            return dict, (list(self.items()),)
+
+        @property
+        def codec(self) -> TopicRecordCodec:
+            return self._codec
+
+        def is_loaded(self, topic_name: str) -> bool:
+            return not isinstance(self._entries[topic_name], self.RecordLocation)
+
+        def record_view(self, topic_name: str) -> memoryview:
+            """
+            Returns the still encoded record of a topic that hasn't been loaded yet (release the view once done with it)
+            Only meant for boards that passed verify()
+            """
+            location = self._entries[topic_name]
+            return self._segment.record_view(location.offset, location.length)
+
+        def verify(self) -> bool:
+            """
+            Checks every record of the board against its checksum, the first time it's called only
+
+            Returns:
+                False if the board is corrupt
+            """
+            if self._unverified_entry is not None:
+                board_entry = self._unverified_entry
+                self._unverified_entry = None
+                if not topic_cache_utils.verify_board_entry(self._segment, board_entry):
+                    self._is_corrupt = True
+                    if self._corruption_handler is not None:
+                        self._corruption_handler(board_entry)
+            return not self._is_corrupt
+
+        def track(self, tracker):
+            self._tracker = tracker
+
+        def on_corruption(self, corruption_handler):
+            self._corruption_handler = corruption_handler
+
+        def share_values(self, sharer):
+            self._sharer = sharer
+
+        def evict(self) -> int:
+            """
+            Drops every loaded topic that can be loaded again from its record
+
+            Returns:
+                The number of record bytes evicted
+            """
+            evicted_bytes = 0
+            for topic_name, location in self._locations.items():
+                if not isinstance(self._entries[topic_name], self.RecordLocation):
+                    self._entries[topic_name] = location
+                    evicted_bytes += location.length
+            return evicted_bytes
+
+    class DocsView(Sequence):
+        """
+        Read-only view over a list of docs (without copying it) so callers can't modify the cache's doc list
+        """
+        _docs: list
+        _file_index: Dict[str, list]
+
+        def __init__(self, docs: list, file_index: Dict[str, list] = None):
+            self._docs = docs
+            self._file_index = file_index
+
+        def __getitem__(self, index):
+            return self._docs[index]
+
+        def __len__(self) -> int:
+            return len(self._docs)
+
+        def __iter__(self):
+            return iter(self._docs)
+
+        def get_by_file(self, abs_path: str) -> "TopicCache.DocsView":
+            """
+            Returns every doc in this view belonging to this file, without walking the whole view
+            """
+            if self._file_index is None:
+                return TopicCache.DocsView([doc for doc in self._docs if doc.filepath == abs_path])
+            return TopicCache.DocsView(self._file_index.get(abs_path, ()))
+
+    class BoardDescriptor:
+        """
+        Lightweight stand-in for a doc's board, holding only what the topic cache needs to identify it
+        Only the descriptor gets pickled; the full board (and the document it drags along) is resolved when a caller needs it
+        """
+        uuid: str
+        name: str
+        filepath: str
+        order: int
+
+        def __init__(self, board):
+            self.uuid = board.uuid
+            self.name = board.name
+            self.filepath = board.parent.filepath
+            self.order = getattr(board, "order", None)
+            self._board = None
+            try:
+                self._board_ref = weakref.ref(board)
+            except TypeError:
+                # i.e. the plain namespace boards of records written for older build versions
+                self._board_ref = None
+
+        def __getstate__(self) -> dict:
+            state = self.__dict__.copy()
+            state["_board"] = None
+            state["_board_ref"] = None
+            return state
+
+        def resolve(self):
+            """
+            Returns the full board object. Uses the live board if it's still around (i.e. compiled during this run),
+            Otherwise compiles the board's source file again and holds on to the result
+            """
+            board = self._board_ref() if self._board_ref is not None else None
+            if board is None:
+                board = self._board
+            if board is None:
+                # Imported here since the empath document modules import the caches themselves
+                from ... import document
+                from ...modules import module
+                document_class = module.Module if self.filepath.endswith(MODULE_FILE_EXTENSION) else document.Document
+                board = document_class.from_file(self.filepath).get_board(self.uuid)
+                if board is None:
+                    raise Exception(f"Board '{self.name}' ({self.uuid}) no longer exists in file://{self.filepath}")
+                self._board = board
+            return board
+
     class Document:
         filename: str
-        board = None
+        board_descriptor = None
         topics: Dict[str, Any]
+        # True if this doc was unpickled from a record that still held the full board object
+        _is_legacy_record = False
 
         def __init__(self, topic_name: str, board, topic_obj):
-            self.filename = board.parent.filepath
-            self.board = board
+            if not isinstance(board, TopicCache.BoardDescriptor):
+                board = TopicCache.BoardDescriptor(board)
+            self.filename = board.filepath
+            self.board_descriptor = board
             self.topics = {topic_name: topic_obj}
 
+        def __setstate__(self, state: dict):
+            """
+            Docs pickled before board descriptors existed still hold their full board, swap it out for a descriptor
+            """
+            board = state.pop("board", None)
+            self.__dict__.update(state)
+            if board is not None:
+                self.board_descriptor = TopicCache.BoardDescriptor(board)
+                self._is_legacy_record = True
+
+        @property
+        def board(self):
+            """
+            The full board object of this doc, resolved from its descriptor
+            """
+            return self.board_descriptor.resolve()
+
         @property
         def topic_names(self) -> List[str]:
             results = []
@@ -67,7 +306,7 @@ class TopicCache(CacheBase):
                 directory_name = directory_name.replace(character, SAFE_SPECIAL_CHARACTER)
 
             # Remove problematic special characters in the board's name
-            board_name = self.board.name
+            board_name = self.board_descriptor.name
             for character in SPECIAL_CHARACTER_LIST:
                 board_name = board_name.replace(character, SAFE_SPECIAL_CHARACTER)
 
@@ -77,22 +316,54 @@ class TopicCache(CacheBase):
 
         def shallow_copy(self) -> "Document":
             """
-            Creates a shallow copy of the doc object containing only its filename and board object
+            Creates a shallow copy of the doc object containing only its filename and board descriptor
             The topic dict is emptied out in the shallow copy only
             """
             shallow_doc = copy.copy(self)
             shallow_doc.topics = {}
+            shallow_doc.__dict__.pop("_is_legacy_record", None)
             return shallow_doc
 
     _docs = List[Document]
     _instructions = List[Dict]
+    # Lookup indexes kept in sync with the doc list (topic name -> doc, (filepath, board name) -> doc, filepath -> docs)
+    # A topic name held by several docs maps to the first of them in the doc list, the others wait in _shadowed_topics
+    _topic_index = Dict[str, Document]
+    _shadowed_topics = Dict[str, List[Document]]
+    _board_index = Dict[Tuple[str, str], Document]
+    _file_index = Dict[str, List[Document]]
+    # The doc list is always kept sorted by filepath; this holds each doc's filepath at the same position
+    _doc_filepaths = List[str]
+    # Docs that changed since the last write(), plus the segment entry (keyed by doc dir path) of every doc already written
+    _dirty_docs = Set[Document]
+    _segment_entries = Dict[str, dict]
+    _segment_name = str
+    # Encodes the topic records of the segment (its schemas get stored in the segment index)
+    _topic_codec = TopicRecordCodec
+    # The snapshot (key, source file states & board entries) last loaded or written, see snapshot_count
+    # Along with the last known state (mtime, size, digest) of every source file, so unchanged ones never get read again
+    _loaded_snapshot = Dict[str, Any]
+    _source_file_states = Dict[str, Tuple[int, int, bytes]]
+    # Report of the corrupt board records left out during the last load
+    _discarded_boards = List[Dict]
+    # Source files that changed since the loaded snapshot got written (their boards were left out)
+    _changed_files = List[str]
+    # Source files compiled (through add(), loading aside) since the last write(), which publishes them to the shared store,
+    # And source files whose docs came from the shared store instead (they don't need to be compiled again)
+    _compiled_files = Set[str]
+    _shared_files = Set[str]
+    # Counters of the last load & write (i.e. the last compile), see compile_stats
+    _compile_stats = Dict[str, Any]
+    # Lazily loaded docs with loaded topics (least recently used first) along with their loaded record bytes, see memory_budget
+    _resident_docs = "OrderedDict[Document, int]"
+    _resident_bytes = int
+    _cache_stats = Dict[str, int]
+    # Tags shared across every loaded topic (each tag mapped to itself) plus what interning & sharing them saved
+    _shared_tags = Dict[Any, Any]
+    _sharing_stats = Dict[str, int]
 
     def __contains__(self, topic: str) -> bool:
-        for doc in self._docs:
-            topic_names_set = set(doc.topics.keys())
-            if topic in topic_names_set:
-                return True
-        return False
+        return topic in self._topic_index
 
     def __getitem__(self, item) -> Document:
         """
@@ -104,15 +375,13 @@ class TopicCache(CacheBase):
         is_topic_name = type(item) == str
 
         if is_topic_name:
-            for doc in self._docs:
-                if item in doc.topics.keys():
-                    return doc
+            if item in self._topic_index:
+                return self._topic_index[item]
 
             raise Exception(f"'{self.__class__.__name__}' object does not contain item '{item}' ({type(item)})")
         else:
-            for doc in self._docs:
-                if doc.board == item:
-                    return doc
+            if item is not None and (item.parent.filepath, item.name) in self._board_index:
+                return self._board_index[(item.parent.filepath, item.name)]
 
             # Error if not found
             if item is not None:
@@ -124,26 +393,150 @@ class TopicCache(CacheBase):
     def __setitem__(self, key, value):
         raise NotImplementedError()
 
+    def __setstate__(self, state: dict):
+        """
+        TopicCache objects pickled before the lookup indexes existed need them rebuilt from their doc list
+        Ones pickled before dirty tracking existed get every doc rewritten on their next write()
+        """
+        self.__dict__.update(state)
+        if any(attribute_name not in state for attribute_name in topic_cache_utils.INDEX_ATTRIBUTE_NAMES):
+            self._rebuild_indexes()
+        if any(attribute_name not in state for attribute_name in topic_cache_utils.WRITE_STATE_ATTRIBUTE_NAMES):
+            self._dirty_docs = set(self._docs)
+            self._segment_entries = {}
+            self._segment_name = None
+            self._topic_codec = TopicRecordCodec()
+            self._loaded_snapshot = None
+            self._source_file_states = {}
+        if any(attribute_name not in state for attribute_name in topic_cache_utils.MEMORY_ATTRIBUTE_NAMES):
+            self._reset_memory_tracking()
+
     def __init__(self):
         """
         On initialization of new TopicCache object, assign these static values to it
         """
         super().__init__()
-        self._version = 2
-        self._instructions = [
-            { "version": 2, "func": topic_cache_utils.downgrade_v2_to_v1, "extra_args": None },
-            { "version": 2, "func": topic_cache_utils.load_v2, "extra_args": None }
-        ]
+        self._topic_index = {}
+        self._shadowed_topics = {}
+        self._board_index = {}
+        self._file_index = {}
+        self._doc_filepaths = []
+        self._dirty_docs = set()
+        self._segment_entries = {}
+        self._segment_name = None
+        self._topic_codec = TopicRecordCodec()
+        self._loaded_snapshot = None
+        self._source_file_states = {}
+        self._discarded_boards = []
+        self._changed_files = []
+        self._compiled_files = set()
+        self._shared_files = set()
+        self._compile_stats = {}
+        self._reset_memory_tracking()
+        self._version = 3
+        self._instructions = topic_cache_utils.version_instructions(3)
 
     @property
-    def items(self) -> list:
-        self._docs.sort(key=lambda x: x.filepath)
-        return self._docs
+    def items(self) -> DocsView:
+        return self.DocsView(self._docs, self._file_index)
 
     @property
     def version(self) -> int:
         return self._version
 
+    @property
+    def lazy_loading(self) -> bool:
+        """
+        If True, only board records are loaded up front and each topic is loaded the first time it's accessed
+        Always True with a memory budget, since only lazily loaded topics can be evicted
+        """
+        return getattr(globals, "LAZY_LOAD_TOPIC_CACHE", False) or self.memory_budget is not None
+
+    @property
+    def memory_budget(self) -> Union[int, None]:
+        """
+        Maximum number of record bytes worth of lazily loaded topics to keep in memory (None for no limit)
+        Past it, the least recently used boards get their topics evicted back to their records (reloaded on next access)
+        Record bytes are a proxy for memory use; loaded topic objects take up a few times more than their records
+        Evicted topics are reloaded as they were written, so with a budget, cached topic objects must be treated as read-only
+        """
+        return getattr(globals, "TOPIC_CACHE_MEMORY_BUDGET_BYTES", None)
+
+    @property
+    def cache_stats(self) -> Dict[str, int]:
+        """
+        Topic access counters of lazily loaded docs: hits (already loaded), misses (loaded from their record),
+        Evictions (boards evicted), plus the record bytes and number of boards currently loaded
+        """
+        return {
+            **self._cache_stats,
+            "resident_bytes": self._resident_bytes,
+            "resident_boards": len(self._resident_docs)
+        }
+
+    @property
+    def sharing_stats(self) -> Dict[str, int]:
+        """
+        Memory report of loading: repeated topic strings that got interned, repeated tags that got shared
+        And the bytes saved by dropping their duplicates (lazily loaded topics only count once they're loaded)
+        """
+        return dict(self._sharing_stats)
+
+    @property
+    def snapshot_count(self) -> int:
+        """
+        Number of snapshots (one per source tree, i.e. git branch) kept in the segment file, least recently used ones get evicted first
+        Snapshots share the records of every board that is the same between them, so switching back to a previously
+        Compiled source tree only needs to recompile the source files that differ from its snapshot
+        """
+        return max(1, getattr(globals, "TOPIC_CACHE_SNAPSHOTS", topic_cache_utils.DEFAULT_SNAPSHOT_COUNT))
+
+    @property
+    def load_workers(self) -> int:
+        """
+        Number of boards loaded at the same time from older build versions (defaults to the CPU count); 1 loads them one by one
+        """
+        return getattr(globals, "TOPIC_CACHE_LOAD_WORKERS", None) or os.cpu_count() or 1
+
+    @property
+    def load_in_processes(self) -> bool:
+        """
+        If True, the load workers are processes instead of threads so unpickling isn't held back by the GIL
+        """
+        return getattr(globals, "TOPIC_CACHE_LOAD_IN_PROCESSES", False)
+
+    @property
+    def discarded_boards(self) -> List[Dict]:
+        """
+        Every corrupt board record left out during the last load (key, filepath, board name and reason)
+        """
+        return self._discarded_boards
+
+    @property
+    def files_to_recompile(self) -> List[str]:
+        """
+        Source files that lost boards to corruption during the last load, or that changed since the loaded snapshot got written,
+        And need to be compiled again (unless the shared store had their boards). Loading drops them from the compiler cache
+        So the compile that follows picks them up, see schedule_recompile()
+        """
+        return sorted(({discarded_board["filepath"] for discarded_board in self._discarded_boards if discarded_board["filepath"] is not None} |
+                       set(self._changed_files)) - self._shared_files)
+
+    @property
+    def compile_stats(self) -> Dict[str, Any]:
+        """
+        Counters of the last compile: boards reused (hits) & written (misses), records & bytes written, how long loading & writing took,
+        Along with the topic access, sharing & shared store counters. write() also stores them in the topic cache directory as JSON
+        """
+        return dict(self._compile_stats)
+
+    @property
+    def shared_store(self) -> Union[shared_topic_store.SharedTopicStore, None]:
+        """
+        Store of compiled boards shared with other machines & CI jobs (None unless SHARED_TOPIC_CACHE_DIR is set)
+        """
+        return shared_topic_store.get_instance(os.path.basename(self.topic_cache_dir_path()))
+
     @property
     def instructions(self) -> list:
         return self._instructions
@@ -154,47 +547,277 @@ class TopicCache(CacheBase):
 
         Args:
             topic_name: the generated topic name
-            board_obj: the topic's board object
+            board_obj: the topic's board object (or its board descriptor)
             topic_obj: the topic class object
         """
+        board_descriptor = board_obj if isinstance(board_obj, self.BoardDescriptor) else self.BoardDescriptor(board_obj)
+        # The first topic of a source file comes in once the compiler compiles it, another machine (or CI job) may have already compiled it:
+        # Its docs then come from the shared store, and so do the topics the compiler goes on adding (its output still gets rendered as usual)
+        if board_descriptor.filepath in self._shared_files:
+            return
+        if board_descriptor.filepath not in self._compiled_files and not self._needs_loading_from_file and self.fetch_shared(board_descriptor.filepath):
+            return
+        self._compiled_files.add(board_descriptor.filepath)
+
         # Check if this new doc has an existing board...
-        board_obj_in_cache = None
-        for doc_obj in self._docs:
-            if board_obj.parent.filepath == doc_obj.filepath and board_obj.name == doc_obj.board.name:
-                board_obj_in_cache = doc_obj
-                break
+        board_obj_in_cache = self._board_index.get((board_descriptor.filepath, board_descriptor.name))
 
         # ...And if so, update it's topic contents
         if board_obj_in_cache is not None:
             if topic_name in board_obj_in_cache.topics:
-                raise Exception(f"Board '{board_obj.name}' already contains a topic named '{topic_name}' in file://{board_obj.parent.filepath} {log.context(board_obj)}")
+                raise Exception(f"Board '{board_descriptor.name}' already contains a topic named '{topic_name}' in file://{board_descriptor.filepath} {log.context(board_obj)}")
             board_obj_in_cache.topics[topic_name] = topic_obj
+            self._index_topic(topic_name, board_obj_in_cache)
+            self._dirty_docs.add(board_obj_in_cache)
             logging.debug(f"Updated with '{topic_name}' to board '{board_obj.name}'. Total {topic_cache_utils.DOCS_ATTRIBUTE_NAME} '{len(self._docs)}'.")
         # Else create a new doc object
         else:
-            doc = self.Document(topic_name=topic_name, board=board_obj, topic_obj=topic_obj)
-            self._docs.append(doc)
+            doc = self.Document(topic_name=topic_name, board=board_descriptor, topic_obj=topic_obj)
+            self.add_doc(doc)
             logging.debug(f"Added '{topic_name}' with new board '{board_obj.name}' to the doc list. Total {topic_cache_utils.DOCS_ATTRIBUTE_NAME} '{len(self._docs)}'.")
 
-    def clear(self, **kwargs):
-        self._docs = []
+    def add_doc(self, doc: Document, is_dirty: bool = True):
+        """
+        Adds an already built doc (i.e. one loaded from a topic sub cache) to the doc list and its lookup indexes
+        Docs with the same filepath stay in the order they were added, same as a stable sort by filepath
 
-    def get_by_file(self, abs_path: str) -> list:
-        results = []
+        Args:
+            doc: the doc to add
+            is_dirty: False only if this doc was loaded as is from the current segment file, so write() doesn't rewrite it
+        """
+        position = bisect.bisect_right(self._doc_filepaths, doc.filepath)
+        self._docs.insert(position, doc)
+        self._doc_filepaths.insert(position, doc.filepath)
+        self._index_doc(doc)
+        if is_dirty:
+            self._dirty_docs.add(doc)
+
+    def remove_objects_for_file(self, abs_path: str, **kwargs) -> int:
+        """
+        Removes every doc (i.e. board and its topics) compiled from this file so it gets compiled again
+        Their records are dropped from the segment file on the next write()
+
+        Args:
+            abs_path: absolute filepath of the source file
+
+        Returns:
+            The number of docs removed
+        """
+        docs = self._file_index.pop(abs_path, [])
+        if not docs:
+            return 0
+
+        start = bisect.bisect_left(self._doc_filepaths, abs_path)
+        end = bisect.bisect_right(self._doc_filepaths, abs_path)
+        del self._docs[start:end]
+        del self._doc_filepaths[start:end]
+        for doc in docs:
+            self._board_index.pop((doc.filepath, doc.board_descriptor.name), None)
+            for topic_name in doc.topics:
+                self._unindex_topic(topic_name, doc)
+            self._dirty_docs.discard(doc)
+            self._resident_bytes -= self._resident_docs.pop(doc, 0)
+        # Compiling it again looks it up in the shared store again
+        self._compiled_files.discard(abs_path)
+        self._shared_files.discard(abs_path)
+
+        logging.debug(f"Removed '{len(docs)}' {topic_cache_utils.DOCS_ATTRIBUTE_NAME} of file://{abs_path}. Total {topic_cache_utils.DOCS_ATTRIBUTE_NAME} '{len(self._docs)}'.")
+        return len(docs)
+
+    def schedule_recompile(self, abs_paths: List[str]):
+        """
+        Drops every compiler cache object of these source files (i.e. ones that lost boards during the last load),
+        So the compiler sees them as new and compiles them again instead of the next write() losing their topics for good
+
+        Args:
+            abs_paths: absolute filepaths of the source files
+        """
+        if not abs_paths:
+            return
+        # Imported here since the compiler cache imports the caches themselves
+        from .. import compiler_cache
+        c_cache = compiler_cache.get_instance()
+        for abs_path in abs_paths:
+            c_cache.remove_objects_for_file(abs_path=abs_path)
+        logging.info(f"Scheduled '{len(abs_paths)}' source files for recompilation: {abs_paths}")
+
+    def fetch_shared(self, abs_path: str) -> bool:
+        """
+        Replaces the docs of a source file with the ones another machine (or CI job) compiled from the exact same inputs
+        add() calls it once the compiler starts compiling a source file, so only the topics get reused: the output still gets rendered
+
+        Args:
+            abs_path: absolute filepath of the source file
+
+        Returns:
+            True if the shared store had the source file's docs
+        """
+        if self.shared_store is None:
+            return False
+
+        docs = self.shared_store.fetch(abs_path)
+        if docs is None:
+            return False
+
+        self.remove_objects_for_file(abs_path)
+        for doc in docs:
+            self.add_doc(doc)
+        self._shared_files.add(abs_path)
+        logging.debug(f"Fetched '{len(docs)}' {topic_cache_utils.DOCS_ATTRIBUTE_NAME} of file://{abs_path} from the shared topic cache.")
+        return True
+
+    def publish_shared(self, abs_path: str, related_files: List[str] = None):
+        """
+        Publishes the docs compiled from a source file to the shared store, so no other machine (or CI job) has to compile it again
+        write() already publishes every source file compiled since the last write()
+
+        Args:
+            abs_path: absolute filepath of the source file
+            related_files: every file the source file was compiled with, defaults to the ones the compiler cache recorded
+        """
+        if self.shared_store is None or abs_path not in self._file_index:
+            return
+
+        if related_files is None:
+            related_files = shared_topic_store.related_files(abs_path)
+        try:
+            self.shared_store.publish(abs_path, related_files, self._file_index[abs_path])
+        except OSError as e:
+            # i.e. the shared directory isn't mounted; the local topic cache still has everything
+            logging.warning(f"Could not publish file://{abs_path} to the shared topic cache: {e}")
+
+    def _index_doc(self, doc: Document):
+        self._board_index[(doc.filepath, doc.board_descriptor.name)] = doc
+        self._file_index.setdefault(doc.filepath, []).append(doc)
+        for topic_name in doc.topics:
+            self._index_topic(topic_name, doc)
+        if isinstance(doc.topics, self.LazyTopics):
+            doc.topics.track(partial(self._track_topic_access, doc))
+            doc.topics.on_corruption(partial(self._discard_corrupt_doc, doc))
+
+    def _index_topic(self, topic_name: str, doc: Document):
+        """
+        Points a topic name at this doc, unless a doc before it in the doc list already holds that name
+        """
+        holder = self._topic_index.setdefault(topic_name, doc)
+        if holder is doc:
+            return
+        if self._doc_order(doc) < self._doc_order(holder):
+            self._topic_index[topic_name] = doc
+            doc = holder
+        self._shadowed_topics.setdefault(topic_name, []).append(doc)
+
+    def _unindex_topic(self, topic_name: str, doc: Document):
+        """
+        Drops a topic name of a doc whose source file got removed, pointing the name at the first doc of another file still holding it
+        """
+        shadowed_docs = [shadowed_doc for shadowed_doc in self._shadowed_topics.pop(topic_name, []) if shadowed_doc.filepath != doc.filepath]
+        if self._topic_index.get(topic_name) is doc:
+            del self._topic_index[topic_name]
+            if shadowed_docs:
+                first_doc = min(shadowed_docs, key=self._doc_order)
+                shadowed_docs.remove(first_doc)
+                self._topic_index[topic_name] = first_doc
+        if shadowed_docs:
+            self._shadowed_topics[topic_name] = shadowed_docs
+
+    def _doc_order(self, doc: Document) -> Tuple[str, int]:
+        """
+        Returns the position of a doc in the doc list: its filepath, then the order docs of that file were added in
+        """
+        return doc.filepath, self._file_index[doc.filepath].index(doc)
+
+    def _discard_corrupt_doc(self, doc: Document, board_entry: dict):
+        """
+        Drops a lazily loaded doc whose records turned out to be corrupt once first read, the same way loading drops corrupt boards:
+        Every doc of its source file goes, and the source file gets scheduled for recompilation
+
+        Args:
+            doc: the corrupt doc
+            board_entry: the doc's segment entry
+        """
+        topic_cache_utils.discard_board_entry(self, { **board_entry, "filepath": doc.filepath, "board": doc.board_descriptor.name }, "checksum mismatch")
+        self.remove_objects_for_file(doc.filepath)
+        self._segment_entries.pop(board_entry["key"], None)
+        topic_cache_utils.write_discarded_boards_report(self.topic_cache_dir_path(), self._discarded_boards)
+        self.schedule_recompile([doc.filepath])
+
+    def _track_topic_access(self, doc: Document, loaded_bytes: int):
+        """
+        Marks a lazily loaded doc as the most recently used one, then evicts the least recently used docs while over the memory budget
+
+        Args:
+            doc: the doc whose topic was accessed
+            loaded_bytes: number of record bytes this access loaded (0 on a hit)
+        """
+        self._cache_stats["misses" if loaded_bytes else "hits"] += 1
+        resident_bytes = self._resident_docs.pop(doc, 0) + loaded_bytes
+        if resident_bytes:
+            self._resident_docs[doc] = resident_bytes
+            self._resident_bytes += loaded_bytes
+
+        memory_budget = self.memory_budget
+        if memory_budget is None:
+            return
+        # Never evict the doc being accessed (it's always the last one)
+        while self._resident_bytes > memory_budget and len(self._resident_docs) > 1:
+            evicted_doc, evicted_bytes = self._resident_docs.popitem(last=False)
+            evicted_doc.topics.evict()
+            self._resident_bytes -= evicted_bytes
+            self._cache_stats["evictions"] += 1
+
+    def _reset_memory_tracking(self):
+        self._resident_docs = OrderedDict()
+        self._resident_bytes = 0
+        self._cache_stats = { "hits": 0, "misses": 0, "evictions": 0 }
+        self._shared_tags = {}
+        self._sharing_stats = { "interned_strings": 0, "shared_tags": 0, "saved_bytes": 0 }
+
+    def _rebuild_indexes(self):
+        self._docs = sorted(self._docs, key=lambda x: x.filepath)
+        self._doc_filepaths = [doc.filepath for doc in self._docs]
+        self._topic_index = {}
+        self._shadowed_topics = {}
+        self._board_index = {}
+        self._file_index = {}
         for doc in self._docs:
-            if doc.filepath == abs_path:
-                results.append(doc)
+            self._index_doc(doc)
 
-        return results
+    def clear(self, **kwargs):
+        self._docs = []
+        self._doc_filepaths = []
+        self._topic_index = {}
+        self._shadowed_topics = {}
+        self._board_index = {}
+        self._file_index = {}
+        self._dirty_docs = set()
+        self._segment_entries = {}
+        self._topic_codec = TopicRecordCodec()
+        self._loaded_snapshot = None
+        self._discarded_boards = []
+        self._changed_files = []
+        self._compiled_files = set()
+        self._shared_files = set()
+        self._compile_stats = {}
+        self._reset_memory_tracking()
 
-    def topic_cache_dir_path(self) -> str:
+    def get_by_file(self, abs_path: str) -> DocsView:
+        return self.DocsView(self._file_index.get(abs_path, ()))
+
+    def topic_cache_dir_path(self, version: int = None) -> str:
         """
         Grabs the topic cache's directory path and returns it as a subdirectory of "sub_caches".
         Also appends the topic Cache's version number to the end of the basename (as an index)
+
+        Args:
+            version: build version of the directory to grab, defaults to the topic cache's current build version
         """
+        if version is None and hasattr(self, topic_cache_utils.VERSION_ATTRIBUTE_NAME):
+            version = self.version
+
         topic_cache_dir_name = self.__class__.__name__
-        if hasattr(self, topic_cache_utils.VERSION_ATTRIBUTE_NAME):
-            topic_cache_dir_name += TOPIC_CACHE_DIRECTORY_SUFFIX_NAME + str(self.version)
+        if version is not None:
+            topic_cache_dir_name += TOPIC_CACHE_DIRECTORY_SUFFIX_NAME + str(version)
         
         topic_cache_dir_path = os.path.join(CACHE_SUB_DIR, topic_cache_dir_name)
         return topic_cache_dir_path
@@ -206,68 +829,283 @@ class TopicCache(CacheBase):
         """
         shallow_topicCache = copy.copy(self)
         shallow_topicCache._docs = {}
+        shallow_topicCache._doc_filepaths = []
+        shallow_topicCache._topic_index = {}
+        shallow_topicCache._shadowed_topics = {}
+        shallow_topicCache._board_index = {}
+        shallow_topicCache._file_index = {}
+        shallow_topicCache._dirty_docs = set()
+        shallow_topicCache._segment_entries = {}
+        shallow_topicCache._segment_name = None
+        # Builds that predate compact topic records have to be able to unpickle the TopicCache file
+        shallow_topicCache._topic_codec = None
+        shallow_topicCache._loaded_snapshot = None
+        shallow_topicCache._source_file_states = {}
+        shallow_topicCache._discarded_boards = []
+        shallow_topicCache._changed_files = []
+        shallow_topicCache._compiled_files = set()
+        shallow_topicCache._shared_files = set()
+        shallow_topicCache._compile_stats = {}
+        shallow_topicCache._reset_memory_tracking()
         return shallow_topicCache
 
+    def _run_downgrade_instructions(self, version: int, doc_data_files: int = 0, doc_topic_files: int = 0) -> Tuple[int, int]:
+        """
+        Calls the downgrade instruction of the current build version, over and over, until the topic cache files on disk
+        Are converted down to this build version. Every downgrade streams the files, so the doc list is never loaded
+        """
+        while self.version > version:
+            downgrade_instructions = topic_cache_utils.find_instructions(self.instructions, "downgrade_")
+            if not downgrade_instructions:
+                raise NotImplementedError(f"No downgrade instructions available for version '{self.version}'.")
+            instruction = downgrade_instructions[0]
+            doc_data_files, doc_topic_files = instruction["func"](self, doc_data_files, doc_topic_files, instruction["extra_args"])
+
+        return doc_data_files, doc_topic_files
+
+    def downgrade(self, version: int):
+        """
+        Converts the topic cache files on disk (as of the last write()) down to an older build version,
+        So switching to a branch with an older compiler costs a format conversion instead of a full recompile
+        The doc list gets cleared and won't be written again until it's reloaded
+
+        Args:
+            version: the build version the older compiler is on
+        """
+        topic_cache_file = load_cache_file(os.path.join(CACHE_SUB_DIR, self.__class__.__name__))
+        setattr(self, topic_cache_utils.VERSION_ATTRIBUTE_NAME, getattr(topic_cache_file, topic_cache_utils.VERSION_ATTRIBUTE_NAME, 1))
+        setattr(self, topic_cache_utils.INSTRUCTIONS_ATTRIBUTE_NAME, getattr(topic_cache_file, topic_cache_utils.INSTRUCTIONS_ATTRIBUTE_NAME, []))
+
+        self.clear()
+        self._needs_loading_from_file = True
+        doc_data_files, doc_topic_files = self._run_downgrade_instructions(version)
+        logging.info(f"Downgraded '{self.__class__.__name__}' to version '{self.version}'. Total number of data records converted '{doc_data_files}'. "
+                     f"Total number of topic records converted '{doc_topic_files}'.")
+
     def write(self):
         # Don't overwrite if not yet loaded
         if self.needs_loading_from_file:
             return
+        write_start = time.perf_counter()
 
         # Store the newest build version of TopicCache inside the TopicCache file
         # Using a shallow copy of TopicCache to only store instructions and build version
         # Shallow copy ensures we don't store duplicated doc list content
         topic_cache_dir_path = self.topic_cache_dir_path()
         topic_cache_filepath = os.path.join(CACHE_SUB_DIR, self.__class__.__name__)
-        with open(topic_cache_filepath, "wb") as f:
-            pickle.dump(self.shallow_copy(), f, pickle.DEFAULT_PROTOCOL)
+        topic_cache_utils.dump_cache_file(topic_cache_filepath, self.shallow_copy())
 
-        # Delete any and all existing TopicCache directory
+        # Delete the TopicCache directories of every other build version
+        # The current build version's directory gets updated in place instead
         cache_files = pathlib.Path(CACHE_SUB_DIR).glob('*')
         for cache_file in cache_files:
-            if os.path.isdir(cache_file) and self.__class__.__name__ in os.path.basename(cache_file):
+            if os.path.isdir(cache_file) and self.__class__.__name__ in os.path.basename(cache_file) and str(cache_file) != topic_cache_dir_path:
                 logging.info(f"Removing directory '{cache_file}'.")
                 shutil.rmtree(cache_file)
+        os.makedirs(topic_cache_dir_path, exist_ok=True)
+
+        # Garbage collect the docs of every source file that got deleted since it was compiled
+        removed_files = [abs_path for abs_path in self._file_index if not os.path.exists(abs_path)]
+        for abs_path in removed_files:
+            logging.info(f"Source file://{abs_path} no longer exists, removing its {topic_cache_utils.DOCS_ATTRIBUTE_NAME}.")
+            self.remove_objects_for_file(abs_path)
+
+        # Every board & topic record gets packed into a single append-only segment file
+        # The index file stores where each record lives inside that segment
+        # Only dirty docs get new records; every other doc keeps pointing at its already written records
+        old_segment_path = None
+        if self._segment_name is not None:
+            old_segment_path = os.path.join(topic_cache_dir_path, self._segment_name)
+        if old_segment_path is None or not os.path.exists(old_segment_path):
+            old_segment_path = None
+            self._segment_entries = {}
+
+        # The index is the snapshot of the source tree being written, while snapshots of previously written source trees
+        # Keep sharing the same segment until they're the least recently used ones past snapshot_count
+        source_file_states = {}
+        for abs_path in self._file_index:
+            source_file_state = topic_cache_utils.source_file_state(abs_path, self._source_file_states.get(abs_path))
+            if source_file_state is not None:
+                source_file_states[abs_path] = source_file_state
+        self._source_file_states = source_file_states
+        snapshot_key = topic_cache_utils.snapshot_key(source_file_states)
+
+        retained_snapshots = {}
+        if old_segment_path is not None:
+            for snapshot in topic_cache_utils.load_snapshots(topic_cache_dir_path, self._segment_name) + [self._loaded_snapshot]:
+                if snapshot is not None:
+                    retained_snapshots.pop(snapshot["key"], None)
+                    retained_snapshots[snapshot["key"]] = snapshot
+        retained_snapshots.pop(snapshot_key, None)
+        # Snapshots with records past the end of the segment (i.e. a truncated segment file) can't be switched back to anymore
+        if old_segment_path is not None:
+            old_segment_size = os.path.getsize(old_segment_path)
+            for key in [key for key, snapshot in retained_snapshots.items()
+                        if not all(topic_cache_utils.board_entry_in_bounds(board_entry, old_segment_size) for board_entry in snapshot["boards"])]:
+                logging.warning(f"Dropping topic cache snapshot '{key}', some of its records are missing from segment file '{self._segment_name}'.")
+                del retained_snapshots[key]
+        snapshots = list(retained_snapshots.values())[max(0, len(retained_snapshots) - (self.snapshot_count - 1)):]
+
+        # Board records are content addressed by their key & checksum, so a rewritten board that's the same as
+        # One of another snapshot (i.e. switching back to a branch) points at those records instead of writing its own
+        content_entries = { (board_entry["key"], board_entry["checksum"]): board_entry
+                            for snapshot in snapshots for board_entry in snapshot["boards"] if "checksum" in board_entry }
 
-        # Keep track of how many files we're writing
-        # This should match the number of files we loaded right before this
+        doc_entries = []
+        doc_dir_paths = set()
+        # Unloaded topics of rewritten docs get copied over as is, so their records have to pass their checksum first
+        # (a corrupt doc gets dropped, along with every other doc of its source file)
+        for doc in [doc for doc in self._dirty_docs if isinstance(doc.topics, self.LazyTopics)]:
+            doc.topics.verify()
+
+        for doc in self._docs:
+            # {doc_dir_path}_{board_name} is still the unique key of each board inside the segment
+            doc_dir_path = doc.doc_dir_path()
+            if doc_dir_path in doc_dir_paths:
+                corruption.set_corrupted(True, message=f"This board record '{doc_dir_path}' already exists in the topic cache.")
+                raise Exception(f"Cache file write error. Halting process to prevent overwrite of this board record: '{doc_dir_path}'. "
+                                f"Please re-run last command (twice if another error pops up shortly after re-running command) {log.context(doc.board_descriptor)}")
+            doc_dir_paths.add(doc_dir_path)
+
+            board_entry = None
+            if doc not in self._dirty_docs:
+                board_entry = self._segment_entries.get(doc_dir_path)
+            doc_entries.append((doc, doc_dir_path, board_entry))
+
+        # Appending keeps the stale records of rewritten & removed docs around, so once they take up too much
+        # Of the segment, write a new segment instead (copying the records of clean docs & every kept snapshot over as is)
+        live_entries = { board_entry["data"]: board_entry for doc, doc_dir_path, board_entry in doc_entries if board_entry is not None }
+        for snapshot in snapshots:
+            live_entries.update((board_entry["data"], board_entry) for board_entry in snapshot["boards"])
+        live_bytes = sum(topic_cache_utils.board_entry_size(board_entry) for board_entry in live_entries.values())
+        compact = old_segment_path is None or \
+            os.path.getsize(old_segment_path) - live_bytes > os.path.getsize(old_segment_path) * topic_cache_utils.SEGMENT_COMPACTION_RATIO
+        if compact:
+            segment_name = topic_cache_utils.next_segment_name(self._segment_name)
+        else:
+            segment_name = self._segment_name
+        segment_path = os.path.join(topic_cache_dir_path, segment_name)
+
+        # Keep track of how many records we're writing
+        # Without any dirty docs (and no compaction), this is 0
         doc_data_files = 0
         doc_topic_files = 0
-        for doc in tqdm.tqdm(self._docs, ncols=100, desc=f"Writing all '{topic_cache_utils.DOCS_ATTRIBUTE_NAME}' in topic sub caches version '{self.version}'",
-                             disable=globals.DISABLE_PROGRESS_BARS):
-            # Create the {doc_dir_path}_{board_name} directory if we haven't already
-            doc_dir_path = os.path.join(topic_cache_dir_path, doc.doc_dir_path())
-            if not os.path.isdir(doc_dir_path):
-                os.makedirs(doc_dir_path)
-
-            # Iterate through every topic name and its topic object found in these docs (i.e. empath boards)
-            for topic_name in doc.topics.keys():
-                topic_obj = doc.topics[topic_name]
-                topic_content = {topic_name: topic_obj}
-
-                # Write the single entry topic dict of each topic located inside this doc
-                # But only if that topic's file doesn't already exist in this sub directory
-                doc_topic_path = os.path.join(doc_dir_path, topic_name)
-                if not os.path.exists(doc_topic_path):
-                    with open(doc_topic_path, "wb") as f:
-                        pickle.dump(topic_content, f, pickle.DEFAULT_PROTOCOL)
-                    doc_topic_files += 1
-
-            # Lastly, create the {doc_dir_path}_{board_name}_data file
-            # Using a shallow copy to store filepath and board information in the "data" directory
-            # Shallow copy ensures we don't store duplicated topics content
-            doc_dir_path_dirname = os.path.dirname(doc_dir_path)
-            doc_dir_path_basename = os.path.basename(doc_dir_path) + DOC_FILE_SUFFIX_NAME
-            doc_path_name = os.path.join(doc_dir_path_dirname, doc_dir_path_basename)
-            if os.path.exists(doc_path_name):
-                corruption.set_corrupted(True, message=f"This data file '{doc_path_name}' already exists in the topic cache.")
-                raise Exception(f"Cache file write error. Halting process to prevent overwrite of this data file: '{doc_path_name}'. "
-                                f"Please re-run last command (twice if another error pops up shortly after re-running command) {log.context(doc.board)}")
-            with open(doc_path_name, "wb") as f:
-                pickle.dump(doc.shallow_copy(), f, pickle.DEFAULT_PROTOCOL)
-            doc_data_files += 1
-
-        logging.info(f"Total {topic_cache_utils.DOCS_ATTRIBUTE_NAME} '{len(self._docs)}'. Total number of data files written '{doc_data_files}'. "
-                     f"Total number of topic files written '{doc_topic_files}'.")
+        shared_boards = 0
+        board_entries = []
+        kept_entries = {}
+        with open(segment_path, "wb" if compact else "ab") as segment_file, \
+                MappedCacheFile(old_segment_path) if compact and old_segment_path is not None else nullcontext() as old_segment:
+            def keep_board_entry(board_entry: dict) -> dict:
+                """
+                Returns a board entry that is already in the segment, copying its records over first when compacting
+                (only once, even when it's shared between several snapshots)
+                """
+                if compact and board_entry["data"] not in kept_entries:
+                    kept_entries[board_entry["data"]] = topic_cache_utils.copy_board_entry(old_segment, segment_file, board_entry)
+                return kept_entries[board_entry["data"]] if compact else board_entry
+
+            for doc, doc_dir_path, board_entry in tqdm.tqdm(doc_entries, ncols=100, desc=f"Writing all '{topic_cache_utils.DOCS_ATTRIBUTE_NAME}' in topic sub caches version '{self.version}'",
+                                                            disable=globals.DISABLE_PROGRESS_BARS):
+                if board_entry is not None:
+                    board_entries.append(keep_board_entry(board_entry))
+                    continue
+
+                # Write the record of each topic located inside this doc (i.e. empath board)
+                # Topics that were never loaded (lazy loading only) get copied over as is, without decoding them
+                # Records are written relative to the start of the board first, its checksum decides whether it's written at all
+                board_records = io.BytesIO()
+                checksum = topic_cache_utils.new_board_checksum()
+                topic_entries = []
+                for topic_name in doc.topics.keys():
+                    if isinstance(doc.topics, self.LazyTopics) and not doc.topics.is_loaded(topic_name) and doc.topics.codec is self._topic_codec:
+                        with doc.topics.record_view(topic_name) as record:
+                            offset, length = topic_cache_utils.append_raw_record(board_records, record, checksum)
+                    else:
+                        topic_record = self._topic_codec.encode(topic_name, doc.topics[topic_name])
+                        offset, length = topic_cache_utils.append_raw_record(board_records, topic_record, checksum)
+                    topic_entries.append((topic_name, offset, length))
+
+                # Lastly, write the board record
+                # Using a shallow copy to store filepath and board information only
+                # Shallow copy ensures we don't store duplicated topics content
+                data_entry = topic_cache_utils.append_record(board_records, doc.shallow_copy(), checksum)
+
+                content_entry = content_entries.get((doc_dir_path, checksum.digest()))
+                if content_entry is not None:
+                    board_entries.append(keep_board_entry(content_entry))
+                    shared_boards += 1
+                    continue
+
+                board_offset = segment_file.tell()
+                segment_file.write(board_records.getbuffer())
+                board_entries.append({ "key": doc_dir_path, "data": (board_offset + data_entry[0], data_entry[1]),
+                                       "topics": [(topic_name, board_offset + offset, length) for topic_name, offset, length in topic_entries],
+                                       "checksum": checksum.digest(), "filepath": doc.filepath, "board": doc.board_descriptor.name })
+                doc_data_files += 1
+                doc_topic_files += len(topic_entries)
+
+            snapshots = [{ **snapshot, "boards": [keep_board_entry(board_entry) for board_entry in snapshot["boards"]] } for snapshot in snapshots]
+
+        # Swapping in the new index is what commits this write; until then the old index only sees the old records
+        # (Other snapshots pointing at a segment the index doesn't point at get ignored, so they're swapped in first)
+        topic_cache_utils.dump_cache_file(os.path.join(topic_cache_dir_path, topic_cache_utils.SNAPSHOTS_FILE_NAME),
+                                          { topic_cache_utils.SEGMENT_INDEX_SEGMENT_KEY: segment_name, topic_cache_utils.SNAPSHOTS_KEY: snapshots })
+        segment_index = { topic_cache_utils.SEGMENT_INDEX_SEGMENT_KEY: segment_name, topic_cache_utils.SEGMENT_INDEX_BOARDS_KEY: board_entries,
+                          topic_cache_utils.SEGMENT_INDEX_SCHEMAS_KEY: self._topic_codec.schemas,
+                          topic_cache_utils.SEGMENT_INDEX_SNAPSHOT_KEY: snapshot_key, topic_cache_utils.SEGMENT_INDEX_FILES_KEY: source_file_states }
+        topic_cache_utils.dump_cache_file(os.path.join(topic_cache_dir_path, topic_cache_utils.SEGMENT_INDEX_FILE_NAME), segment_index)
+        self._loaded_snapshot = topic_cache_utils.index_snapshot(segment_index)
+        self._segment_entries = {board_entry["key"]: board_entry for board_entry in board_entries}
+        self._segment_name = segment_name
+        self._dirty_docs = set()
+
+        # Now that the local topic cache has them, share every source file compiled since the last write()
+        compiled_files = len(self._compiled_files)
+        for abs_path in sorted(self._compiled_files):
+            self.publish_shared(abs_path)
+        self._compiled_files = set()
+
+        # Older segment files are no longer referenced by the index
+        if compact:
+            for cache_file in os.listdir(topic_cache_dir_path):
+                if cache_file.startswith(topic_cache_utils.SEGMENT_FILE_NAME) and cache_file != segment_name:
+                    logging.info(f"Removing old segment file '{cache_file}'.")
+                    try:
+                        os.remove(os.path.join(topic_cache_dir_path, cache_file))
+                    except OSError as e:
+                        # i.e. still mapped by lazily loaded docs on platforms that don't allow removing mapped files
+                        logging.info(f"Could not remove old segment file '{cache_file}': {e}")
+
+        # Boards whose records were already in the segment (written earlier or shared with another snapshot) are hits,
+        # Boards whose records had to be written (i.e. compiled or fetched from the shared store since the last write()) are misses
+        board_hits = len(board_entries) - doc_data_files
+        self._compile_stats = {
+            "written_at": time.time(),
+            "load_seconds": self._compile_stats.get("load_seconds"),
+            "write_seconds": time.perf_counter() - write_start,
+            "boards": len(board_entries),
+            "board_hits": board_hits,
+            "board_misses": doc_data_files,
+            "board_hit_ratio": board_hits / len(board_entries) if board_entries else None,
+            "boards_shared_with_snapshots": shared_boards,
+            "topic_records_written": doc_topic_files,
+            "files_compiled": compiled_files,
+            "files_fetched_from_shared_store": len(self._shared_files),
+            "files_removed": len(removed_files),
+            "files_changed_since_snapshot": len(self._changed_files),
+            "discarded_boards": len(self._discarded_boards),
+            "snapshots": len(snapshots) + 1,
+            "segment_bytes": os.path.getsize(segment_path),
+            "segment_compacted": compact,
+            "topic_access": self.cache_stats,
+            "sharing": self.sharing_stats,
+            "shared_store": self.shared_store.stats if self.shared_store is not None else None
+        }
+        topic_cache_utils.write_compile_stats(topic_cache_dir_path, self._compile_stats)
+
+        logging.info(f"Total {topic_cache_utils.DOCS_ATTRIBUTE_NAME} '{len(self._docs)}'. Total number of data records written '{doc_data_files}'. "
+                     f"Total number of topic records written '{doc_topic_files}'. Segment file '{segment_name}' {'rewritten' if compact else 'appended to'}. "
+                     f"Boards shared with other snapshots '{shared_boards}'. Snapshots kept '{len(snapshots) + 1}'.")
 
     def _load(self):
         def load_topic_cache_file() -> Union[TopicCache, None]:
@@ -280,24 +1118,42 @@ class TopicCache(CacheBase):
             if not os.path.exists(_topic_cache_filepath):
                 return None
 
-            _topic_cache_file = None
-            data = bytearray()
-            with open(_topic_cache_filepath, "rb") as f:
-                print(f"Grabbing all info inside the '{self.__class__.__name__}' file. This may take a few minutes.")
-                for byte in iter(partial(f.read, 1024), b''):
-                    data += bytearray(byte)
-                _topic_cache_file = pickle.loads(data)
+            print(f"Grabbing all info inside the '{self.__class__.__name__}' file. This may take a few minutes.")
+            _topic_cache_file = load_cache_file(_topic_cache_filepath)
 
             return _topic_cache_file
 
-        def _downgrade_instructions():
+        def _load_instructions(_topic_cache_file, _doc_data_files, _doc_topic_files) -> TopicCache:
+            """
+            Calls the load instruction of the TopicCache file's build version to load up the doc list
+            Version 1 builds predate instructions, so they always load with "load_v1"
+
+            Args:
+                _topic_cache_file: the current TopicCache file containing the TopicCache object (or dict for v1 builds)
+                _doc_data_files: current number of loaded data files
+                _doc_topic_files: current number of loaded topic files
+            """
+            load_instructions = topic_cache_utils.find_instructions(getattr(_topic_cache_file, topic_cache_utils.INSTRUCTIONS_ATTRIBUTE_NAME, []), "load_")
+            load_func = load_instructions[0]["func"] if load_instructions else topic_cache_utils.load_v1
+            return load_func(self, _topic_cache_file, _doc_data_files, _doc_topic_files)
+
+        def _downgrade_instructions(_topic_cache_file, _doc_data_files, _doc_topic_files, _target_version) -> TopicCache:
             """
             Given a list of chronologically ordered instructions inside the instructions attribute,
             Call each instruction (a downgrade function which takes in the topicCache object and other optional args)
             To downgrade the object's build version until it matches the desired version and return this new build
+
+            Args:
+                _topic_cache_file: the current TopicCache file containing the TopicCache object
+                _doc_data_files: current number of converted data files
+                _doc_topic_files: current number of converted topic files
+                _target_version: the desired build version number
             """
-            # TODO: implement downgrade functionality
-            raise NotImplementedError(f"No downgrade instructions available for version '{_topic_cache_file.version}'.")
+            # Start from the newer build's version and instructions, each downgrade then swaps in the ones of the version it lands on
+            logging.info(f"'{self.__class__.__name__}' is on a newer version. Need to downgrade to version '{_target_version}'.")
+            setattr(self, topic_cache_utils.VERSION_ATTRIBUTE_NAME, _topic_cache_file.version)
+            setattr(self, topic_cache_utils.INSTRUCTIONS_ATTRIBUTE_NAME, _topic_cache_file.instructions)
+            return self._run_downgrade_instructions(_target_version, _doc_data_files, _doc_topic_files)
 
         def _upgrade_instructions(_topic_cache_file, _doc_data_files, _doc_topic_files, _target_version) -> TopicCache:
             """
@@ -320,16 +1176,16 @@ class TopicCache(CacheBase):
 
             # Upgrade until we reach the desired build version (i.e. the current one)
             while self.version != _target_version:
-                if self.version == 1:
-                    _doc_data_files, _doc_topic_files = topic_cache_utils.upgrade_v1_to_v2(self, _doc_data_files, _doc_topic_files)
-                else:
+                if self.version not in topic_cache_utils.UPGRADE_FUNCS:
                     raise NotImplementedError(f"No upgrade instructions available for version '{self.version}'.")
+                _doc_data_files, _doc_topic_files = topic_cache_utils.UPGRADE_FUNCS[self.version](self, _doc_data_files, _doc_topic_files)
 
             return _doc_data_files, _doc_topic_files
 
         if not corruption.is_corrupted():
 
-            self._docs = []
+            self.clear()
+            load_start = time.perf_counter()
 
             # Keep track of how many files we're loading
             # This should match the number of files we end up writing right after this
@@ -339,36 +1195,46 @@ class TopicCache(CacheBase):
             try:
                 # Ensure topic cache directory and/or file exists and compiled correctly before starting
                 topic_cache_file = load_topic_cache_file()
-                if topic_cache_file is None:
+                if topic_cache_file is None and self.shared_store is None:
                     corruption.set_corrupted(True, message="TopicCache file doesn't exist")
                     raise Exception(f"Cache file read error. Halting process because '{self.__class__.__name__}' file doesn't exist. "
                                     f"Please re-run last command (twice if another error pops up shortly after re-running command)")
 
+                # With a shared store, a missing TopicCache file (i.e. a fresh checkout) starts out empty,
+                # The topics of every source file the compiler compiles then get fetched from the shared store, see add()
+                if topic_cache_file is None:
+                    logging.info(f"'{self.__class__.__name__}' file doesn't exist, starting out with an empty topic cache.")
+
                 # If the loaded object's build version is old or doesn't exist (i.e. it's really old),
                 # Load up the doc list and then continuously upgrade until we reach the current build version
-                if not hasattr(topic_cache_file, topic_cache_utils.VERSION_ATTRIBUTE_NAME) or topic_cache_file.version < self.version:
-                    if not hasattr(topic_cache_file, topic_cache_utils.VERSION_ATTRIBUTE_NAME) or topic_cache_file.version == 1:
-                        doc_data_files, doc_topic_files = topic_cache_utils.load_v1(self, topic_cache_file, doc_data_files, doc_topic_files)
-                    else:
-                        raise NotImplementedError(f"No loading process available for version '{topic_cache_file.version}'.")
+                elif not hasattr(topic_cache_file, topic_cache_utils.VERSION_ATTRIBUTE_NAME) or topic_cache_file.version < self.version:
+                    doc_data_files, doc_topic_files = _load_instructions(topic_cache_file, doc_data_files, doc_topic_files)
                     doc_data_files, doc_topic_files = _upgrade_instructions(topic_cache_file, doc_data_files, doc_topic_files, self.version)
 
                 # If the loaded object's build version is newer than the current build (i.e. a "futuristic" build),
-                # Load up the doc list and continuously downgrade until we reach the current build version
+                # Continuously downgrade the files until we reach the current build version and then load up the doc list
                 elif topic_cache_file.version > self.version:
-                    _downgrade_instructions()
+                    _downgrade_instructions(topic_cache_file, 0, 0, self.version)
+                    doc_data_files, doc_topic_files = _load_instructions(self, doc_data_files, doc_topic_files)
 
                 # If the loaded object's build version is up to date, just load up the doc list
                 else:
-                    doc_data_files, doc_topic_files = topic_cache_utils.load_v2(self, topic_cache_file, doc_data_files, doc_topic_files)
+                    doc_data_files, doc_topic_files = _load_instructions(topic_cache_file, doc_data_files, doc_topic_files)
 
             except:
                 corruption.set_corrupted(True, message=f"Read error detected for TopicCache")
                 raise Exception(f"Cache file read error, halting loading process in '{self.__class__.__name__}'. "
                                 f"Please re-run last command (twice if another error pops up shortly after re-running command)")
 
-            logging.info(f"Total {topic_cache_utils.DOCS_ATTRIBUTE_NAME} '{len(self._docs)}'. Total number of data files loaded '{doc_data_files}'. "
-                  f"Total number of topic files loaded '{doc_topic_files}'.")
+            # Docs added while loading (i.e. version 1 builds load through add()) weren't compiled by this build, so they don't get published
+            self._compiled_files = set()
+            self.schedule_recompile(self.files_to_recompile)
+            self._compile_stats = { "load_seconds": time.perf_counter() - load_start }
+
+            logging.info(f"Total {topic_cache_utils.DOCS_ATTRIBUTE_NAME} '{len(self._docs)}'. Total number of data records loaded '{doc_data_files}'. "
+                  f"Total number of topic records loaded '{doc_topic_files}'.")
+            logging.info(f"Interned '{self._sharing_stats['interned_strings']}' repeated topic strings and shared '{self._sharing_stats['shared_tags']}' "
+                         f"repeated tags, saving '{self._sharing_stats['saved_bytes']}' bytes.")
 
         else:
             print(f"Something in '{self.__class__.__name__}' is corrupted, skipping loading process.")
@@ -0,0 +1,165 @@
+# README: benchmarks for loading "topic_cache.py" sub caches; run with "python -m" from the build scripts root
+
+from functools import partial
+from typing import Callable, List, Tuple
+
+import argparse
+import os
+import pickle
+import shutil
+import tempfile
+import time
+
+from . import topic_cache_utils
+from .cache_file_reader import MappedCacheFile, load_cache_file
+from .topic_record_codec import TopicRecordCodec
+
+NUM_TOPICS = 20000
+TOPICS_PER_BOARD = 10
+
+
+class _SyntheticTopic:
+    """
+    Stand-in for a compiled topic object with roughly the same amount of text content
+    """
+    def __init__(self, topic_name: str):
+        self.topic_name = topic_name
+        self.other_topic_names = [f"{topic_name}_alt_{i}" for i in range(3)]
+        self.templated_node_properties = {"fallbackContextType": "LOCAL_ONLY", "fallbackContextText": "a" * 64}
+        self.output = f"topic: ~{topic_name} keep repeat []\n" + "    u: (pattern) response line\n" * 40
+
+
+class _SyntheticBoard:
+    def __init__(self, filename: str, name: str):
+        self.filename = filename
+        self.name = name
+        self.topics = {}
+
+
+def _legacy_load_cache_file(filepath: str):
+    """
+    The original 1 KB read loop, kept here only to compare against
+    """
+    data = bytearray()
+    with open(filepath, "rb") as f:
+        for byte in iter(partial(f.read, 1024), b''):
+            data += bytearray(byte)
+        return pickle.loads(data)
+
+
+def build_synthetic_cache(root_dir: str, num_topics: int = NUM_TOPICS) -> Tuple[List[str], str, dict]:
+    """
+    Writes the same synthetic boards & topics both as version 2 files and as a version 3 segment
+
+    Returns:
+        All version 2 file paths, the version 3 segment path and the version 3 segment index
+    """
+    v2_dir = os.path.join(root_dir, "v2")
+    os.makedirs(v2_dir)
+    v2_files = []
+    board_entries = []
+    segment_path = os.path.join(root_dir, topic_cache_utils.SEGMENT_FILE_NAME)
+    with open(segment_path, "wb") as segment_file:
+        for board_idx in range(num_topics // TOPICS_PER_BOARD):
+            board = _SyntheticBoard(f"/CONVERSATIONS/synthetic/board_{board_idx}.chatModule", f"board_{board_idx}")
+            board_dir = os.path.join(v2_dir, board.name)
+            os.makedirs(board_dir)
+
+            topic_entries = []
+            for topic_idx in range(TOPICS_PER_BOARD):
+                topic_name = f"{board.name}_topic_{topic_idx}"
+                topic_content = {topic_name: _SyntheticTopic(topic_name)}
+                topic_path = os.path.join(board_dir, topic_name)
+                with open(topic_path, "wb") as f:
+                    pickle.dump(topic_content, f, pickle.DEFAULT_PROTOCOL)
+                v2_files.append(topic_path)
+                topic_entries.append((topic_name, *topic_cache_utils.append_record(segment_file, topic_content)))
+
+            data_path = board_dir + "_data"
+            with open(data_path, "wb") as f:
+                pickle.dump(board, f, pickle.DEFAULT_PROTOCOL)
+            v2_files.append(data_path)
+            board_entries.append({ "key": board.name, "data": topic_cache_utils.append_record(segment_file, board), "topics": topic_entries })
+
+    return v2_files, segment_path, { topic_cache_utils.SEGMENT_INDEX_BOARDS_KEY: board_entries }
+
+
+def _time_it(func: Callable) -> float:
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def run(num_topics: int = NUM_TOPICS) -> dict:
+    """
+    Times every way of loading the same synthetic topic cache and returns the results in seconds
+    """
+    root_dir = tempfile.mkdtemp(prefix="topic_cache_benchmark_")
+    try:
+        v2_files, segment_path, segment_index = build_synthetic_cache(root_dir, num_topics)
+
+        def load_v3_segment():
+            with MappedCacheFile(segment_path) as segment:
+                for board_entry in segment_index[topic_cache_utils.SEGMENT_INDEX_BOARDS_KEY]:
+                    segment.read_record(*board_entry["data"])
+                    for topic_name, offset, length in board_entry["topics"]:
+                        segment.read_record(offset, length)
+
+        return {
+            "v2 files, 1 KB bytearray loop": _time_it(lambda: [_legacy_load_cache_file(path) for path in v2_files]),
+            "v2 files, load_cache_file()": _time_it(lambda: [load_cache_file(path) for path in v2_files]),
+            "v3 segment, mmap": _time_it(load_v3_segment),
+        }
+    finally:
+        shutil.rmtree(root_dir)
+
+
+def run_codec(num_topics: int = NUM_TOPICS) -> Tuple[dict, dict]:
+    """
+    Times encoding & decoding the same synthetic topics as generic pickle records and as compact topic records
+
+    Returns:
+        The results in seconds and the total record sizes in bytes
+    """
+    topics = [_SyntheticTopic(f"synthetic_topic_{topic_idx}") for topic_idx in range(num_topics)]
+    codec = TopicRecordCodec()
+    pickle_records = []
+    compact_records = []
+
+    def encode_pickle():
+        pickle_records[:] = [pickle.dumps({topic.topic_name: topic}, pickle.DEFAULT_PROTOCOL) for topic in topics]
+
+    def encode_compact():
+        compact_records[:] = [codec.encode(topic.topic_name, topic) for topic in topics]
+
+    results = {
+        "encode, generic pickle": _time_it(encode_pickle),
+        "encode, compact records": _time_it(encode_compact),
+        "decode, generic pickle": _time_it(lambda: [pickle.loads(memoryview(record)) for record in pickle_records]),
+        "decode, compact records": _time_it(lambda: [codec.decode(memoryview(record)) for record in compact_records]),
+    }
+    sizes = {
+        "generic pickle": sum(len(record) for record in pickle_records),
+        "compact records": sum(len(record) for record in compact_records),
+    }
+    return results, sizes
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark topic cache loading on a synthetic cache")
+    parser.add_argument("--topics", type=int, default=NUM_TOPICS, help="number of synthetic topics to load")
+    args = parser.parse_args()
+
+    results = run(args.topics)
+    baseline = next(iter(results.values()))
+    print(f"Loading {args.topics} synthetic topics:")
+    for name, seconds in results.items():
+        print(f"    {name:<32} {seconds:8.3f}s  ({baseline / seconds:5.2f}x)")
+
+    codec_results, codec_sizes = run_codec(args.topics)
+    print(f"Encoding & decoding {args.topics} synthetic topic records:")
+    for name, seconds in codec_results.items():
+        generic_seconds = codec_results[f"{name.split(',')[0]}, generic pickle"]
+        print(f"    {name:<32} {seconds:8.3f}s  ({generic_seconds / seconds:5.2f}x generic pickle)")
+    for name, size in codec_sizes.items():
+        print(f"    {name + ' size':<32} {size / 1024 / 1024:8.1f}MB")
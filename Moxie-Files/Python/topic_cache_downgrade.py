@@ -0,0 +1,15 @@
+# README: converts the "topic_cache.py" sub cache down to an older build version before switching to a branch with an older compiler; run with "python -m" from the build scripts root
+
+import argparse
+import logging
+
+from .topic_cache import TopicCache
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Downgrade the topic cache files on disk to an older build version")
+    parser.add_argument("version", type=int, help="build version of the older compiler's topic cache")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    TopicCache().downgrade(args.version)
@@ -0,0 +1,153 @@
+# README: reports what the compiler cache costs (bytes on disk per sub cache and, for the "topic_cache.py" sub cache, bytes & load time per board,
+# the largest topics, hits & misses of the last compile and orphaned records); run with "python -m" from the build scripts root
+
+from typing import Any, Dict, List
+
+import argparse
+import json
+import logging
+import os
+import time
+
+from ..... import CACHE_SUB_DIR
+from . import topic_cache_utils
+from .cache_file_reader import MappedCacheFile
+from .topic_cache import TopicCache
+from .topic_record_codec import TopicRecordCodec
+
+DEFAULT_TOP_COUNT = 20
+
+
+def sub_cache_sizes() -> Dict[str, int]:
+    """
+    Returns the bytes on disk of every sub cache (file or directory) inside the cache directory
+    """
+    sizes = {}
+    for cache_file in sorted(os.listdir(CACHE_SUB_DIR)):
+        cache_file_path = os.path.join(CACHE_SUB_DIR, cache_file)
+        if os.path.isdir(cache_file_path):
+            sizes[cache_file] = sum(os.path.getsize(os.path.join(dir_path, file_name))
+                                    for dir_path, dir_names, file_names in os.walk(cache_file_path) for file_name in file_names)
+        else:
+            sizes[cache_file] = os.path.getsize(cache_file_path)
+    return sizes
+
+
+def board_filepath(segment: MappedCacheFile, board_entry: dict) -> str:
+    # Entries written before checksums existed don't store their filepath, only their board record does
+    if "filepath" in board_entry:
+        return board_entry["filepath"]
+    return segment.read_record(*board_entry["data"]).filepath
+
+
+def inspect_topic_cache(top_count: int = DEFAULT_TOP_COUNT) -> Dict[str, Any]:
+    """
+    Reads the current version's topic cache straight from its segment file and reports what it costs
+
+    Args:
+        top_count: how many of the biggest boards & topics to report
+
+    Returns:
+        The report (JSON serializable)
+    """
+    topic_cache_dir_path = TopicCache().topic_cache_dir_path()
+    segment_index = topic_cache_utils.load_segment_index(topic_cache_dir_path)
+    segment_name = segment_index.get(topic_cache_utils.SEGMENT_INDEX_SEGMENT_KEY, topic_cache_utils.SEGMENT_FILE_NAME)
+    topic_codec = TopicRecordCodec(segment_index.get(topic_cache_utils.SEGMENT_INDEX_SCHEMAS_KEY))
+    # The index is the last snapshot in the list (indexes written before snapshots existed aren't one, but are still live)
+    snapshots = topic_cache_utils.load_snapshots(topic_cache_dir_path, segment_name)
+    if segment_index.get(topic_cache_utils.SEGMENT_INDEX_SNAPSHOT_KEY) is None:
+        snapshots.append(topic_cache_utils.index_snapshot(segment_index))
+
+    boards = []
+    topics = []
+    with MappedCacheFile(os.path.join(topic_cache_dir_path, segment_name)) as segment:
+        # Load time is what decoding every record of the board takes (i.e. a fully loaded board, not a lazily loaded one)
+        for board_entry in segment_index[topic_cache_utils.SEGMENT_INDEX_BOARDS_KEY]:
+            load_start = time.perf_counter()
+            segment.read_record(*board_entry["data"])
+            for topic_name, offset, length in board_entry["topics"]:
+                with segment.record_view(offset, length) as record:
+                    topic_codec.decode(record)
+                topics.append({ "topic": topic_name, "board": board_entry["key"], "bytes": length })
+            boards.append({ "board": board_entry["key"], "filepath": board_filepath(segment, board_entry),
+                            "bytes": topic_cache_utils.board_entry_size(board_entry), "topics": len(board_entry["topics"]),
+                            "load_seconds": time.perf_counter() - load_start })
+
+        # Records of every snapshot still count as live; records no snapshot points at anymore wait for the next compaction
+        live_entries = {}
+        orphaned_boards = []
+        for snapshot in snapshots:
+            for board_entry in snapshot["boards"]:
+                live_entries[board_entry["data"]] = board_entry
+                filepath = board_filepath(segment, board_entry)
+                if not os.path.exists(filepath):
+                    orphaned_boards.append({ "board": board_entry["key"], "filepath": filepath, "snapshot": snapshot["key"],
+                                             "bytes": topic_cache_utils.board_entry_size(board_entry) })
+        live_bytes = sum(topic_cache_utils.board_entry_size(board_entry) for board_entry in live_entries.values())
+        segment_bytes = len(segment)
+
+    compile_stats = None
+    compile_stats_path = os.path.join(topic_cache_dir_path, topic_cache_utils.COMPILE_STATS_FILE_NAME)
+    if os.path.exists(compile_stats_path):
+        with open(compile_stats_path) as f:
+            compile_stats = json.load(f)
+
+    return {
+        "sub_caches": sub_cache_sizes(),
+        "segment": segment_name,
+        "segment_bytes": segment_bytes,
+        "live_bytes": live_bytes,
+        "stale_bytes": segment_bytes - live_bytes,
+        "snapshots": len(snapshots),
+        "boards": len(boards),
+        "load_seconds": sum(board["load_seconds"] for board in boards),
+        "largest_boards": sorted(boards, key=lambda board: board["bytes"], reverse=True)[:top_count],
+        "slowest_boards": sorted(boards, key=lambda board: board["load_seconds"], reverse=True)[:top_count],
+        "largest_topics": sorted(topics, key=lambda topic: topic["bytes"], reverse=True)[:top_count],
+        "orphaned_boards": orphaned_boards,
+        "last_compile": compile_stats
+    }
+
+
+def print_report(report: Dict[str, Any]):
+    def print_rows(title: str, rows: List[Dict], columns: List[str]):
+        print(f"\n{title}")
+        for row in rows:
+            print("    " + "  ".join(f"{column}={row[column]:.4f}" if isinstance(row[column], float) else f"{column}={row[column]}" for column in columns))
+
+    print("Sub caches (bytes on disk)")
+    for cache_file, size in report["sub_caches"].items():
+        print(f"    {cache_file}: {size}")
+
+    print(f"\nSegment file '{report['segment']}': '{report['segment_bytes']}' bytes, '{report['live_bytes']}' live, '{report['stale_bytes']}' stale. "
+          f"'{report['boards']}' boards loaded in '{report['load_seconds']:.4f}' seconds. '{report['snapshots']}' snapshots kept.")
+    print_rows("Largest boards", report["largest_boards"], ["board", "bytes", "topics", "load_seconds"])
+    print_rows("Slowest boards to load", report["slowest_boards"], ["board", "load_seconds", "bytes"])
+    print_rows("Largest topics", report["largest_topics"], ["topic", "board", "bytes"])
+    print_rows(f"Orphaned boards (source file no longer exists): '{len(report['orphaned_boards'])}'", report["orphaned_boards"],
+               ["board", "filepath", "snapshot", "bytes"])
+
+    compile_stats = report["last_compile"]
+    if compile_stats is None:
+        print("\nNo compile stats yet, they're written after each compile.")
+        return
+    print(f"\nLast compile: '{compile_stats['board_hits']}' board hits, '{compile_stats['board_misses']}' board misses "
+          f"(hit ratio '{compile_stats['board_hit_ratio']}'). Loaded in '{compile_stats['load_seconds']}' seconds, "
+          f"written in '{compile_stats['write_seconds']}' seconds.")
+    for key, value in compile_stats.items():
+        print(f"    {key}: {value}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report what the compiler cache costs, the topic cache in particular")
+    parser.add_argument("--top", type=int, default=DEFAULT_TOP_COUNT, help="how many of the biggest boards & topics to report")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON instead")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    report = inspect_topic_cache(args.top)
+    if args.json:
+        print(json.dumps(report, indent=4))
+    else:
+        print_report(report)
@@ -1,27 +1,520 @@
 # README: contains helper functions for "topic_cache.py"
 
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+
+import hashlib
+import json
+import copy
 import logging
 import os
-from functools import partial
 import pathlib
 import pickle
+import shutil
+import sys
 import tqdm
+import types
 
 from ..... import CACHE_SUB_DIR
 from .... import globals
+from .cache_file_reader import MappedCacheFile, load_cache_file
+from .topic_record_codec import TopicRecordCodec
 
 DOCS_ATTRIBUTE_NAME = "_docs"
 INSTRUCTIONS_ATTRIBUTE_NAME = "_instructions"
 VERSION_ATTRIBUTE_NAME = "_version"
+INDEX_ATTRIBUTE_NAMES = ["_doc_filepaths", "_topic_index", "_shadowed_topics", "_board_index", "_file_index"]
+SEGMENT_FILE_NAME = "segment"
+SEGMENT_INDEX_FILE_NAME = "index"
+SEGMENT_INDEX_BOARDS_KEY = "boards"
+SEGMENT_INDEX_SEGMENT_KEY = "segment"
+SEGMENT_INDEX_SCHEMAS_KEY = "schemas"
+SEGMENT_INDEX_SNAPSHOT_KEY = "snapshot"
+SEGMENT_INDEX_FILES_KEY = "files"
+# Holds every other snapshot (i.e. source tree) still sharing the segment file, least recently used first
+SNAPSHOTS_FILE_NAME = "snapshots"
+SNAPSHOTS_KEY = "snapshots"
+DEFAULT_SNAPSHOT_COUNT = 4
+SOURCE_FILE_DIGEST_SIZE = 16
+WRITE_STATE_ATTRIBUTE_NAMES = ["_dirty_docs", "_segment_entries", "_segment_name", "_topic_codec", "_loaded_snapshot", "_source_file_states"]
+MEMORY_ATTRIBUTE_NAMES = ["_resident_docs", "_resident_bytes", "_cache_stats", "_shared_tags", "_sharing_stats"]
+# Topic attributes whose strings & tags repeat across thousands of topics (i.e. the ones ModuleInfo extracts), see share_topic_values()
+SHARED_TOPIC_ATTRIBUTE_NAMES = ["other_topic_names", "templated_node_properties", "sel_tags", "flex_sel_tags", "content_tags"]
+# A segment file gets compacted (rewritten without its stale records) once stale records take up more than this share of it
+SEGMENT_COMPACTION_RATIO = 0.5
+BOARD_CHECKSUM_DIGEST_SIZE = 16
+DISCARDED_BOARDS_REPORT_FILE_NAME = "discarded_boards.json"
+COMPILE_STATS_FILE_NAME = "compile_stats.json"
+
+
+def new_board_checksum():
+	"""
+	Returns the hash object used for board checksums, fed with each of the board's records in order (topics first, then data)
+	"""
+	return hashlib.blake2b(digest_size=BOARD_CHECKSUM_DIGEST_SIZE)
+
+
+def append_record(_segment_file, _record, _checksum=None) -> tuple:
+	"""
+	Pickles a single record at the end of an open segment file and returns its (offset, length) in that segment
+	Also feeds the pickled record to the board checksum, if given
+	"""
+	record_data = pickle.dumps(_record, pickle.DEFAULT_PROTOCOL)
+	return append_raw_record(_segment_file, record_data, _checksum)
+
+
+def append_raw_record(_segment_file, _record_data, _checksum=None) -> tuple:
+	"""
+	Copies an already pickled record at the end of an open segment file and returns its (offset, length) in that segment
+	Also feeds the pickled record to the board checksum, if given
+	"""
+	offset = _segment_file.tell()
+	_segment_file.write(_record_data)
+	if _checksum is not None:
+		_checksum.update(_record_data)
+	return offset, len(_record_data)
+
+
+def verify_board_entry(_segment: MappedCacheFile, _board_entry: dict) -> bool:
+	"""
+	Checks every record of a board entry against the checksum stored with it
+	Entries written before checksums existed have nothing to check against and always pass
+	"""
+	if "checksum" not in _board_entry:
+		return True
+
+	# i.e. a truncated segment file
+	if not board_entry_in_bounds(_board_entry, len(_segment)):
+		return False
+
+	checksum = new_board_checksum()
+	record_locations = [(offset, length) for topic_name, offset, length in _board_entry["topics"]]
+	record_locations.append(_board_entry["data"])
+	for offset, length in record_locations:
+		with _segment.record_view(offset, length) as record:
+			checksum.update(record)
+
+	return checksum.digest() == _board_entry["checksum"]
+
+
+def board_entry_in_bounds(_board_entry: dict, _segment_size: int) -> bool:
+	"""
+	Checks that every record of a board entry lies within a segment file of this size
+	"""
+	data_offset, data_length = _board_entry["data"]
+	return data_offset + data_length <= _segment_size and \
+		all(offset + length <= _segment_size for topic_name, offset, length in _board_entry["topics"])
+
+
+def discard_board_entry(_topic_cache_obj, _board_entry: dict, _reason: str):
+	"""
+	Leaves a corrupt board out of the TopicCache object and adds it to the discarded boards report
+	Its source file (when known) gets scheduled for recompilation through TopicCache.files_to_recompile
+	"""
+	logging.warning(f"Discarding corrupt board record '{_board_entry['key']}' of file://{_board_entry.get('filepath')}: {_reason}")
+	_topic_cache_obj._discarded_boards.append({
+		"key": _board_entry["key"],
+		"filepath": _board_entry.get("filepath"),
+		"board": _board_entry.get("board"),
+		"reason": _reason
+	})
+
+
+def write_discarded_boards_report(_topic_cache_dir_path: str, _discarded_boards: list):
+	"""
+	Writes the list of discarded boards (from the last load) next to the segment file so it can be checked after a build
+	"""
+	with open(os.path.join(_topic_cache_dir_path, DISCARDED_BOARDS_REPORT_FILE_NAME), "w") as f:
+		json.dump(_discarded_boards, f, indent=4)
+
+
+def write_compile_stats(_topic_cache_dir_path: str, _compile_stats: dict):
+	"""
+	Writes the counters of the last compile (see TopicCache.compile_stats) next to the segment file so cache health can be tracked across builds
+	"""
+	with open(os.path.join(_topic_cache_dir_path, COMPILE_STATS_FILE_NAME), "w") as f:
+		json.dump(_compile_stats, f, indent=4)
+
+
+def copy_board_entry(_old_segment: MappedCacheFile, _segment_file, _board_entry: dict) -> dict:
+	"""
+	Copies every record of a board entry from an old segment file to the end of an open segment file, without unpickling them
+	Returns the board entry with its offsets updated to the new segment file
+	"""
+	with _old_segment.record_view(*_board_entry["data"]) as record:
+		data_entry = append_raw_record(_segment_file, record)
+
+	topic_entries = []
+	for topic_name, offset, length in _board_entry["topics"]:
+		with _old_segment.record_view(offset, length) as record:
+			topic_entries.append((topic_name, *append_raw_record(_segment_file, record)))
+
+	return { **_board_entry, "data": data_entry, "topics": topic_entries }
+
+
+def board_entry_size(_board_entry: dict) -> int:
+	"""
+	Returns the number of bytes a board entry's records take up in its segment file
+	"""
+	return _board_entry["data"][1] + sum(length for topic_name, offset, length in _board_entry["topics"])
+
+
+def next_segment_name(_segment_name: str = None) -> str:
+	"""
+	Returns the file name of the next generation of a segment file (i.e. "segment_0", "segment_1", ...)
+	A rewritten segment never reuses the name of the one it replaces, since lazily loaded docs may still have it mapped
+	"""
+	generation = 0
+	if _segment_name is not None and _segment_name.startswith(f"{SEGMENT_FILE_NAME}_"):
+		generation = int(_segment_name.rsplit("_", 1)[1]) + 1
+	return f"{SEGMENT_FILE_NAME}_{generation}"
+
+
+def dump_cache_file(_filepath: str, _obj):
+	"""
+	Pickles an object into a cache file by writing a temporary file first and renaming it over the old one
+	So the cache file is either the old or the new version, never a partially written one
+	"""
+	temp_filepath = f"{_filepath}.tmp"
+	with open(temp_filepath, "wb") as f:
+		pickle.dump(_obj, f, pickle.DEFAULT_PROTOCOL)
+	os.replace(temp_filepath, _filepath)
+
+
+def load_segment_index(_topic_cache_dir_path: str) -> dict:
+	"""
+	Retrieves and loads the offset index of a version 3 segment file
+	"""
+	return load_cache_file(os.path.join(_topic_cache_dir_path, SEGMENT_INDEX_FILE_NAME))
+
+
+def shared_string(_topic_cache_obj, _string: str) -> str:
+	"""
+	Returns the interned copy of a string, counting the bytes saved whenever an equal string was already interned
+	"""
+	interned_string = sys.intern(_string)
+	if interned_string is not _string:
+		_topic_cache_obj._sharing_stats["interned_strings"] += 1
+		_topic_cache_obj._sharing_stats["saved_bytes"] += sys.getsizeof(_string)
+	return interned_string
+
+
+def shared_value(_topic_cache_obj, _value):
+	"""
+	Returns the shared copy of a string or tag found inside a topic attribute
+	Lists & dicts are updated in place instead of shared, since callers may still modify them (i.e. other_topic_names)
+	Tags are only shared when they compare by value, the first tag of its kind being the one every equal tag gets replaced with
+	"""
+	value_type = type(_value)
+	if value_type is str:
+		return shared_string(_topic_cache_obj, _value)
+	if value_type is list:
+		for idx, item in enumerate(_value):
+			_value[idx] = shared_value(_topic_cache_obj, item)
+		return _value
+	if value_type is dict:
+		items = [(shared_value(_topic_cache_obj, key), shared_value(_topic_cache_obj, item)) for key, item in _value.items()]
+		_value.clear()
+		_value.update(items)
+		return _value
+	if value_type is tuple:
+		return tuple([shared_value(_topic_cache_obj, item) for item in _value])
+	if value_type.__hash__ in (None, object.__hash__) or value_type.__eq__ is object.__eq__ or not hasattr(_value, "__dict__"):
+		return _value
+
+	shared_tag = _topic_cache_obj._shared_tags.setdefault(_value, _value)
+	if shared_tag is _value:
+		for name, item in vars(_value).items():
+			if type(item) is str:
+				_value.__dict__[name] = shared_string(_topic_cache_obj, item)
+	else:
+		_topic_cache_obj._sharing_stats["shared_tags"] += 1
+		_topic_cache_obj._sharing_stats["saved_bytes"] += sys.getsizeof(_value) + sys.getsizeof(vars(_value)) + \
+			sum(sys.getsizeof(item) for item in vars(_value).values() if type(item) is str)
+	return shared_tag
+
+
+def share_topic_values(_topic_cache_obj, _topic_obj):
+	"""
+	Interns the repeated strings and shares the repeated tags of a freshly loaded topic (in place), so thousands of topics
+	Referencing the same topic names, fallback contexts & tags only keep a single copy of each around
+
+	Returns:
+		The same topic object
+	"""
+	topic_attributes = getattr(_topic_obj, "__dict__", {})
+	for attribute_name in SHARED_TOPIC_ATTRIBUTE_NAMES:
+		if attribute_name in topic_attributes:
+			topic_attributes[attribute_name] = shared_value(_topic_cache_obj, topic_attributes[attribute_name])
+	return _topic_obj
+
+
+def share_doc_values(_topic_cache_obj, _doc_sub_cache):
+	"""
+	Runs share_topic_values() on every topic of a freshly loaded doc, interning the topic names as well
+	Lazily loaded topics get shared once they're loaded instead
+	"""
+	if isinstance(_doc_sub_cache.topics, _topic_cache_obj.LazyTopics):
+		_doc_sub_cache.topics.share_values(partial(share_topic_values, _topic_cache_obj))
+		return
+	_doc_sub_cache.topics = { shared_string(_topic_cache_obj, topic_name): share_topic_values(_topic_cache_obj, topic_obj)
+							  for topic_name, topic_obj in _doc_sub_cache.topics.items() }
+
+
+def source_file_state(_filepath: str, _known_state: tuple = None) -> tuple:
+	"""
+	Returns the (mtime, size, content digest) of a source file, or None if it doesn't exist anymore
+	The file only gets read when its mtime or size differ from the known state's, otherwise the known digest is kept
+
+	Args:
+		_filepath: the source file's path
+		_known_state: a previous state of the same file (i.e. from a snapshot), if any
+	"""
+	try:
+		stat = os.stat(_filepath)
+	except OSError:
+		return None
+	if _known_state is not None and tuple(_known_state[:2]) == (stat.st_mtime_ns, stat.st_size):
+		return _known_state
+	with open(_filepath, "rb") as f:
+		digest = hashlib.blake2b(f.read(), digest_size=SOURCE_FILE_DIGEST_SIZE).digest()
+	return stat.st_mtime_ns, stat.st_size, digest
+
+
+def snapshot_key(_file_states: dict) -> str:
+	"""
+	Returns the key of a snapshot: a hash of every source file path along with its content digest (mtimes don't matter)
+	"""
+	key = hashlib.blake2b(digest_size=SOURCE_FILE_DIGEST_SIZE)
+	for filepath in sorted(_file_states):
+		key.update(filepath.encode("utf-8"))
+		key.update(_file_states[filepath][2])
+	return key.hexdigest()
+
+
+def load_snapshots(_topic_cache_dir_path: str, _segment_name: str) -> list:
+	"""
+	Returns every snapshot still sharing this segment file, least recently used first (the index being the most recent one)
+	Each snapshot is a dict holding its key, the state of each of its source files and its board entries
+	Indexes written before snapshots existed don't have source file states, so they can't be a snapshot
+	"""
+	if _segment_name is None:
+		return []
+
+	snapshots = []
+	snapshots_path = os.path.join(_topic_cache_dir_path, SNAPSHOTS_FILE_NAME)
+	if os.path.exists(snapshots_path):
+		snapshots_file = load_cache_file(snapshots_path)
+		if snapshots_file.get(SEGMENT_INDEX_SEGMENT_KEY) == _segment_name:
+			snapshots.extend(snapshots_file[SNAPSHOTS_KEY])
+
+	if os.path.exists(os.path.join(_topic_cache_dir_path, SEGMENT_INDEX_FILE_NAME)):
+		segment_index = load_segment_index(_topic_cache_dir_path)
+		if segment_index.get(SEGMENT_INDEX_SEGMENT_KEY, SEGMENT_FILE_NAME) == _segment_name and segment_index.get(SEGMENT_INDEX_SNAPSHOT_KEY) is not None:
+			snapshots.append(index_snapshot(segment_index))
+	return snapshots
+
+
+def index_snapshot(_segment_index: dict) -> dict:
+	return { "key": _segment_index.get(SEGMENT_INDEX_SNAPSHOT_KEY), "files": _segment_index.get(SEGMENT_INDEX_FILES_KEY),
+			 "boards": _segment_index[SEGMENT_INDEX_BOARDS_KEY] }
+
+
+def choose_snapshot(_snapshots: list) -> tuple:
+	"""
+	Picks the snapshot with the fewest source files changed since it was written, preferring the most recently used one on ties
+	(Fewest changes rather than most matches, so a snapshot still holding since removed source files doesn't win for being bigger)
+	Every source file gets read at most once, and only if its mtime or size changed (i.e. after switching branches)
+
+	Args:
+		_snapshots: every snapshot, most recently used first
+
+	Returns:
+		The chosen snapshot, the current state of each of its source files and the source files that changed since it was written
+	"""
+	current_states = {}
+	best = None
+	for snapshot in _snapshots:
+		if snapshot["files"] is None:
+			if best is None:
+				best = (None, snapshot, [])
+			continue
+
+		changed_files = []
+		for filepath, file_state in snapshot["files"].items():
+			if filepath not in current_states:
+				current_states[filepath] = source_file_state(filepath, file_state)
+			if current_states[filepath] is None or current_states[filepath][2] != file_state[2]:
+				changed_files.append(filepath)
+
+		if best is None or best[0] is None or len(changed_files) < best[0]:
+			best = (len(changed_files), snapshot, changed_files)
+
+	changed_count, snapshot, changed_files = best
+	file_states = { filepath: current_states[filepath] for filepath in (snapshot["files"] or {}) if current_states[filepath] is not None }
+	return snapshot, file_states, changed_files
 
 
-def downgrade_v2_to_v1():
+def find_instructions(_instructions: list, _func_prefix: str) -> list:
+	"""
+	Returns every instruction whose function name starts with this prefix (i.e. "load_" or "downgrade_")
+	"""
+	return [instruction for instruction in _instructions if instruction["func"].__name__.startswith(_func_prefix)]
+
+
+def version_instructions(_version: int) -> list:
+	"""
+	Returns a new instructions list (downgrade instruction first, load instruction second) for this build version
+	Version 1 builds predate instructions, so they don't have any
+	"""
+	if _version == 1:
+		return []
+
+	downgrade_func, load_func = VERSION_INSTRUCTION_FUNCS[_version]
+	return [
+		{ "version": _version, "func": downgrade_func, "extra_args": None },
+		{ "version": _version, "func": load_func, "extra_args": None }
+	]
+
+
+def legacy_doc_record(_doc_sub_cache, _topics: dict = None):
+	"""
+	Creates a copy of a doc the way version 1 & 2 builds pickled it, with a "board" attribute instead of a board descriptor
+	The board is stored as a plain namespace holding the board descriptor's fields, so older compilers can unpickle it
+	Without knowing about board descriptors (they only ever use the board's name, uuid and parent filepath)
+	"""
+	board_descriptor = _doc_sub_cache.board_descriptor
+	legacy_board = types.SimpleNamespace(uuid=board_descriptor.uuid, name=board_descriptor.name, order=board_descriptor.order,
+										 parent=types.SimpleNamespace(filepath=board_descriptor.filepath))
+
+	legacy_doc = copy.copy(_doc_sub_cache)
+	legacy_doc.__dict__ = { "filename": _doc_sub_cache.filename, "board": legacy_board, "topics": _topics if _topics is not None else {} }
+	return legacy_doc
+
+
+def dump_streamed_doc_list(_f, _docs):
+	"""
+	Pickles {"_docs": [doc, doc, ...]} (i.e. the version 1 TopicCache file) while only ever holding a single doc in memory
+	Each doc is pickled on its own and spliced into the list with an APPEND opcode.
+	Protocol 2 memo opcodes carry explicit indices, so every doc's pickle stays valid even though their memos overlap
+
+	Args:
+		_f: the open file to write to
+		_docs: an iterable (i.e. generator) of docs
+	"""
+	_f.write(pickle.PROTO + bytes([2]) + pickle.EMPTY_DICT)
+	_f.write(pickle.dumps(DOCS_ATTRIBUTE_NAME, 2)[2:-1])
+	_f.write(pickle.EMPTY_LIST)
+	for doc in _docs:
+		_f.write(pickle.dumps(doc, 2)[2:-1])
+		_f.write(pickle.APPEND)
+	_f.write(pickle.SETITEM + pickle.STOP)
+
+
+def downgrade_v2_to_v1(_topic_cache_obj, _doc_data_files, _doc_topic_files, _additional_args=None):
 	"""
 	Given a version 2 build, downgrade it to version 1 build by removing these attributes:
 	An official version number and downgrade instructions
+	Every board found in the TopicCache_V2 directory is loaded (along with its topics) one at a time and streamed
+	Into the single TopicCache file version 1 builds expect. Only that file remains afterwards
+
+	**IMPORTANT NOTE: _topic_cache_obj must be a TopicCache object that we take in and return!**
+
+	Args:
+		_topic_cache_obj: the current TopicCache object
+		_doc_data_files: current number of converted data files
+		_doc_topic_files: current number of converted topic files
+		_additional_args: optional arguments needed for this specific downgrade
 	"""
-	# TODO: implement this specific downgrade
-	raise NotImplementedError(f"No downgrade instructions available for version '{_topic_cache_file.version}'.")
+	_topic_cache_dir_path = _topic_cache_obj.topic_cache_dir_path(version=2)
+	p = pathlib.Path(_topic_cache_dir_path).glob('*/*')
+	all_doc_subcaches = [str(x) for x in p if x.is_file() and not x.name.startswith(".") and x.name.endswith("_data")]
+
+	def legacy_docs():
+		nonlocal _doc_data_files, _doc_topic_files
+		for doc_data_path in tqdm.tqdm(all_doc_subcaches, ncols=100, desc=f"Downgrading all '{DOCS_ATTRIBUTE_NAME}' in topic sub caches to version '1'",
+									   disable=globals.DISABLE_PROGRESS_BARS):
+			doc_sub_cache, doc_topic_files = load_v2_board(_topic_cache_dir_path, doc_data_path)
+			_doc_data_files += 1
+			_doc_topic_files += doc_topic_files
+			yield legacy_doc_record(doc_sub_cache, doc_sub_cache.topics)
+
+	# The version 1 TopicCache file replaces the current one in a single rename, so a failed downgrade leaves the version 2 build intact
+	_topic_cache_filepath = os.path.join(CACHE_SUB_DIR, _topic_cache_obj.__class__.__name__)
+	with open(f"{_topic_cache_filepath}.tmp", "wb") as f:
+		dump_streamed_doc_list(f, legacy_docs())
+	os.replace(f"{_topic_cache_filepath}.tmp", _topic_cache_filepath)
+	shutil.rmtree(_topic_cache_dir_path)
+
+	setattr(_topic_cache_obj, VERSION_ATTRIBUTE_NAME, 1)
+	setattr(_topic_cache_obj, INSTRUCTIONS_ATTRIBUTE_NAME, version_instructions(1))
+
+	logging.info(f"Downgraded from v2 to v1. Total data files converted '{_doc_data_files}'. Total topic files converted '{_doc_topic_files}'.")
+
+	return _doc_data_files, _doc_topic_files
+
+
+def downgrade_v3_to_v2(_topic_cache_obj, _doc_data_files, _doc_topic_files, _additional_args=None):
+	"""
+	Given a version 3 build, downgrade it to version 2 build by unpacking its segment file
+	Back into one data file per board and one topic file per topic
+	Generic pickle topic records are copied straight out of the mapped segment, compact ones get decoded and pickled the way version 2 builds expect
+	Either way, only one board record is loaded at a time
+
+	**IMPORTANT NOTE: _topic_cache_obj must be a TopicCache object that we take in and return!**
+
+	Args:
+		_topic_cache_obj: the current TopicCache object
+		_doc_data_files: current number of converted data records
+		_doc_topic_files: current number of converted topic records
+		_additional_args: optional arguments needed for this specific downgrade
+	"""
+	_v3_topic_cache_dir_path = _topic_cache_obj.topic_cache_dir_path(version=3)
+	_v2_topic_cache_dir_path = _topic_cache_obj.topic_cache_dir_path(version=2)
+	segment_index = load_segment_index(_v3_topic_cache_dir_path)
+	segment_name = segment_index.get(SEGMENT_INDEX_SEGMENT_KEY, SEGMENT_FILE_NAME)
+	topic_codec = TopicRecordCodec(segment_index.get(SEGMENT_INDEX_SCHEMAS_KEY))
+
+	# Unpack into a temporary directory first so a failed downgrade never leaves a partial TopicCache_V2 directory behind
+	_temp_topic_cache_dir_path = f"{_v2_topic_cache_dir_path}.tmp"
+	for dir_path in [_temp_topic_cache_dir_path, _v2_topic_cache_dir_path]:
+		if os.path.isdir(dir_path):
+			shutil.rmtree(dir_path)
+
+	with MappedCacheFile(os.path.join(_v3_topic_cache_dir_path, segment_name)) as segment:
+		for board_entry in tqdm.tqdm(segment_index[SEGMENT_INDEX_BOARDS_KEY], ncols=100, desc=f"Downgrading all '{DOCS_ATTRIBUTE_NAME}' in topic sub caches to version '2'",
+									 disable=globals.DISABLE_PROGRESS_BARS):
+			if not verify_board_entry(segment, board_entry):
+				raise Exception(f"Board record '{board_entry['key']}' failed its checksum, can't downgrade a corrupt topic cache.")
+
+			# The {doc_dir_path}_{board_name} directory holds one file per topic, named after the topic
+			doc_dir_path = os.path.join(_temp_topic_cache_dir_path, board_entry["key"])
+			os.makedirs(doc_dir_path)
+			for topic_name, offset, length in board_entry["topics"]:
+				with segment.record_view(offset, length) as record, open(os.path.join(doc_dir_path, topic_name), "wb") as f:
+					f.write(topic_codec.generic_record(record))
+				_doc_topic_files += 1
+
+			# Lastly, create the {doc_dir_path}_{board_name}_data file
+			doc_sub_cache = segment.read_record(*board_entry["data"])
+			with open(f"{doc_dir_path}_data", "wb") as f:
+				pickle.dump(legacy_doc_record(doc_sub_cache), f, pickle.DEFAULT_PROTOCOL)
+			_doc_data_files += 1
+
+	os.replace(_temp_topic_cache_dir_path, _v2_topic_cache_dir_path)
+
+	setattr(_topic_cache_obj, VERSION_ATTRIBUTE_NAME, 2)
+	setattr(_topic_cache_obj, INSTRUCTIONS_ATTRIBUTE_NAME, version_instructions(2))
+
+	# Only switch the TopicCache file over to version 2 once its directory is complete, then drop the version 3 one
+	dump_cache_file(os.path.join(CACHE_SUB_DIR, _topic_cache_obj.__class__.__name__), _topic_cache_obj.shallow_copy())
+	shutil.rmtree(_v3_topic_cache_dir_path)
+
+	logging.info(f"Downgraded from v3 to v2. Updated '{VERSION_ATTRIBUTE_NAME}' attribute with value '{_topic_cache_obj.version}'. "
+				 f"Updated '{INSTRUCTIONS_ATTRIBUTE_NAME}' attribute with value '{_topic_cache_obj.instructions}'. "
+				 f"Total data records converted '{_doc_data_files}'. Total topic records converted '{_doc_topic_files}'.")
+
+	return _doc_data_files, _doc_topic_files
 
 
 def upgrade_v1_to_v2(_topic_cache_obj, _doc_data_files, _doc_topic_files, _additional_args=None):
@@ -37,18 +530,36 @@ def upgrade_v1_to_v2(_topic_cache_obj, _doc_data_files, _doc_topic_files, _addit
 	    _doc_topic_files: current number of loaded topic files
 	    _additional_args: optional arguments needed for this specific upgrade
 	"""
-	_v2_instructions = [
-		{ "version": 2, "func": downgrade_v2_to_v1, "extra_args": None },
-		{ "version": 2, "func": load_v2, "extra_args": None }
-	]
-
 	setattr(_topic_cache_obj, VERSION_ATTRIBUTE_NAME, 2)
-	setattr(_topic_cache_obj, INSTRUCTIONS_ATTRIBUTE_NAME, _v2_instructions)
+	setattr(_topic_cache_obj, INSTRUCTIONS_ATTRIBUTE_NAME, version_instructions(2))
 
 	logging.info(f"Upgraded from v1 to v2. Updated '{VERSION_ATTRIBUTE_NAME}' attribute with value '{_topic_cache_obj.version}'. "
 				 f"New '{INSTRUCTIONS_ATTRIBUTE_NAME}' attribute added with value '{_topic_cache_obj.instructions}'. "
 				 f"Total data files loaded '{_doc_data_files}'. Total topic files loaded '{_doc_topic_files}'.")
-	
+
+	return _doc_data_files, _doc_topic_files
+
+
+def upgrade_v2_to_v3(_topic_cache_obj, _doc_data_files, _doc_topic_files, _additional_args=None):
+	"""
+	Given a version 2 build, upgrade it to version 3 build by updating its version number and downgrade instructions
+	The doc list loaded from the TopicCache_V2 directory stays the same; the next write() packs it into a single segment file
+
+	**IMPORTANT NOTE: _topic_cache_obj must be a TopicCache object that we take in and return!**
+
+	Args:
+		_topic_cache_obj: the current TopicCache object
+		_doc_data_files: current number of loaded data files
+		_doc_topic_files: current number of loaded topic files
+		_additional_args: optional arguments needed for this specific upgrade
+	"""
+	setattr(_topic_cache_obj, VERSION_ATTRIBUTE_NAME, 3)
+	setattr(_topic_cache_obj, INSTRUCTIONS_ATTRIBUTE_NAME, version_instructions(3))
+
+	logging.info(f"Upgraded from v2 to v3. Updated '{VERSION_ATTRIBUTE_NAME}' attribute with value '{_topic_cache_obj.version}'. "
+				 f"Updated '{INSTRUCTIONS_ATTRIBUTE_NAME}' attribute with value '{_topic_cache_obj.instructions}'. "
+				 f"Total data files loaded '{_doc_data_files}'. Total topic files loaded '{_doc_topic_files}'.")
+
 	return _doc_data_files, _doc_topic_files
 
 
@@ -70,7 +581,8 @@ def load_v1(_topic_cache_obj, _topic_cache_file, _doc_data_files, _doc_topic_fil
 	    # Now add every topic and its topic object found in the list of docs inside TopicCache._docs
 	    for doc_sub_cache in tqdm.tqdm(doc_list, ncols=100, desc=f"Loading new '{DOCS_ATTRIBUTE_NAME}' in topic sub caches", disable=globals.DISABLE_PROGRESS_BARS):
 	        for doc_topic_name, doc_topic_object in doc_sub_cache.topics.items():
-	            _topic_cache_obj.add(doc_topic_name, doc_sub_cache.board, doc_topic_object)
+	            _topic_cache_obj.add(shared_string(_topic_cache_obj, doc_topic_name), doc_sub_cache.board_descriptor,
+	                                 share_topic_values(_topic_cache_obj, doc_topic_object))
 	            _doc_topic_files += 1
 
 	# since add() (located a few lines above) already checks for board uniqueness and groups docs by boards,
@@ -80,10 +592,44 @@ def load_v1(_topic_cache_obj, _topic_cache_file, _doc_data_files, _doc_topic_fil
 	return _doc_data_files, _doc_topic_files
 
 
+def load_v2_board(_topic_cache_dir_path: str, _doc_data_path: str) -> tuple:
+	"""
+	Retrieves and loads a single "data" file of a version 2 build along with every topic file of its board
+	Runs inside the load_v2() worker pool, so it must never touch the TopicCache object itself
+
+	Args:
+		_topic_cache_dir_path: the TopicCache_V2 directory path
+		_doc_data_path: the "data" file path
+
+	Returns:
+		The loaded doc (with all its topics) and the number of topic files loaded
+	"""
+	# First retrieve and load the info found inside the "data" file
+	doc_sub_cache = load_cache_file(_doc_data_path)
+	doc_topic_files = 0
+
+	# Now we retreive and load each of the individual topic files containing single entry dicts
+	# The "topic_cache_dir_path()" of a TopicCache object combined with .doc_dir_path()" of a data file
+	# Returns the exact filepath of the folder containing its topics
+	doc_path_name = os.path.join(_topic_cache_dir_path, doc_sub_cache.doc_dir_path())
+	for topic_file in os.listdir(doc_path_name):
+		doc_topic_path = os.path.join(doc_path_name, topic_file)
+		topic_file = load_cache_file(doc_topic_path)
+		doc_topic_files += 1
+
+		# Append this retrieved topic file info into its respective "data" file object
+		for topic_name in topic_file.keys():
+			topic_obj = topic_file[topic_name]
+			doc_sub_cache.topics[topic_name] = topic_obj
+
+	return doc_sub_cache, doc_topic_files
+
+
 def load_v2(_topic_cache_obj, _topic_cache_file, _doc_data_files, _doc_topic_files):
 	"""
 	Given the TopicCache_V2 directory found in version 2 builds, 
 	Retrieves all its data & topics files and store them inside TopicCache._docs
+	Boards are loaded by a pool of "TopicCache.load_workers" workers, but still get added in the same order as a serial load
 
 	**IMPORTANT NOTE: _topic_cache_obj must be a TopicCache object that we take in and return!**
 
@@ -94,38 +640,144 @@ def load_v2(_topic_cache_obj, _topic_cache_file, _doc_data_files, _doc_topic_fil
 	    _doc_topic_files: current number of loaded topic files
 	"""
 	# Grabs all the "data" sub directory files in topic cache only
-	_topic_cache_dir_path = _topic_cache_obj.topic_cache_dir_path()
+	# The TopicCache object may already be on a newer version, so always look inside the version 2 directory
+	_topic_cache_dir_path = _topic_cache_obj.topic_cache_dir_path(version=2)
 	p = pathlib.Path(_topic_cache_dir_path).glob('*/*')
-	all_doc_subcaches = [x for x in p if x.is_file() and not x.name.startswith(".") and x.name.endswith("_data")]
-
-	for doc_sub_cache in tqdm.tqdm(all_doc_subcaches, ncols=100, desc=f"Loading all '{DOCS_ATTRIBUTE_NAME}' in topic sub caches version '{_topic_cache_obj.version}'",
-								   disable=globals.DISABLE_PROGRESS_BARS):
-	    # First retrieve and load the info found inside each "data" file
-	    data = bytearray()
-	    with open(doc_sub_cache, "rb") as f:
-	        for byte in iter(partial(f.read, 1024), b''):
-	            data += bytearray(byte)
-	        doc_sub_cache = pickle.loads(data)
-	    _doc_data_files += 1
-
-	    # Now we retreive and load each of the individual topic files containing single entry dicts
-	    # The "topic_cache_dir_path()" of a TopicCache object combined with .doc_dir_path()" of a data file
-	    # Returns the exact filepath of the folder containing its topics
-	    doc_path_name = os.path.join(_topic_cache_dir_path, doc_sub_cache.doc_dir_path())
-	    for topic_file in os.listdir(doc_path_name):
-	        doc_topic_path = os.path.join(doc_path_name, topic_file)
-	        topic_data = bytearray()
-	        with open(doc_topic_path, "rb") as f:
-	            for byte in iter(partial(f.read, 1024), b''):
-	                topic_data += bytearray(byte)
-	            topic_file = pickle.loads(topic_data)
-	        _doc_topic_files += 1
-
-	        # Append this retrieved topic file info into its respective "data" file object
-	        for topic_name in topic_file.keys():
-	            topic_obj = topic_file[topic_name]
-	            doc_sub_cache.topics[topic_name] = topic_obj
-
-	    _topic_cache_obj._docs.append(doc_sub_cache)
+	all_doc_subcaches = [str(x) for x in p if x.is_file() and not x.name.startswith(".") and x.name.endswith("_data")]
+
+	# Threads overlap the file reads; processes also unpickle in parallel, at the cost of pickling each loaded doc back to this process
+	workers = min(_topic_cache_obj.load_workers, len(all_doc_subcaches))
+	executor = None
+	if workers > 1:
+		executor_class = ProcessPoolExecutor if _topic_cache_obj.load_in_processes else ThreadPoolExecutor
+		executor = executor_class(max_workers=workers)
+
+	try:
+		# map() hands back results in submission order, and any worker exception is re-raised right here,
+		# So the doc list and the failure behaviour are the same as loading every board one after another
+		load_board = partial(load_v2_board, _topic_cache_dir_path)
+		if executor is None:
+			loaded_doc_subcaches = map(load_board, all_doc_subcaches)
+		else:
+			loaded_doc_subcaches = executor.map(load_board, all_doc_subcaches, chunksize=max(1, len(all_doc_subcaches) // (workers * 4)))
+
+		for doc_sub_cache, doc_topic_files in tqdm.tqdm(loaded_doc_subcaches, total=len(all_doc_subcaches), ncols=100,
+														desc=f"Loading all '{DOCS_ATTRIBUTE_NAME}' in topic sub caches version '2'", disable=globals.DISABLE_PROGRESS_BARS):
+			_doc_data_files += 1
+			_doc_topic_files += doc_topic_files
+			share_doc_values(_topic_cache_obj, doc_sub_cache)
+			_topic_cache_obj.add_doc(doc_sub_cache)
+	finally:
+		if executor is not None:
+			executor.shutdown(cancel_futures=True)
+
+	return _doc_data_files, _doc_topic_files
+
+
+def load_v3(_topic_cache_obj, _topic_cache_file, _doc_data_files, _doc_topic_files):
+	"""
+	Given the TopicCache_V3 directory found in version 3 builds,
+	Retrieves every board & topic record from its segment file and store them inside TopicCache._docs
+
+	**IMPORTANT NOTE: _topic_cache_obj must be a TopicCache object that we take in and return!**
+
+	Args:
+		_topic_cache_obj: the current TopicCache object
+		_topic_cache_file: the current TopicCache file
+		_doc_data_files: current number of loaded data records
+		_doc_topic_files: current number of loaded topic records
+	"""
+	# The index lists every board record (i.e. the old "data" files) along with the offsets of its topic records
+	_topic_cache_dir_path = _topic_cache_obj.topic_cache_dir_path(version=3)
+	segment_index = load_segment_index(_topic_cache_dir_path)
+	segment_name = segment_index.get(SEGMENT_INDEX_SEGMENT_KEY, SEGMENT_FILE_NAME)
+	# Indexes written before compact topic records existed have no schemas (every topic record is a generic pickle)
+	topic_codec = TopicRecordCodec(segment_index.get(SEGMENT_INDEX_SCHEMAS_KEY))
+
+	# Every snapshot shares the segment file, so load whichever one matches the source files on disk best (i.e. after switching branches)
+	# Boards of source files that changed since that snapshot got written are left out; those files have to be compiled again
+	snapshots = load_snapshots(_topic_cache_dir_path, segment_name)[::-1] or [index_snapshot(segment_index)]
+	snapshot, source_file_states, changed_files = choose_snapshot(snapshots)
+	if snapshot["files"] is not None:
+		logging.info(f"Loading topic cache snapshot '{snapshot['key']}' ('{len(snapshots)}' snapshots kept). "
+					 f"'{len(snapshot['files']) - len(changed_files)}' of its '{len(snapshot['files'])}' source files are unchanged.")
+
+	# When lazy loading, the segment has to stay mapped for as long as its docs may still load topics from it
+	segment = MappedCacheFile(os.path.join(_topic_cache_dir_path, segment_name))
+	try:
+		for board_entry in tqdm.tqdm(snapshot["boards"], ncols=100, desc=f"Loading all '{DOCS_ATTRIBUTE_NAME}' in topic sub caches version '3'",
+									 disable=globals.DISABLE_PROGRESS_BARS):
+			if board_entry.get("filepath") in changed_files:
+				continue
+
+			# A corrupt board only loses that board (and the rest of its source file's boards, see below), not the whole cache
+			doc_sub_cache = None
+			try:
+				if _topic_cache_obj.lazy_loading:
+					# Hashing every record would read the whole segment, so only the board record gets loaded (and every record located) up front
+					# The rest get checked against the board checksum the first time one of the board's topics is loaded
+					if not board_entry_in_bounds(board_entry, len(segment)):
+						raise Exception("record past the end of the segment file")
+				elif not verify_board_entry(segment, board_entry):
+					raise Exception("checksum mismatch")
+				doc_sub_cache = segment.read_record(*board_entry["data"])
+
+				if _topic_cache_obj.lazy_loading:
+					# Only keep track of where each topic record is; they get loaded on first access
+					doc_sub_cache.topics = _topic_cache_obj.LazyTopics(segment, board_entry["topics"], topic_codec, board_entry)
+				else:
+					for topic_name, offset, length in board_entry["topics"]:
+						with segment.record_view(offset, length) as record:
+							topic_name, topic_obj = topic_codec.decode(record)
+						doc_sub_cache.topics[topic_name] = topic_obj
+			except Exception as e:
+				# Entries written before checksums existed don't store their filepath, but the board record may still have loaded
+				if "filepath" not in board_entry and doc_sub_cache is not None:
+					board_entry = { **board_entry, "filepath": doc_sub_cache.filepath, "board": doc_sub_cache.board_descriptor.name }
+				discard_board_entry(_topic_cache_obj, board_entry, str(e))
+				continue
+
+			_doc_data_files += 1
+			_doc_topic_files += len(board_entry["topics"])
+
+			share_doc_values(_topic_cache_obj, doc_sub_cache)
+
+			# Docs loaded from the segment are already written, so the next write() keeps their records as they are
+			# Unless their record still holds a full board object instead of a board descriptor
+			_topic_cache_obj.add_doc(doc_sub_cache, is_dirty=doc_sub_cache._is_legacy_record)
+			_topic_cache_obj._segment_entries[board_entry["key"]] = board_entry
+
+		_topic_cache_obj._segment_name = segment_name
+		_topic_cache_obj._topic_codec = topic_codec
+		_topic_cache_obj._loaded_snapshot = snapshot if snapshot["key"] is not None else None
+		_topic_cache_obj._source_file_states = source_file_states
+		_topic_cache_obj._changed_files = changed_files
+	finally:
+		if not _topic_cache_obj.lazy_loading:
+			segment.close()
+
+	if changed_files:
+		logging.warning(f"'{len(changed_files)}' source files changed since topic cache snapshot '{snapshot['key']}' was written. "
+						f"Source files scheduled for recompilation: {changed_files}")
+
+	# The source file of a discarded board has to be compiled again from scratch, so drop its remaining boards as well
+	if _topic_cache_obj.discarded_boards:
+		for filepath in _topic_cache_obj.files_to_recompile:
+			_topic_cache_obj.remove_objects_for_file(filepath)
+		logging.warning(f"Discarded '{len(_topic_cache_obj.discarded_boards)}' corrupt board records. "
+						f"Source files scheduled for recompilation: {_topic_cache_obj.files_to_recompile}")
+	write_discarded_boards_report(_topic_cache_dir_path, _topic_cache_obj.discarded_boards)
 
 	return _doc_data_files, _doc_topic_files
+
+
+# The downgrade & load functions of every build version with instructions, see version_instructions()
+VERSION_INSTRUCTION_FUNCS = {
+	2: (downgrade_v2_to_v1, load_v2),
+	3: (downgrade_v3_to_v2, load_v3)
+}
+# Upgrade functions keyed by the build version they upgrade from
+UPGRADE_FUNCS = {
+	1: upgrade_v1_to_v2,
+	2: upgrade_v2_to_v3
+}
@@ -0,0 +1,197 @@
+# README: compact, versioned encoding of the topic records stored in the "topic_cache.py" segment file
+
+from typing import Any, List, Tuple
+
+import copyreg
+import importlib
+import io
+import pickle
+import struct
+import sys
+
+# Every compact record starts with these bytes; any other record is a generic pickle of a {topic_name: topic_obj} dict
+RECORD_MAGIC = b"TR"
+RECORD_ENCODING_VERSION = 1
+# Text attributes at least this long are stored as protocol 5 out-of-band buffers instead of inside the pickle stream
+# (Below this, the extra buffer bookkeeping costs more than copying the text through the pickle stream does)
+OUT_OF_BAND_TEXT_LENGTH = 16 * 1024
+
+# magic, encoding version, number of out-of-band buffers (each buffer length follows the header, each buffer follows the body)
+_RECORD_HEADER = struct.Struct("<2sBH")
+
+
+class _TopicReference(Exception):
+    """
+    Raised while encoding a topic object that (indirectly) references an object of its own class
+    """
+
+
+def _reject_topic_reference(obj):
+    raise _TopicReference()
+
+
+def _is_plain_type(value_type: type) -> bool:
+    """
+    Only objects pickle would save as "new instance of class + __dict__" can be rebuilt from their attribute values alone
+    """
+    return "<locals>" not in value_type.__qualname__ \
+        and all(base.__module__ != "builtins" for base in value_type.__mro__[:-1]) \
+        and value_type.__reduce_ex__ is object.__reduce_ex__ \
+        and value_type.__reduce__ is object.__reduce__ \
+        and getattr(value_type, "__getstate__", None) is getattr(object, "__getstate__", None) \
+        and not hasattr(value_type, "__setstate__") \
+        and not hasattr(value_type, "__getnewargs__") \
+        and not hasattr(value_type, "__getnewargs_ex__") \
+        and not hasattr(value_type, "__slots__")
+
+
+class TopicRecordCodec:
+    """
+    Encodes topic records as a plain (topic name, schema id, attribute values) tuple instead of pickling the topic object itself.
+    A schema (the topic's class path and attribute names) is stored once in the segment index rather than in every record,
+    so decoding skips the class lookup and attribute dict of every record and shares the schema's interned attribute names.
+    Attribute values are still pickled as they are (i.e. sel tags), and long text attributes are stored as out-of-band buffers
+
+    Topics that can't be rebuilt from their attribute values alone (custom pickling, or objects of their own class inside them)
+    Are written as the generic pickle records older builds wrote, which decode() still reads as well
+    """
+    _schemas: List[Tuple[str, str, Tuple[str, ...]]]
+
+    def __init__(self, schemas: List[Tuple[str, str, Tuple[str, ...]]] = None):
+        self._schemas = list(schemas or [])
+        self._schema_ids = {schema: schema_id for schema_id, schema in enumerate(self._schemas)}
+        self._schema_classes = {}
+        self._dispatch_tables = {}
+        # A single pickler gets reused for every record (clearing its memo in between), creating one per record costs about as much as the record
+        # Its stream always starts with the header of a record without out-of-band buffers
+        self._body = io.BytesIO(_RECORD_HEADER.pack(RECORD_MAGIC, RECORD_ENCODING_VERSION, 0))
+        self._pickler = pickle.Pickler(self._body, protocol=5)
+
+    def __reduce__(self):
+        # Only the schemas are needed to decode records again, the pickler & lookup caches get recreated
+        return self.__class__, (self._schemas,)
+
+    @property
+    def schemas(self) -> List[Tuple[str, str, Tuple[str, ...]]]:
+        return self._schemas
+
+    @staticmethod
+    def is_compact(record) -> bool:
+        return record[:len(RECORD_MAGIC)] == RECORD_MAGIC
+
+    def encode(self, topic_name: str, topic_obj) -> bytes:
+        """
+        Returns the encoded record of a single topic
+        Most records are small, so the body gets pickled right after a header without out-of-band buffers first,
+        And only records that turn out big enough to hold long text get pickled again with out-of-band buffers
+        """
+        schema_id = self._schema_id(topic_obj)
+        if schema_id is None:
+            return pickle.dumps({topic_name: topic_obj}, pickle.DEFAULT_PROTOCOL)
+
+        values = tuple(topic_obj.__dict__.values())
+        body = self._body
+        body.seek(_RECORD_HEADER.size)
+        body.truncate()
+        self._pickler.clear_memo()
+        # The topic object itself isn't part of the pickle stream, so references back to it couldn't be restored
+        self._pickler.dispatch_table = self._dispatch_tables[type(topic_obj)]
+        try:
+            self._pickler.dump((topic_name, schema_id, values))
+            if body.tell() < OUT_OF_BAND_TEXT_LENGTH + _RECORD_HEADER.size:
+                return body.getvalue()
+            return self._encode_out_of_band(topic_name, schema_id, values)
+        except _TopicReference:
+            return pickle.dumps({topic_name: topic_obj}, pickle.DEFAULT_PROTOCOL)
+
+    def _encode_out_of_band(self, topic_name: str, schema_id: int, values: tuple) -> bytes:
+        """
+        Returns the encoded record of a topic with its long text attributes as out-of-band buffers
+        (Or the record encode() just pickled, if none of its text attributes is long enough)
+        """
+        values = tuple([pickle.PickleBuffer(value.encode("utf-8")) if type(value) is str and len(value) >= OUT_OF_BAND_TEXT_LENGTH else value
+                        for value in values])
+        if all(type(value) is not pickle.PickleBuffer for value in values):
+            return self._body.getvalue()
+
+        out_of_band_buffers = []
+        body = io.BytesIO()
+        pickler = pickle.Pickler(body, protocol=5, buffer_callback=out_of_band_buffers.append)
+        pickler.dispatch_table = self._pickler.dispatch_table
+        pickler.dump((topic_name, schema_id, values))
+        raw_buffers = [buffer.raw() for buffer in out_of_band_buffers]
+        return b"".join([_RECORD_HEADER.pack(RECORD_MAGIC, RECORD_ENCODING_VERSION, len(raw_buffers)),
+                         struct.pack(f"<{len(raw_buffers)}I", *[len(raw_buffer) for raw_buffer in raw_buffers]),
+                         body.getbuffer(), *raw_buffers])
+
+    def decode(self, record: memoryview) -> Tuple[str, Any]:
+        """
+        Returns the (topic name, topic object) of a single record, whether it's a compact record or a generic pickle
+        The record is only read from, so it can be a view straight into the mapped segment file
+        """
+        if not self.is_compact(record):
+            (topic_name, topic_obj), = pickle.loads(record).items()
+            return topic_name, topic_obj
+
+        magic, version, buffer_count = _RECORD_HEADER.unpack_from(record)
+        if version != RECORD_ENCODING_VERSION:
+            raise Exception(f"Unknown topic record encoding version '{version}'")
+
+        if not buffer_count:
+            with record[_RECORD_HEADER.size:] as body:
+                topic_name, schema_id, values = pickle.loads(body)
+        else:
+            # Out-of-band buffers sit at the end of the record, in order
+            buffer_lengths = struct.unpack_from(f"<{buffer_count}I", record, _RECORD_HEADER.size)
+            buffers_start = len(record) - sum(buffer_lengths)
+            out_of_band_buffers = []
+            position = buffers_start
+            for buffer_length in buffer_lengths:
+                out_of_band_buffers.append(record[position:position + buffer_length])
+                position += buffer_length
+            try:
+                with record[_RECORD_HEADER.size + 4 * buffer_count:buffers_start] as body:
+                    topic_name, schema_id, values = pickle.loads(body, buffers=out_of_band_buffers)
+                values = [str(value, "utf-8") if type(value) is memoryview else value for value in values]
+            finally:
+                for buffer in out_of_band_buffers:
+                    buffer.release()
+
+        topic_type, attribute_names = self._schema_class(schema_id)
+        topic_obj = topic_type.__new__(topic_type)
+        topic_obj.__dict__.update(zip(attribute_names, values))
+        return topic_name, topic_obj
+
+    def generic_record(self, record: memoryview) -> bytes:
+        """
+        Returns a record as the generic pickle of a {topic_name: topic_obj} dict (i.e. for builds that predate compact records)
+        """
+        if not self.is_compact(record):
+            return bytes(record)
+        return pickle.dumps(dict([self.decode(record)]), pickle.DEFAULT_PROTOCOL)
+
+    def _schema_id(self, topic_obj) -> int:
+        topic_type = type(topic_obj)
+        dispatch_table = self._dispatch_tables.get(topic_type)
+        if dispatch_table is None:
+            dispatch_table = self._dispatch_tables[topic_type] = {**copyreg.dispatch_table, topic_type: _reject_topic_reference} \
+                if _is_plain_type(topic_type) else False
+        if dispatch_table is False or not hasattr(topic_obj, "__dict__"):
+            return None
+
+        schema = (topic_type.__module__, topic_type.__qualname__, tuple(topic_obj.__dict__))
+        schema_id = self._schema_ids.get(schema)
+        if schema_id is None:
+            schema_id = self._schema_ids[schema] = len(self._schemas)
+            self._schemas.append(schema)
+        return schema_id
+
+    def _schema_class(self, schema_id: int) -> Tuple[type, Tuple[str, ...]]:
+        schema_class = self._schema_classes.get(schema_id)
+        if schema_class is None:
+            module_name, qualname, attribute_names = self._schemas[schema_id]
+            topic_type = importlib.import_module(module_name)
+            for name in qualname.split("."):
+                topic_type = getattr(topic_type, name)
+            schema_class = self._schema_classes[schema_id] = (topic_type, tuple(map(sys.intern, attribute_names)))
+        return schema_class